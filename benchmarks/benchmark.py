@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import numpy
+import shutil
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PoissonProcess, PeriodicPoissonProcess, SpectralPoissonProcess
+from spectral_popp import reconstruct_signal, Metrics, add_listener
+from spectral_popp.dataset.loader import get_dataset
+
+
+# Benchmarks of the hot paths of the package: updating, retrieving, Fourier
+# fitting and storing/retrieving the processes. Each benchmark runs in its own
+# process, so its peak memory (maximum resident set size) is not mixed up
+# with the others, and the library output is discarded. The stage timings
+# and counters of the package (see spectral_popp.process.instrument) are
+# reported with each benchmark. The results are written as JSON so runs on
+# different commits can be compared.
+
+
+# ground truth activity of all regions of the Birmingham dataset, as
+# (timestamps, counts)
+def birmingham_data():
+    path = os.path.join("/".join(source_path.split("/")[:-1]), "data")
+    dataset = get_dataset(path)
+    timestamps, counts = list(), list()
+    for _, region_timestamps, region_counts in dataset.stream_counts(
+        [("present_activity", 1), ("absent_activity", 0)], 0, 2**40
+    ):
+        timestamps.append(region_timestamps)
+        counts.append(region_counts)
+    return numpy.concatenate(timestamps), numpy.concatenate(counts)
+
+
+# synthetic counts for @days days of @increment second increments, drawn from
+# a Poisson process whose rate follows a daily pattern
+def synthetic_data(days, increment, seed=0):
+    random = numpy.random.RandomState(seed)
+    timestamps = numpy.arange(1502668800, 1502668800 + days*86400, increment)
+    hours = (timestamps % 86400) / 3600.0
+    rates = 0.25 + (0.15 * numpy.sin(2.0 * numpy.pi * hours / 24.0)) + (
+        0.05 * numpy.cos(2.0 * numpy.pi * hours / 8.0)
+    )
+    return timestamps, random.poisson(rates * increment / 60.0)
+
+
+# Each benchmark takes the data (timestamps, counts), the configuration and
+# a temporary folder, and returns the number of items it processed
+
+
+def bench_update(data, config, path):
+    process = PoissonProcess(config["increment"], path_to_db=path)
+    process.update(dict(zip(data[0].tolist(), data[1].tolist())))
+    return len(data[0])
+
+
+def bench_update_batch(data, config, path):
+    process = PoissonProcess(config["increment"], path_to_db=path)
+    process.update_batch(data[0], data[1])
+    return len(data[0])
+
+
+def bench_retrieve(data, config, path):
+    process = PeriodicPoissonProcess(config["increment"], 86400, path_to_db=path)
+    process.update_batch(data[0], data[1])
+    for _ in range(config["repeat"]):
+        process.retrieve(0, 86400)
+        process.retrieve(0, 86400, upper_bound=True)
+    return 2 * config["repeat"] * (86400 // config["increment"])
+
+
+def bench_fourier_transform(data, config, path):
+    process = SpectralPoissonProcess(
+        config["increment"], 86400, path_to_db=path, lazy=True
+    )
+    process.update_batch(data[0], data[1])
+    for _ in range(config["repeat"]):
+        process.fourier_transform()
+    return config["repeat"]
+
+
+def bench_reconstruct_laam(data, config, path):
+    signal = _daily_signal(data, config, path)
+    for _ in range(config["repeat"]):
+        reconstruct_signal(numpy.copy(signal), addition_method=True)
+    return config["repeat"]
+
+
+def bench_reconstruct_lbam(data, config, path):
+    signal = _daily_signal(data, config, path)
+    for _ in range(config["repeat"]):
+        reconstruct_signal(numpy.copy(signal), addition_method=False)
+    return config["repeat"]
+
+
+def bench_db_round_trip(data, config, path):
+    process = PeriodicPoissonProcess(config["increment"], 86400, path_to_db=path)
+    process.update_batch(data[0], data[1])
+    for _ in range(config["repeat"]):
+        process.store_to_db(compact=True)
+        PeriodicPoissonProcess(
+            config["increment"], 86400, path_to_db=path
+        ).retrieve_from_db()
+    return config["repeat"]
+
+
+# the mean rate of the data over a day (the signal transformed by
+# SpectralPoissonProcess), using the temporary folder @path
+def _daily_signal(data, config, path):
+    process = PeriodicPoissonProcess(config["increment"], 86400, path_to_db=path)
+    process.update_batch(data[0], data[1])
+    return process.retrieve_full_periodic_array("mean")[1]
+
+
+BENCHMARKS = [
+    ("update", bench_update),
+    ("update_batch", bench_update_batch),
+    ("retrieve", bench_retrieve),
+    ("fourier_transform", bench_fourier_transform),
+    ("reconstruct_signal_laam", bench_reconstruct_laam),
+    ("reconstruct_signal_lbam", bench_reconstruct_lbam),
+    ("db_round_trip", bench_db_round_trip),
+]
+
+
+# run @benchmark on the data of @source in this (child) process and put the
+# result into @queue
+def _run(benchmark, source, config, queue):
+    sys.stdout = open(os.devnull, "w")
+    path = tempfile.mkdtemp()
+    try:
+        if source == "birmingham":
+            data = birmingham_data()
+        else:
+            data = synthetic_data(config["days"], config["increment"])
+        metrics = Metrics()
+        add_listener(metrics)
+        start = time.time()
+        items = benchmark(data, config, path)
+        seconds = time.time() - start
+    except Exception as error:
+        queue.put({"error": repr(error)})
+        raise
+    finally:
+        shutil.rmtree(path)
+    # maximum resident set size, in kilobytes on linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        "items": items, "seconds": seconds,
+        "throughput": items / seconds if seconds > 0 else None,
+        "peak_memory_kb": peak, "metrics": metrics.summary()
+    })
+
+
+# the result which @worker put into @queue, or an error if the worker died
+# (e.g. killed out of memory) without putting any
+def _result(worker, queue):
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if worker.is_alive():
+                continue
+        # the result may arrive just after the worker exited
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            return {"error": "the benchmark process exited with code %s" % (
+                worker.exitcode
+            )}
+
+
+# run the benchmarks whose name contains one of @names (all if empty) on the
+# data @sources, each in its own process
+def run_benchmarks(sources, config, names=None):
+    results = list()
+    for source in sources:
+        for name, benchmark in BENCHMARKS:
+            if names and not any(n in name for n in names):
+                continue
+            queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(
+                target=_run, args=(benchmark, source, config, queue)
+            )
+            worker.start()
+            result = _result(worker, queue)
+            worker.join()
+            result.update({"name": name, "data": source})
+            results.append(result)
+            if "error" in result:
+                sys.stderr.write("%s on %s failed: %s\n" % (
+                    name, source, result["error"]
+                ))
+            else:
+                sys.stderr.write("%s on %s: %.3f seconds\n" % (
+                    name, source, result["seconds"]
+                ))
+    return results
+
+
+# the commit of the repository being benchmarked, None outside of git
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=source_path,
+            stderr=open(os.devnull, "w")
+        ).strip().decode("utf-8")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="benchmark")
+    parser.add_argument(
+        "-d", dest="data", default="birmingham,synthetic",
+        help="Comma separated data to run the benchmarks on, birmingham and/or synthetic. Default is both"
+    )
+    parser.add_argument(
+        "-i", dest="time_increment", default="60",
+        help="Incremental time (in seconds). Default is 60 seconds"
+    )
+    parser.add_argument(
+        "-n", dest="days", default="365",
+        help="Number of days of synthetic data. Default is 365 days"
+    )
+    parser.add_argument(
+        "-r", dest="repeat", default="5",
+        help="Number of repetitions of the retrieve, fourier and db benchmarks. Default is 5"
+    )
+    parser.add_argument(
+        "-b", dest="benchmarks", default="",
+        help="Comma separated names (or parts of names) of the benchmarks to run. Default is all"
+    )
+    parser.add_argument(
+        "-o", dest="output", default="",
+        help="JSON file to write the results to. Default is the standard output"
+    )
+    args = parser.parse_args()
+    config = {
+        "increment": int(args.time_increment), "days": int(args.days),
+        "repeat": int(args.repeat)
+    }
+    report = {
+        "commit": current_commit(), "python": platform.python_version(),
+        "numpy": numpy.__version__, "platform": platform.platform(),
+        "time": int(time.time()), "config": config,
+        "results": run_benchmarks(
+            [source for source in args.data.split(",") if source], config,
+            [name for name in args.benchmarks.split(",") if name]
+        )
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
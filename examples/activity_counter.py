@@ -4,6 +4,7 @@ import os
 import sys
 import yaml
 import time
+import logging
 import numpy
 import datetime
 import argparse
@@ -14,7 +15,11 @@ sys.path.append(os.path.join(
     "/".join(source_path.split("/")[:-1]), "src"
 ))
 
-from spectral_popp import PeriodicPoissonProcess, SpectralPoissonProcess
+from spectral_popp import PeriodicPoissonProcess, SpectralPoissonProcess, fourier_transform_all
+from spectral_popp import RegionGroups
+from spectral_popp.process.parallel import ParallelEngine
+from spectral_popp.dataset.loader import get_dataset
+from spectral_popp.dataset.stream import collect_batches
 
 
 # Activity counter / process takes ground truth activity to build a
@@ -29,20 +34,27 @@ class ActivityCounter(object):
     # @periodic_cycle is the periodicity imposed to the Poisson process
     # @spectral_model is the option to go with periodic Poisson model or
     # Spectral-Poisson model.
+    # @workers is the number of worker processes updating, fitting, storing
+    # and retrieving the processes of the regions in parallel.
     def __init__(
-        self, increment=60, periodic_cycle=1440*60, spectral_model=False
+        self, increment=60, periodic_cycle=1440*60, spectral_model=False,
+        workers=1
     ):
         print "Activity process has %d second increment with %d periodic cycle..." % (
             increment, periodic_cycle
         )
         self.time_increment = increment
+        self.spectral_model = spectral_model
+        self.engine = ParallelEngine(workers)
         path = os.path.join("/".join(source_path.split("/")[:-1]), "data")
         regions = yaml.load(open(path+"/regions.yaml", "r"))
+        # the dataset is parsed once and shared by all counters
+        self.dataset = get_dataset(path)
         print "Process are built for %d regions" % len(regions)
         if spectral_model:
             self.process = {
                 str(region): SpectralPoissonProcess(
-                    increment, periodic_cycle,
+                    increment, periodic_cycle, lazy=True,
                     path_to_db=os.path.join(
                         "/".join(source_path.split("/")[:-1]),
                         "db/%s/activity" % region
@@ -59,32 +71,41 @@ class ActivityCounter(object):
                     )
                 ) for region in regions
             }
+        # sums of the rates of groups of regions, the whole floor to start
+        # with, other zones can be added with self.zones.add_group
+        self.zones = RegionGroups(self.process, {"floor": sorted(self.process)})
 
     # retrieve stored rates to construct the activity poisson process
     def retrieve_from_db(self):
         print("Retrieving activity process from db folder. It may take a while...")
-        for region in self.process:
-            print "Region", region
-            self.process[region].retrieve_from_db()
+        self.engine.retrieve_from_db(self.process)
+        self.fit_spectral_models()
+
+    # fit the spectral models of all regions, either at once in this process
+    # or in parallel by the worker processes
+    def fit_spectral_models(self):
+        if not self.spectral_model:
+            return
+        if self.engine.is_parallel():
+            self.engine.fourier_transform(self.process)
+        else:
+            fourier_transform_all(self.process)
+
+    # stream ground truth activity (present and absent) from the dataset as
+    # (region, timestamps, counts) batches ordered by time
+    def stream_activity_data(self, start_time, end_time):
+        return self.dataset.stream_counts(
+            [("present_activity", 1), ("absent_activity", 0)],
+            start_time, end_time
+        )
 
     # get ground truth activity (present and absent) from files
     def get_activity_data(self, start_time, end_time):
-        path = os.path.join("/".join(source_path.split("/")[:-1]), "data")
-        present_activity = yaml.load(open(path+"/present_activity.yaml", "r"))
-        region_activity = {region: dict() for region in present_activity.keys()}
-        # getting all present activity from activity yaml file
-        for region in present_activity.keys():
-            region_activity[region] = {
-                timestamp: 1 for timestamp in present_activity[region] if timestamp >= start_time and timestamp < end_time
-            }
-        # getting all absent activity from absent activity yaml file
-        absent_activity = yaml.load(open(path+"/absent_activity.yaml", "r"))
-        for region in absent_activity.keys():
-            if region not in region_activity:
-                region_activity[region] = dict()
-            region_activity[region].update({
-                timestamp: 0 for timestamp in absent_activity[region] if timestamp >= start_time and timestamp < end_time
-            })
+        region_activity = dict()
+        for region, timestamps, counts in self.stream_activity_data(start_time, end_time):
+            region_activity.setdefault(region, dict()).update(
+                zip(timestamps.tolist(), counts.tolist())
+            )
         return region_activity
 
     # Estimate the rate function using activity count data from @start_time to @end_time
@@ -96,11 +117,16 @@ class ActivityCounter(object):
                 datetime.datetime.fromtimestamp(end_time)
             )
         )
-        activity_count = self.get_activity_data(start_time, end_time)
-        for region in self.process:
-            print "Region", region
-            self.process[region].update(activity_count[region])
-            self.process[region].store_to_db()
+        batches = self.stream_activity_data(start_time, end_time)
+        if self.engine.is_parallel():
+            # the data of all regions are sent to the workers at once
+            self.engine.update(self.process, collect_batches(batches))
+        else:
+            for region, timestamps, counts in batches:
+                if region in self.process:
+                    self.process[region].update_batch(timestamps, counts)
+        self.engine.store_to_db(self.process)
+        self.fit_spectral_models()
 
     # Plot arrival rate of the Poisson as a function of time. Point estimates
     # are used. Upper bound is shown
@@ -109,17 +135,14 @@ class ActivityCounter(object):
             name = "Periodic Poisson Process"
         else:
             name = "Spectral-Poisson Process"
-        # @mean, @upper become time series data. However they are somehow not
-        # timely ordered. Sorting is needed
-        mean = self.process[region].retrieve_full_periodic(mean=True)
-        upper = self.process[region].retrieve_full_periodic(upper_bound=True)
-        ordered_mean = list()
-        ordered_upper = list()
-        for key in sorted(mean.keys()):
-            ordered_mean.append(mean[key])
-            ordered_upper.append(upper[key])
-
-        x = numpy.arange(len(mean))
+        # the mean and the upper bound over a cycle, in time order
+        _, rates = self.process[region].retrieve_full_periodic_array(
+            ["mean", "upper"]
+        )
+        ordered_mean = rates["mean"]
+        ordered_upper = rates["upper"]
+
+        x = numpy.arange(len(ordered_mean))
         line = pyplot.plot(x, ordered_mean, "-", color="r", label="Mean")
         pyplot.setp(line, linewidth=3)
         line = pyplot.plot(x, ordered_upper, "--", color="b", label="Upper Bound")
@@ -134,7 +157,7 @@ class ActivityCounter(object):
         pyplot.xlim(xmax=len(x))
         pyplot.ylabel("Arrival Rate", fontsize=25)
         pyplot.yticks(fontsize=15)
-        pyplot.ylim(ymax=max(upper.values())+0.2, ymin=0)
+        pyplot.ylim(ymax=max(ordered_upper)+0.2, ymin=0)
         pyplot.legend(prop={'size': 25}, loc='best')
         pyplot.show()
 
@@ -157,9 +180,15 @@ if __name__ == '__main__':
         "-m", dest="model", default="0",
         help="Periodic Poisson process (0) or Spectral-Poisson process (1)"
     )
+    parser.add_argument(
+        "-w", dest="workers", default="1",
+        help="Number of worker processes learning and loading the regions in parallel. Default is 1"
+    )
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     ac = ActivityCounter(
-        int(args.time_increment), int(args.periodic_cycle), spectral_model=bool(int(args.model))
+        int(args.time_increment), int(args.periodic_cycle),
+        spectral_model=bool(int(args.model)), workers=int(args.workers)
     )
     ac.retrieve_from_db()
     if int(args.learn):
@@ -4,6 +4,7 @@ import os
 import sys
 import yaml
 import time
+import logging
 import numpy
 import datetime
 import argparse
@@ -14,7 +15,12 @@ sys.path.append(os.path.join(
     "/".join(source_path.split("/")[:-1]), "src"
 ))
 
-from spectral_popp import PeriodicPoissonProcess, SpectralPoissonProcess
+from spectral_popp import PeriodicPoissonProcess, SpectralPoissonProcess, fourier_transform_all
+from spectral_popp import RegionGroups
+from spectral_popp.process.parallel import ParallelEngine
+from spectral_popp.dataset.loader import get_dataset
+from spectral_popp.dataset.stream import isin_sorted, collect_batches
+from spectral_popp.process.reliability import DetectorReliability
 
 
 # Detection counter / process takes sensor data (leg, upper_body, or scene) to build a
@@ -24,74 +30,129 @@ class DetectionCounter(object):
 
     global source_path
 
+    # the detector files, whose detections tell which regions the robot sees
+    # from each waypoint
+    DETECTORS = ["leg", "upper_body", "scene"]
+
     # @counter_type is the file name (leg, upper_body, scene) without ".yaml"
     # @increment is smallest interval (in seconds) where only one event happening is
     # allowed. For each minute increment, it is expected to have a rate (class Rate)
     # @periodic_cycle is the periodicity imposed to the Poisson process
     # @spectral_model is the option to go with periodic Poisson model or
     # Spectral-Poisson model.
+    # @workers is the number of worker processes updating, fitting, storing
+    # and retrieving the processes of the regions in parallel.
     def __init__(
-        self, counter_type, increment=60, periodic_cycle=1440*60, spectral_model=False
+        self, counter_type, increment=60, periodic_cycle=1440*60,
+        spectral_model=False, workers=1
     ):
         print "%s process has %d second increment with %d periodic cycle..." % (
             counter_type, increment, periodic_cycle
         )
         self.counter_type = counter_type
         self.time_increment = increment
+        self.spectral_model = spectral_model
+        self.engine = ParallelEngine(workers)
         path = os.path.join("/".join(source_path.split("/")[:-1]), "data")
         regions = yaml.load(open(path+"/regions.yaml", "r"))
+        # the dataset is parsed once and shared by all counters
+        self.dataset = get_dataset(path)
+        # sensitivity and specificity of the detectors per region and hour of
+        # the cycle, learnt along with the processes
+        self.reliability = DetectorReliability(periodic_cycle, 3600)
+        self._path_to_reliability = os.path.join(
+            "/".join(source_path.split("/")[:-1]),
+            "db/%s_reliability.npz" % counter_type
+        )
         print "Process are built for %d regions" % len(regions)
-        if spectral_model:
-            self.process = {
+        self.process = self._build_processes(regions, counter_type, periodic_cycle)
+        # processes of the activity estimated from the detections of
+        # @counter_type detectors (see learn_partially_observed), kept apart
+        # from the processes of the detections themselves
+        self.activity = self._build_processes(
+            regions, "activity_from_%s" % counter_type, periodic_cycle
+        )
+        # sums of the rates of groups of regions, the whole floor to start
+        # with, other zones can be added with self.zones.add_group
+        self.zones = RegionGroups(self.process, {"floor": sorted(self.process)})
+
+    # a process for each of @regions stored in folder "db/<region>/@name"
+    def _build_processes(self, regions, name, periodic_cycle):
+        if self.spectral_model:
+            return {
                 str(region): SpectralPoissonProcess(
-                    increment, periodic_cycle,
-                    path_to_db=os.path.join(
-                        "/".join(source_path.split("/")[:-1]),
-                        "db/%s/%s" % (region, counter_type)
-                    )
-                ) for region in regions
-            }
-        else:
-            self.process = {
-                str(region): PeriodicPoissonProcess(
-                    increment, periodic_cycle,
+                    self.time_increment, periodic_cycle, lazy=True,
                     path_to_db=os.path.join(
                         "/".join(source_path.split("/")[:-1]),
-                        "db/%s/%s" % (region, counter_type)
+                        "db/%s/%s" % (region, name)
                     )
                 ) for region in regions
             }
+        return {
+            str(region): PeriodicPoissonProcess(
+                self.time_increment, periodic_cycle,
+                path_to_db=os.path.join(
+                    "/".join(source_path.split("/")[:-1]),
+                    "db/%s/%s" % (region, name)
+                )
+            ) for region in regions
+        }
 
     # retrieve stored rates to construct the poisson process
     def retrieve_from_db(self):
         print(
             "Retrieving %s process from db folder. It may take a while..." % self.counter_type
         )
-        for region in self.process:
-            print "Region", region
-            self.process[region].retrieve_from_db()
+        self.engine.retrieve_from_db(self.process)
+        self.engine.retrieve_from_db(self.activity)
+        self.reliability.load(self._path_to_reliability)
+        self.fit_spectral_models()
+        self.fit_spectral_models(self.activity)
+
+    # fit the spectral models of all regions of @processes (the detection
+    # processes if None), either at once in this process or in parallel by
+    # the worker processes
+    def fit_spectral_models(self, processes=None):
+        if not self.spectral_model:
+            return
+        if processes is None:
+            processes = self.process
+        if self.engine.is_parallel():
+            self.engine.fourier_transform(processes)
+        else:
+            fourier_transform_all(processes)
+
+    # stream detection data from the dataset as (region, timestamps, counts)
+    # batches ordered by time, where counts are whether the activity (present
+    # or absent) at timestamps was detected by @self.counter_type detectors
+    def stream_detection_data(self, start_time, end_time):
+        return self.dataset.stream_counts(
+            [("present_activity", 1), ("absent_activity", 0)],
+            start_time, end_time,
+            detections=self.dataset.region_arrays(self.counter_type)
+        )
+
+    # stream labelled detection data from the dataset as (region,
+    # timestamps, labels, detections) batches ordered by time, where labels
+    # are whether the activity was present (ground truth) and detections
+    # whether @self.counter_type detectors fired
+    def stream_labelled_data(self, start_time, end_time):
+        detections = self.dataset.region_arrays(self.counter_type)
+        for region, timestamps, labels in self.dataset.stream_counts(
+            [("present_activity", 1), ("absent_activity", 0)], start_time, end_time
+        ):
+            yield region, timestamps, labels, isin_sorted(
+                detections.get(region, numpy.zeros(0, dtype=numpy.int64)),
+                timestamps
+            )
 
     # get detection data from files
     def get_detection_data(self, start_time, end_time):
-        path = os.path.join("/".join(source_path.split("/")[:-1]), "data")
-        present_activity = yaml.load(open(path+"/present_activity.yaml", "r"))
-        detections = yaml.load(open(path+"/%s.yaml" % self.counter_type, "r"))
-        region_detection = {region: dict() for region in present_activity.keys()}
-        # getting all detected and undetected activity from @self.counter_type
-        # detectors given the activity was present
-        for region in present_activity.keys():
-            for timestamp in present_activity[region]:
-                if timestamp >= start_time and timestamp < end_time:
-                    region_detection[region][timestamp] = int(timestamp in detections[region])
-        # getting all detected and undetected activity from @self.counter_type
-        # detectors given the activity was absent
-        absent_activity = yaml.load(open(path+"/absent_activity.yaml", "r"))
-        for region in absent_activity.keys():
-            if region not in region_detection:
-                region_detection[region] = dict()
-            for timestamp in absent_activity[region]:
-                if timestamp >= start_time and timestamp < end_time:
-                    region_detection[region][timestamp] = int(timestamp in detections[region])
+        region_detection = dict()
+        for region, timestamps, counts in self.stream_detection_data(start_time, end_time):
+            region_detection.setdefault(region, dict()).update(
+                zip(timestamps.tolist(), counts.tolist())
+            )
         return region_detection
 
     # Estimate the rate function using detection count data from @start_time to @end_time
@@ -104,11 +165,65 @@ class DetectionCounter(object):
                 datetime.datetime.fromtimestamp(end_time)
             )
         )
-        detection_count = self.get_detection_data(start_time, end_time)
-        for region in self.process:
-            print "Region", region
-            self.process[region].update(detection_count[region])
-            self.process[region].store_to_db()
+        batches = self.stream_labelled_data(start_time, end_time)
+        if self.engine.is_parallel():
+            # the data of all regions are sent to the workers at once
+            data = collect_batches(batches)
+            for region, (timestamps, labels, detections) in data.items():
+                self.reliability.update(region, timestamps, labels, detections)
+            self.engine.update(self.process, dict(
+                (region, (timestamps, detections))
+                for region, (timestamps, labels, detections) in data.items()
+            ))
+        else:
+            for region, timestamps, labels, detections in batches:
+                self.reliability.update(region, timestamps, labels, detections)
+                if region in self.process:
+                    self.process[region].update_batch(timestamps, detections)
+        self.engine.store_to_db(self.process)
+        self.reliability.save(self._path_to_reliability)
+        self.fit_spectral_models()
+
+    # Estimate the rate function of activity (not of detections) from the
+    # detections of @self.counter_type detectors from @start_time to
+    # @end_time, treating the detectors as noisy observers of the activity
+    # with true positive rate @tpr and false positive rate @fpr, or with the
+    # rates learnt per region and hour (see @self.reliability) if they are
+    # not given. Only the minutes where the robot observed a region
+    # (according to observation_history.yaml, see
+    # Dataset.region_observations) are used, a minute without any detection
+    # counts as not detected. No ground truth label is read. The estimates
+    # are kept in @self.activity.
+    def learn_partially_observed(self, start_time, end_time, tpr=None, fpr=None):
+        print(
+            "Estimating activity processes from %s detections for each region from %s to %s" % (
+                self.counter_type,
+                datetime.datetime.fromtimestamp(start_time),
+                datetime.datetime.fromtimestamp(end_time)
+            )
+        )
+        observed = self.dataset.region_observations(
+            DetectionCounter.DETECTORS, start_time, end_time
+        )
+        detections = self.dataset.region_arrays(self.counter_type)
+        arguments = dict()
+        for region, timestamps in observed.items():
+            if region not in self.activity:
+                continue
+            rates = self.reliability.rates(region, timestamps)
+            arguments[region] = (
+                timestamps, isin_sorted(
+                    detections.get(region, numpy.zeros(0, dtype=numpy.int64)),
+                    timestamps
+                ),
+                rates[0] if tpr is None else tpr,
+                rates[1] if fpr is None else fpr
+            )
+        processes = dict((region, self.activity[region]) for region in arguments)
+        self.engine.run(processes, "update_partially_observed", arguments)
+        self.activity.update(processes)
+        self.engine.store_to_db(self.activity)
+        self.fit_spectral_models(self.activity)
 
     # Plot arrival rate of the Poisson as a function of time. Point estimates
     # are used. Upper bound is shown
@@ -117,15 +232,14 @@ class DetectionCounter(object):
             name = "Periodic Poisson Process for %s detections" % self.counter_type
         else:
             name = "Spectral-Poisson Process for %s detections" % self.counter_type
-        mean = self.process[region].retrieve_full_periodic(mean=True)
-        upper = self.process[region].retrieve_full_periodic(upper_bound=True)
-        ordered_mean = list()
-        ordered_upper = list()
-        for key in sorted(mean.keys()):
-            ordered_mean.append(mean[key])
-            ordered_upper.append(upper[key])
-
-        x = numpy.arange(len(mean))
+        # the mean and the upper bound over a cycle, in time order
+        _, rates = self.process[region].retrieve_full_periodic_array(
+            ["mean", "upper"]
+        )
+        ordered_mean = rates["mean"]
+        ordered_upper = rates["upper"]
+
+        x = numpy.arange(len(ordered_mean))
         line = pyplot.plot(x, ordered_mean, "-", color="r", label="Mean")
         pyplot.setp(line, linewidth=3)
         line = pyplot.plot(x, ordered_upper, "--", color="b", label="Upper Bound")
@@ -140,7 +254,7 @@ class DetectionCounter(object):
         pyplot.xlim(xmax=len(x))
         pyplot.ylabel("Arrival Rate", fontsize=25)
         pyplot.yticks(fontsize=15)
-        pyplot.ylim(ymax=max(upper.values())+0.2, ymin=0)
+        pyplot.ylim(ymax=max(ordered_upper)+0.2, ymin=0)
         pyplot.legend(prop={'size': 25}, loc='best')
         pyplot.show()
 
@@ -163,20 +277,40 @@ if __name__ == '__main__':
         "-m", dest="model", default="0",
         help="Periodic Poisson process (0) or Spectral-Poisson process (1)"
     )
+    parser.add_argument(
+        "-p", dest="partially_observed", default="0",
+        help="Learning from the ground truth (0) or from the detections as partially observed activity (1)"
+    )
+    parser.add_argument(
+        "-t", dest="tpr", default="",
+        help="True positive rate of the detectors for -p 1. Default is the learnt rate per region and hour"
+    )
+    parser.add_argument(
+        "-f", dest="fpr", default="",
+        help="False positive rate of the detectors for -p 1. Default is the learnt rate per region and hour"
+    )
+    parser.add_argument(
+        "-w", dest="workers", default="1",
+        help="Number of worker processes learning and loading the regions in parallel. Default is 1"
+    )
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     scene = DetectionCounter(
         "scene", int(args.time_increment),
-        int(args.periodic_cycle), spectral_model=bool(int(args.model))
+        int(args.periodic_cycle), spectral_model=bool(int(args.model)),
+        workers=int(args.workers)
     )
     scene.retrieve_from_db()
     leg = DetectionCounter(
         "leg", int(args.time_increment),
-        int(args.periodic_cycle), spectral_model=bool(int(args.model))
+        int(args.periodic_cycle), spectral_model=bool(int(args.model)),
+        workers=int(args.workers)
     )
     leg.retrieve_from_db()
     upper_body = DetectionCounter(
         "upper_body", int(args.time_increment),
-        int(args.periodic_cycle), spectral_model=bool(int(args.model))
+        int(args.periodic_cycle), spectral_model=bool(int(args.model)),
+        workers=int(args.workers)
     )
     upper_body.retrieve_from_db()
     if int(args.learn):
@@ -194,9 +328,15 @@ if __name__ == '__main__':
             int(end_time[3]), int(end_time[4])
         )
         end_time = int(time.mktime(end_time.timetuple()))
-        scene.learn(start_time, end_time)
-        leg.learn(start_time, end_time)
-        upper_body.learn(start_time, end_time)
+        for counter in [scene, leg, upper_body]:
+            if int(args.partially_observed):
+                counter.learn_partially_observed(
+                    start_time, end_time,
+                    float(args.tpr) if args.tpr else None,
+                    float(args.fpr) if args.fpr else None
+                )
+            else:
+                counter.learn(start_time, end_time)
     else:
         region = raw_input("Choose Regions %s: " % str(scene.process.keys()))
         scene.plot_per_region(region)
@@ -1,5 +1,19 @@
 #!/usr/bin/env python
 
-from process.rate import Rate
-from process.fourier import rectify_signal, reconstruct_signal
+import logging
+from process.rate import Rate, FrozenRate
+from process.store import RateStore
+from process.table import RateTable
+from process.interval import IntervalTable
+from process.pyramid import RatePyramid
+from process.groups import RegionGroups
+from process.spectral import SpectralModel
+from process.fourier import rectify_signal, reconstruct_signal, reconstruct_signals
 from process.processes import PoissonProcess, PeriodicPoissonProcess, SpectralPoissonProcess
+from process.processes import fourier_transform_all
+from process.collection import ProcessCollection
+from process.snapshot import PoissonSnapshot, compile_snapshot
+from process.instrument import Listener, Metrics, add_listener, remove_listener
+
+# the package only logs, the application decides where the records go
+logging.getLogger(__name__).addHandler(logging.NullHandler())
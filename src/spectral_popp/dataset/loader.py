@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+import os
+import yaml
+import logging
+import hashlib
+import numpy as np
+from stream import iter_region_chunks, _Loader, _region_batches
+
+_logger = logging.getLogger(__name__)
+
+# version of the cache files, a cache file of another version is rebuilt
+CACHE_VERSION = 1
+# loaded datasets, {path: Dataset}, see get_dataset
+_datasets = dict()
+
+
+# get the dataset (class Dataset) of the data folder at @path. The dataset
+# is loaded once and shared by all its users (e.g. all counters).
+def get_dataset(path):
+    path = os.path.abspath(path)
+    if path not in _datasets:
+        _datasets[path] = Dataset(path)
+    return _datasets[path]
+
+
+# Dataset stored as yaml files in a data folder, e.g. the University of
+# Birmingham dataset in folder "data". Each file is parsed once and kept as
+# compact integer arrays: the files of {region: [timestamp, ...]}
+# (present_activity.yaml, absent_activity.yaml and the detector files) as
+# the sorted timestamps of all regions in one array with the offset of each
+# region, and observation_history.yaml ({timestamp: waypoint}) as sorted
+# timestamps with the index of their waypoint.
+# The arrays are cached in a binary file next to the yaml files (in folder
+# ".cache"), which is rebuilt once the modification time and the size of the
+# yaml file change, unless its content (SHA-1) is still the same.
+class Dataset(object):
+
+    def __init__(self, path):
+        self.path = path
+        self._cache_path = os.path.join(path, ".cache")
+        # loaded files, {name: {array name: array}}
+        self._tables = dict()
+
+    # names of the regions in the file @name (without ".yaml")
+    def regions(self, name):
+        return [str(region) for region in self._table(name)["regions"]]
+
+    # sorted timestamps of @region in the file @name (without ".yaml") from
+    # @start_time to @end_time. The range is found with a binary search and
+    # the returned array is a view of the cached array.
+    def timestamps(self, name, region, start_time=None, end_time=None):
+        table = self._table(name)
+        regions = self.regions(name)
+        if str(region) not in regions:
+            return np.zeros(0, dtype=np.int64)
+        ind = regions.index(str(region))
+        timestamps = table["timestamps"][table["offsets"][ind]:table["offsets"][ind+1]]
+        return timestamps[_range(timestamps, start_time, end_time)]
+
+    # {region: sorted timestamps} of the file @name (without ".yaml"), see
+    # stream.load_region_arrays
+    def region_arrays(self, name):
+        return dict(
+            (region, self.timestamps(name, region)) for region in self.regions(name)
+        )
+
+    # the observations of observation_history.yaml from @start_time to
+    # @end_time, as the sorted timestamps and the waypoint observed at each
+    def observations(self, start_time=None, end_time=None):
+        table = self._table("observation_history")
+        indices = _range(table["timestamps"], start_time, end_time)
+        waypoints = np.array([str(waypoint) for waypoint in table["waypoints"]])
+        return table["timestamps"][indices], waypoints[table["codes"][indices]]
+
+    # the regions seen from each waypoint of observation_history.yaml,
+    # {waypoint: sorted regions}. A region is seen from a waypoint if one of
+    # its timestamps in the files @names (without ".yaml", e.g. the detector
+    # files) was observed from the waypoint.
+    def waypoint_regions(self, names):
+        timestamps, waypoints = self.observations()
+        seen = dict()
+        for name in names:
+            for region in self.regions(name):
+                found = self.timestamps(name, region)
+                indices = np.searchsorted(timestamps, found)
+                indices = indices[indices < len(timestamps)]
+                indices = indices[timestamps[indices] == found[0:len(indices)]]
+                for waypoint in np.unique(waypoints[indices]).tolist():
+                    seen.setdefault(str(waypoint), set()).add(region)
+        return dict((waypoint, sorted(regions)) for waypoint, regions in seen.items())
+
+    # {region: sorted timestamps} of the observations of observation_history.yaml
+    # from @start_time to @end_time made from a waypoint which sees the region
+    # (see waypoint_regions for @names), i.e. when the robot observed the region
+    def region_observations(self, names, start_time=None, end_time=None):
+        timestamps, waypoints = self.observations(start_time, end_time)
+        observed = dict()
+        for waypoint, regions in self.waypoint_regions(names).items():
+            for region in regions:
+                observed.setdefault(region, list()).append(
+                    timestamps[waypoints == waypoint]
+                )
+        return dict(
+            (region, np.unique(np.concatenate(arrays)))
+            for region, arrays in observed.items()
+        )
+
+    # stream (region, start_times, counts) batches of observations from the
+    # files of {region: [timestamp, ...]}. @sources is a list of (name, count)
+    # where each timestamp in the file name (without ".yaml") was observed
+    # with count, e.g. [("present_activity", 1), ("absent_activity", 0)]. A
+    # timestamp in more than one file is observed once, with the count of the
+    # last file. @detections ({region: sorted timestamps}, see
+    # stream.load_region_arrays) is the option to count whether each
+    # timestamp was detected instead. Only timestamps from @start_time to
+    # @end_time are kept. The observations of a region are ordered by time
+    # and split into batches of at most @chunk_size observations, which can
+    # be fed to the update_batch method of the process of the region.
+    def stream_counts(
+        self, sources, start_time, end_time, detections=None, chunk_size=4096
+    ):
+        regions = list()
+        for name, _ in sources:
+            regions.extend(
+                region for region in self.regions(name) if region not in regions
+            )
+        counts = [count for _, count in sources]
+        for region in sorted(regions):
+            observations = dict(
+                (ind, self.timestamps(name, region, start_time, end_time))
+                for ind, (name, _) in enumerate(sources)
+            )
+            for batch in _region_batches(
+                region, observations, counts, detections, chunk_size
+            ):
+                yield batch
+
+    # the arrays of the file @name (without ".yaml"), from the cache if it
+    # is up to date
+    def _table(self, name):
+        if name not in self._tables:
+            path = os.path.join(self.path, name + ".yaml")
+            cache = os.path.join(self._cache_path, name + ".npz")
+            table = _read_cache(cache, path)
+            if table is None:
+                if name == "observation_history":
+                    table = _parse_observations(path)
+                else:
+                    table = _parse_regions(path)
+                _write_cache(cache, path, table)
+            self._tables[name] = table
+        return self._tables[name]
+
+
+# indices of the sorted @timestamps from @start_time to @end_time
+def _range(timestamps, start_time=None, end_time=None):
+    start = 0
+    end = len(timestamps)
+    if start_time is not None:
+        start = np.searchsorted(timestamps, start_time, side="left")
+    if end_time is not None:
+        end = np.searchsorted(timestamps, end_time, side="left")
+    return slice(start, max(start, end))
+
+
+# parse a yaml file of {region: [timestamp, ...]} into the arrays of the
+# regions, their offsets and their (sorted) timestamps
+def _parse_regions(path):
+    chunks = dict()
+    for region, timestamps in iter_region_chunks(path):
+        chunks.setdefault(region, list()).append(timestamps)
+    regions = sorted(chunks.keys())
+    timestamps = [np.sort(np.concatenate(chunks[region])) for region in regions]
+    return {
+        "regions": np.array(regions, dtype=np.unicode_),
+        "offsets": np.cumsum([0] + [len(values) for values in timestamps]),
+        "timestamps": np.concatenate(
+            timestamps + [np.zeros(0, dtype=np.int64)]
+        ).astype(np.int64)
+    }
+
+
+# parse observation_history.yaml ({timestamp: waypoint}) into the arrays of
+# the waypoints, the sorted timestamps and the waypoint index of each
+def _parse_observations(path):
+    with open(path, "r") as f:
+        history = yaml.load(f, Loader=_Loader)
+    timestamps = np.array(sorted(history.keys()), dtype=np.int64)
+    waypoints = sorted(set(history.values()))
+    codes = dict((waypoint, ind) for ind, waypoint in enumerate(waypoints))
+    return {
+        "waypoints": np.array(waypoints, dtype=np.unicode_),
+        "timestamps": timestamps,
+        "codes": np.array(
+            [codes[history[timestamp]] for timestamp in timestamps.tolist()],
+            dtype=np.int32
+        )
+    }
+
+
+# SHA-1 of the content of the file at @path
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# the arrays in the cache file @cache of the yaml file at @path, None if
+# there is no cache or it is out of date
+def _read_cache(cache, path):
+    if not os.path.isfile(cache):
+        return None
+    try:
+        with np.load(cache) as data:
+            table = dict((key, data[key]) for key in data.files)
+    except (IOError, ValueError):
+        return None
+    if int(table.pop("version")) != CACHE_VERSION:
+        return None
+    stat = os.stat(path)
+    mtime, size = table.pop("mtime"), table.pop("size")
+    digest = str(table.pop("digest"))
+    if float(mtime) != stat.st_mtime or int(size) != stat.st_size:
+        if digest != _digest(path):
+            return None
+        # same content, only the cache has to record the new file state
+        _write_cache(cache, path, table, digest)
+    return table
+
+
+# write the arrays in @table into the cache file @cache of the yaml file at
+# @path. The dataset is used as is if the cache can not be written.
+def _write_cache(cache, path, table, digest=None):
+    stat = os.stat(path)
+    temp_path = cache + ".tmp"
+    try:
+        if not os.path.exists(os.path.dirname(cache)):
+            os.makedirs(os.path.dirname(cache))
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f, version=CACHE_VERSION, mtime=stat.st_mtime,
+                size=stat.st_size, digest=digest or _digest(path), **table
+            )
+        os.rename(temp_path, cache)
+    except (IOError, OSError):
+        _logger.warning("Unable to write the dataset cache %s", cache)
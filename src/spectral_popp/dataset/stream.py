@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import yaml
+import numpy as np
+
+# the yaml parser implemented in C (libyaml) is used if it is available
+_Loader = getattr(yaml, "CLoader", yaml.Loader)
+
+
+# read a yaml file holding a mapping of {region: [timestamp, ...]} (e.g.
+# present_activity.yaml or leg.yaml) as a stream of (region, timestamps)
+# chunks. @timestamps is an array of at most @chunk_size timestamps of
+# @region, in the order they are in the file. The file is parsed event by
+# event, only the current chunk is kept in memory.
+def iter_region_chunks(path, chunk_size=4096):
+    with open(path, "r") as f:
+        region = None
+        chunk = list()
+        depth = 0
+        for event in yaml.parse(f, Loader=_Loader):
+            if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                depth += 1
+            elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                depth -= 1
+                if depth == 1 and region is not None:
+                    if len(chunk):
+                        yield region, np.array(chunk, dtype=np.int64)
+                    region = None
+                    chunk = list()
+            elif isinstance(event, yaml.ScalarEvent):
+                if depth == 1:
+                    region = event.value
+                elif depth == 2 and region is not None:
+                    chunk.append(int(event.value))
+                    if len(chunk) >= chunk_size:
+                        yield region, np.array(chunk, dtype=np.int64)
+                        chunk = list()
+
+
+# read a yaml file holding a mapping of {region: [timestamp, ...]} (e.g. the
+# detections of a detector) into {region: array of sorted unique timestamps}
+def load_region_arrays(path):
+    chunks = dict()
+    for region, timestamps in iter_region_chunks(path):
+        chunks.setdefault(region, list()).append(timestamps)
+    return dict(
+        (region, np.unique(np.concatenate(timestamps)))
+        for region, timestamps in chunks.items()
+    )
+
+
+# whether each value in @values is in @sorted_values (a sorted array), using
+# a binary search per value
+def isin_sorted(sorted_values, values):
+    values = np.asarray(values)
+    if len(sorted_values) == 0:
+        return np.zeros(values.shape, dtype=bool)
+    indices = np.searchsorted(sorted_values, values)
+    indices[indices == len(sorted_values)] = 0
+    return sorted_values[indices] == values
+
+
+# the (region, start_times, counts) batches of @region (see
+# loader.Dataset.stream_counts) from its @observations, {source: timestamps},
+# where counts[source] is the count of each timestamp of the source. A
+# timestamp of more than one source is observed once, with the count of the
+# last source. The observations are ordered by time and split into batches
+# of at most @chunk_size observations.
+def _region_batches(region, observations, counts, detections, chunk_size):
+    sources = sorted(observations.keys())
+    timestamps = np.concatenate(
+        [observations[source] for source in sources] +
+        [np.zeros(0, dtype=np.int64)]
+    )
+    values = np.concatenate(
+        [np.full(len(observations[source]), counts[source], dtype=np.int64) for source in sources] +
+        [np.zeros(0, dtype=np.int64)]
+    )
+    # the last observation of a timestamp wins, ordered by time
+    timestamps, latest = np.unique(timestamps[::-1], return_index=True)
+    values = values[::-1][latest]
+    if detections is not None:
+        values = isin_sorted(
+            detections.get(region, np.zeros(0, dtype=np.int64)), timestamps
+        ).astype(np.int64)
+    for start in range(0, len(timestamps), chunk_size):
+        yield (
+            region, timestamps[start:start + chunk_size],
+            values[start:start + chunk_size]
+        )
+
+
+# collect a stream of (region, array, ...) batches (e.g. from
+# loader.Dataset.stream_counts)
+# into {region: (array, ...)}, concatenating the arrays of each region
+def collect_batches(batches):
+    regions = dict()
+    for batch in batches:
+        regions.setdefault(batch[0], list()).append(batch[1:])
+    return dict(
+        (region, tuple(np.concatenate(arrays) for arrays in zip(*batches)))
+        for region, batches in regions.items()
+    )
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+import os
+import logging
+import numpy as np
+from rate import Rate, gamma_mean, gamma_estimate
+from storage import write_collection, read_collection
+from fourier import fit_spectrums_batch, build_signals, rectify_signal
+from instrument import timed
+
+_logger = logging.getLogger(__name__)
+
+
+# Collection of periodic Poisson processes sharing the same increment,
+# periodic cycle and pivot time, e.g. one process per (region, detector).
+# The rates of all processes are kept in one array @self.rates of
+# [process, slot, (alpha, beta)], where slot is the increment of the cycle
+# counted from the pivot time, so the rates of all processes at some time is
+# a single slice. Processes are identified by their keys (any hashable value,
+# e.g. a (region, detector) tuple), @self.keys[i] is the key of the process
+# at row i. Updates, retrievals and Fourier fitting are done for many
+# processes at once, and the collection is stored in a single file.
+class ProcessCollection(object):
+
+    # @increment and @periodic_cycle (in seconds) are the same as those of
+    # PeriodicPoissonProcess, @path_to_db is the path to database folder
+    # storing this collection.
+    def __init__(
+        self, increment=60, periodic_cycle=86400, path_to_db="",
+        db_name="poisson_collection"
+    ):
+        self.increment = increment
+        self.periodic_cycle = periodic_cycle
+        self.num_of_slots = -(-periodic_cycle // increment)
+        self._pivot_time = None
+        self.keys = list()
+        self._rows = dict()
+        default = Rate()
+        self._default = (default.alpha, default.beta)
+        self.rates = np.zeros((0, self.num_of_slots, 2))
+        # rates of the spectral models of the processes (see fourier_transform)
+        # in the same form as @self.rates, None if they have not been fitted,
+        # and whether @self.rates changed since the last fit
+        self.spectral = None
+        self._dirty = False
+        if path_to_db == "":
+            path_to_db = os.path.join(os.getcwd(), db_name)
+        else:
+            path_to_db = os.path.join(path_to_db, db_name)
+        if not os.path.exists(path_to_db):
+            os.makedirs(path_to_db)
+        self._path_to_file = os.path.join(
+            path_to_db, "%d_%d.bin" % (periodic_cycle, increment)
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    # rows of @keys in @self.rates, processes are added for new keys
+    def rows(self, keys):
+        for key in keys:
+            if key not in self._rows:
+                self._rows[key] = len(self.keys)
+                self.keys.append(key)
+        if len(self.keys) > len(self.rates):
+            rates = np.empty((len(self.keys), self.num_of_slots, 2))
+            rates[:len(self.rates)] = self.rates
+            rates[len(self.rates):] = self._default
+            self.rates = rates
+            if self.spectral is not None:
+                spectral = np.empty(rates.shape)
+                spectral[:len(self.spectral)] = self.spectral
+                spectral[len(self.spectral):] = self._default
+                self.spectral = spectral
+        return np.array([self._rows[key] for key in keys], dtype=np.int64)
+
+    # slots of @start_times in the cycle. The pivot time is set to the
+    # first start time (aligned to @increment) if it is not set yet.
+    def slots(self, start_times):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        if self._pivot_time is None and start_times.size > 0:
+            self._pivot_time = (
+                int(start_times.flat[0]) // self.increment
+            ) * self.increment
+        pivot_time = self._pivot_time or 0
+        return ((start_times - pivot_time) % self.periodic_cycle) // self.increment
+
+    # posterior distributions of the rates of the process of @key given the
+    # @counts observed at @start_times (see PoissonProcess.update_batch)
+    def update(self, key, start_times, counts):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        self.update_batch([key] * len(start_times), start_times, counts)
+
+    # posterior distributions of the rates of many processes given a batch of
+    # observations, @counts[i] is the count observed by the process of
+    # @keys[i] at @start_times[i]. All observations are aggregated per
+    # process and slot before the rates are updated.
+    @timed("update")
+    def update_batch(self, keys, start_times, counts):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        if len(start_times) == 0:
+            return
+        unique_keys = list()
+        positions = dict()
+        for key in keys:
+            if key not in positions:
+                positions[key] = len(unique_keys)
+                unique_keys.append(key)
+        rows = self.rows(unique_keys)[
+            np.array([positions[key] for key in keys], dtype=np.int64)
+        ]
+        cells = (rows * self.num_of_slots) + self.slots(start_times)
+        size = self.rates.shape[0] * self.num_of_slots
+        shape = self.rates.shape[0:2]
+        self.rates[:, :, 0] += np.bincount(
+            cells, weights=np.asarray(counts, dtype=float), minlength=size
+        ).reshape(shape)
+        self.rates[:, :, 1] += np.bincount(cells, minlength=size).reshape(shape)
+        self._dirty = True
+
+    # point estimates of the rates at @start_times (any timestamps) as an
+    # array of [process, start time]. @keys selects the processes (all of
+    # them in the order of @self.keys if None), @statistic is either "mode"
+    # (or "map"), "mean", "upper", "lower", "alpha" or "beta", and
+    # @spectral selects the rates of the spectral models (see
+    # fourier_transform) instead. KeyError is raised for an unknown key.
+    @timed("retrieve")
+    def get_rates_at(self, start_times, statistic="mode", keys=None, spectral=False):
+        if spectral:
+            if self.spectral is None or self._dirty:
+                self.fourier_transform()
+            rates = self.spectral
+        else:
+            rates = self.rates
+        slots = self.slots(start_times)
+        if keys is not None:
+            rates = rates[[self._rows[key] for key in keys]]
+        rates = rates[:, slots]
+        return gamma_estimate(rates[..., 0], rates[..., 1], statistic)
+
+    # get point estimates of the rates from @start_time to @end_time. Returns
+    # the start times of the increments and the estimates as an array of
+    # [process, start time] (see get_rates_at)
+    @timed("retrieve")
+    def retrieve(
+        self, start_time, end_time, statistic="mode", keys=None, spectral=False
+    ):
+        start_times = np.arange(
+            (start_time // self.increment) * self.increment,
+            (end_time // self.increment) * self.increment, self.increment
+        )
+        return start_times, self.get_rates_at(
+            start_times, statistic, keys, spectral
+        )
+
+    # fit the spectral models (see SpectralPoissonProcess.fourier_transform)
+    # of all processes at once, the rate function of each process over one
+    # cycle is transformed in a single batch (see fit_spectrums_batch)
+    @timed("fourier")
+    def fourier_transform(self):
+        if len(self.keys) == 0:
+            self.spectral = np.zeros(self.rates.shape)
+            self._dirty = False
+            return
+        alpha, beta = self.rates[:, :, 0], self.rates[:, :, 1]
+        spectrums, _ = fit_spectrums_batch(gamma_mean(alpha, beta))
+        rates = rectify_signal(
+            build_signals(spectrums, self.num_of_slots), low_thres=0.001
+        )
+        self.spectral = np.empty(self.rates.shape)
+        self.spectral[:, :, 0] = rates * beta
+        self.spectral[:, :, 1] = beta
+        self._dirty = False
+
+    # add the rates of @process (a PeriodicPoissonProcess with the same
+    # increment and periodic cycle) as the process of @key. The rates are
+    # aligned to the pivot time of this collection.
+    def add_process(self, key, process):
+        if (process.increment, process.periodic_cycle) != (
+            self.increment, self.periodic_cycle
+        ):
+            raise ValueError(
+                "The process has %d second increment with %d periodic cycle" % (
+                    process.increment, process.periodic_cycle
+                )
+            )
+        if self._pivot_time is None and process._pivot_time is not None:
+            self.slots([process._pivot_time])
+        pivot_time = self._pivot_time or 0
+        start_times = pivot_time + (np.arange(self.num_of_slots) * self.increment)
+        start_times = process._relative_start_times(start_times)
+        row = self.rows([key])[0]
+        for ind, param in enumerate(["alpha", "beta"]):
+            self.rates[row, :, ind] = process.poisson.lookup(start_times, param)
+        self._dirty = True
+
+    # store the collection into its single db file
+    @timed("store")
+    def store_to_db(self):
+        _logger.info("Storing %d Poisson processes of this collection", len(self.keys))
+        write_collection(
+            self._path_to_file, self.keys, self.rates, self.increment,
+            self.periodic_cycle, self._pivot_time
+        )
+
+    # retrieve the stored collection, replacing the processes of this
+    # collection. Returns whether there was anything to retrieve.
+    @timed("load")
+    def retrieve_from_db(self):
+        if not os.path.isfile(self._path_to_file):
+            return False
+        header, keys, rates = read_collection(self._path_to_file)
+        if (header["increment"], header["periodic_cycle"]) != (
+            self.increment, self.periodic_cycle
+        ):
+            raise ValueError(
+                "The db at %s has %d second increment with %d periodic cycle" % (
+                    self._path_to_file, header["increment"],
+                    header["periodic_cycle"]
+                )
+            )
+        self._pivot_time = header["pivot"]
+        self.keys = keys
+        self._rows = dict((key, row) for row, key in enumerate(keys))
+        self.rates = rates
+        self.spectral = None
+        self._dirty = False
+        _logger.info("%d Poisson processes are obtained from db...", len(keys))
+        return len(keys) > 0
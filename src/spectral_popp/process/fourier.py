@@ -2,12 +2,26 @@
 
 
 import numpy as np
-from scipy.fftpack import fft
+from scipy.fftpack import next_fast_len
+from instrument import count
+
+# Bluestein plans of the signal lengths which are not fast lengths,
+# {length: (padded length, chirp, transformed kernel)}, see _bluestein_plan
+_plans = dict()
+_plans_size = 16
+# signals shorter than this are transformed directly whatever their length
+_min_bluestein_length = 64
 
 
 # rectify a signal for each point that goes beyond the specified (upper and
 # lower) threshold
 def rectify_signal(signal, up_thres=float("inf"), low_thres=0.0):
+    if isinstance(signal, np.ndarray):
+        below = signal < low_thres
+        above = signal > up_thres
+        signal[below] = low_thres
+        signal[above] = up_thres
+        return signal
     for ind, val in enumerate(signal):
         if val < low_thres:
             signal[ind] = low_thres
@@ -21,6 +35,13 @@ def rectify_signal(signal, up_thres=float("inf"), low_thres=0.0):
 # human data observed by a robot".
 # @addition_method represents l-AAM technique
 def reconstruct_signal(signal, addition_method=True):
+    spectrums, residue = fit_spectrums(signal, addition_method)
+    return build_signal(spectrums, len(signal)), residue
+
+
+# the l [amplitude, phase, frequency] spectrums representing @signal using
+# l-BAM or l-AAM (@addition_method) technique, and the residue of the signal
+def fit_spectrums(signal, addition_method=True):
     num_of_freqs = min(len(signal)/10, 15)
     if addition_method:
         spectrums, residue = get_accumulated_highest_n_freq(signal, num_of_freqs*2)
@@ -28,65 +49,306 @@ def reconstruct_signal(signal, addition_method=True):
     else:
         residue = signal
         xf = np.linspace(0.0, len(signal), len(signal))
-        spectrums = get_highest_n_freq(fft(signal), num_of_freqs)
+        N = len(signal)
+        spectrums = _highest_n_freq_rows(
+            real_fft(signal)[:, 0:N//2], N, num_of_freqs
+        )[0]
         for [amp, phs, freq] in spectrums:
             wave = amp * np.cos((freq * 2.0 * np.pi * xf) + phs)
             residue -= wave
+    return spectrums, residue
+
+
+# build a signal of @length points from the sum of the waves in @spectrums
+def build_signal(spectrums, length):
     reconstruction = 0
     for spectrum in spectrums:
-        xf = np.linspace(0.0, len(signal), len(signal))
+        xf = np.linspace(0.0, length, length)
         wave = spectrum[0] * np.cos((spectrum[2]*2.0*np.pi*xf) + spectrum[1])
         reconstruction += wave
-    return reconstruction, residue
+    return reconstruction
+
+
+# evaluate the sum of the waves in @spectrums of a signal of @length points
+# at @positions, (fractional) indices of the points of the signal, so the
+# signal can be evaluated between and beyond its points. At the points
+# themselves the waves match those of build_signal.
+def evaluate_spectrums(spectrums, positions, length):
+    positions = np.asarray(positions, dtype=float)
+    reconstruction = np.zeros(positions.shape)
+    if len(spectrums) == 0:
+        return reconstruction
+    # build_signal spreads its @length points evenly over [0, @length], so
+    # point k is at k + k/(@length-1). With an integer frequency the whole
+    # cycles of the first term do not change the wave at the points, only
+    # the second term is kept to get the smooth wave between the points.
+    xf = positions / float(length - 1) if length > 1 else 0.0 * positions
+    for amp, phs, freq in spectrums:
+        reconstruction += amp * np.cos((freq * 2.0 * np.pi * xf) + phs)
+    return reconstruction
+
+
+# Fourier reconstruction of many signals at once (e.g. the rate functions of
+# all regions), @signals is an array of signals of the same length along
+# @axis. Returns the reconstructions and the residues with the same shape
+# as @signals.
+def reconstruct_signals(signals, addition_method=True, axis=-1):
+    signals = np.moveaxis(np.array(signals, dtype=float), axis, -1)
+    shape = signals.shape
+    signals = signals.reshape((-1, shape[-1]))
+    spectrums, residues = fit_spectrums_batch(signals, addition_method)
+    reconstructions = build_signals(spectrums, shape[-1])
+    return (
+        np.moveaxis(reconstructions.reshape(shape), -1, axis),
+        np.moveaxis(residues.reshape(shape), -1, axis)
+    )
+
+
+# fit_spectrums for each row of the 2-D array @signals. The FFT, the top
+# frequency selection and the wave substraction are done for all rows at once.
+# Returns a list of spectrums (one per row) and the residues.
+def fit_spectrums_batch(signals, addition_method=True):
+    signals = np.array(signals, dtype=float, ndmin=2)
+    num_of_freqs = min(signals.shape[1]//10, 15)
+    if addition_method:
+        spectrums, residues = get_accumulated_highest_n_freq_batch(
+            signals, num_of_freqs*2
+        )
+        spectrums = [spectrum[0:num_of_freqs] for spectrum in spectrums]
+    else:
+        residues = signals
+        N = signals.shape[1]
+        spectrums = _highest_n_freq_rows(
+            real_fft(signals)[:, 0:N//2], N, num_of_freqs
+        )
+        residues -= build_signals(spectrums, signals.shape[1])
+    return spectrums, residues
+
+
+# build_signal for a list of spectrums, returns one signal per row
+def build_signals(spectrums, length):
+    xf = np.linspace(0.0, length, length)
+    reconstructions = np.zeros((len(spectrums), length))
+    for row, spectrum in enumerate(spectrums):
+        if len(spectrum) == 0:
+            continue
+        amps, phases, freqs = [np.array(values, dtype=float) for values in zip(*spectrum)]
+        waves = amps[:, None] * np.cos(
+            (freqs[:, None] * 2.0 * np.pi * xf[None, :]) + phases[:, None]
+        )
+        reconstructions[row] = waves.sum(axis=0)
+    return reconstructions
+
+
+# update the [amplitude, phase, frequency] @spectrums of a signal of @length
+# points after the signal changed by @delta at @indices. By linearity of the
+# DFT, the coefficient of each frequency changes by the DFT of the change,
+# which costs O(k.l) for k changed points and l spectrums. The frequencies
+# themselves are kept, so this is only valid while the change is small
+# compared to the signal.
+def update_spectrums(spectrums, indices, delta, length):
+    if len(spectrums) == 0:
+        return spectrums
+    amps, phases, freqs = [np.array(values, dtype=float) for values in zip(*spectrums)]
+    indices = np.asarray(indices, dtype=float)
+    coefs = np.exp(
+        -2j * np.pi * np.outer(freqs, indices) / float(length)
+    ).dot(np.asarray(delta, dtype=float))
+    # a (non-zero frequency) wave takes its amplitude from both halves
+    # of the spectrum
+    scales = np.where(freqs == 0, 1.0, 2.0) / float(length)
+    phasors = amps * np.exp(1j * phases) + (scales * coefs)
+    return [
+        [amp, phs, freq] for amp, phs, freq in zip(
+            np.abs(phasors), np.angle(phasors), freqs.astype(int)
+        )
+    ]
 
 
 # Addition Amplitude Model (l-AAM) technique to get the l highest frequencies.
 # @max_addition is the maximum number of each frequency can be added up.
 # @max_iteration is the maximum number of iteration to obtain the desired @num_of_freqs.
 def get_accumulated_highest_n_freq(signal, num_of_freqs=15, max_addition=10, max_iteration=1000):
-    xf = np.linspace(0.0, len(signal), len(signal))
+    signal = np.asarray(signal, dtype=float)
+    frequencies, residues = get_accumulated_highest_n_freq_batch(
+        signal[None, :], num_of_freqs, max_addition, max_iteration
+    )
+    signal[:] = residues[0]
+    return frequencies[0], signal
+
+
+# get_accumulated_highest_n_freq for each row of the 2-D array @signals.
+# Returns a list of frequencies (one per row) and the residues.
+# The spectrums of the signals are only computed once. Each wave substracted
+# from a signal is a pure cosine whose spectrum is known in closed form (see
+# _cosine_spectrum), so the spectrum of the remaining signal is updated by
+# substracting the spectrum of the wave instead of computing another FFT.
+# Each iteration selects and substracts the waves of all unfinished rows
+# at once.
+def get_accumulated_highest_n_freq_batch(
+    signals, num_of_freqs=15, max_addition=10, max_iteration=1000
+):
+    signals = np.array(signals, dtype=float, ndmin=2)
+    N = signals.shape[1]
+    xf = np.linspace(0.0, N, N)
+    # only the first half of the spectrum is considered (see get_highest_n_freq)
+    spectrums = real_fft(signals)[:, 0:N//2]
+    # spectrums of the substracted waves, {freq: (positive, negative)}
+    cosine_spectrums = dict()
     # initialise significant frequencies by taking frequency 0
-    spectrums = fft(signal)
-    [amp, phs, freq] = get_highest_n_freq(spectrums, 1)[0]
-    frequencies = [[amp, phs, freq]]
-    freq_counter = {freq: 1}
+    frequencies = list()
+    freq_counters = list()
+    for [(amp, phs, freq)] in _highest_n_freq_rows(spectrums, N, 1):
+        frequencies.append([[amp, phs, freq]])
+        freq_counters.append({freq: 1})
+    active = np.array([len(freqs) < num_of_freqs for freqs in frequencies])
     exit_counter = 0
-    while len(frequencies) < num_of_freqs:
-        spectrums = fft(signal)
+    while active.any():
+        rows = np.flatnonzero(active)
+        waves = np.zeros((len(rows), 3))
         # create a signal of the highest frequency
         # typically the highest frequency is frequency 0, that is why the second
         # highest is taken
-        freqs = get_highest_n_freq(spectrums, 2)
-        [amp, phs, freq] = freqs[1]
-        if freq == 0:
-            [amp, phs, freq] = freqs[0]
-        wave = amp * np.cos((freq * 2.0 * np.pi * xf) + phs)
+        for ind, freqs in enumerate(_highest_n_freq_rows(spectrums[rows], N, 2)):
+            [amp, phs, freq] = freqs[1]
+            if freq == 0:
+                [amp, phs, freq] = freqs[0]
+            waves[ind] = [amp, phs, freq]
+            row = rows[ind]
+            spectrums[row] -= _cosine_spectrum(
+                amp, phs, freq, xf, spectrums.shape[1], cosine_spectrums
+            )
+            _accumulate_frequency(
+                frequencies[row], freq_counters[row], amp, phs, freq,
+                max_addition
+            )
+        amps, phases, freqs = waves[:, 0:1], waves[:, 1:2], waves[:, 2:3]
         # substracting signal with the wave
-        signal -= wave
-        if freq not in zip(*frequencies)[2]:
-            frequencies.append([amp, phs, freq])
-            freq_counter.update({freq: 1})
-        else:
-            for ind, val in enumerate(frequencies):
-                if frequencies[ind][2] == freq and freq_counter[freq] < max_addition:
-                    frequencies[ind][0] += amp
-                    frequencies[ind][1] = ((
-                        freq_counter[freq] * frequencies[ind][1]
-                    ) + phs) / (freq_counter[freq] + 1)
-                    freq_counter[freq] += 1
+        signals[rows] -= amps * np.cos((freqs * 2.0 * np.pi * xf) + phases)
+        active[rows] = [len(frequencies[row]) < num_of_freqs for row in rows]
         exit_counter += 1
         if exit_counter >= max_iteration:
             break
-    return frequencies, signal
+    count("laam_iteration", exit_counter)
+    return frequencies, signals
+
+
+# add the wave [@amp, @phs, @freq] to the l-AAM @frequencies, a new frequency
+# is appended while an existing one is accumulated (up to @max_addition times)
+def _accumulate_frequency(frequencies, freq_counter, amp, phs, freq, max_addition):
+    if freq not in [frequency[2] for frequency in frequencies]:
+        frequencies.append([amp, phs, freq])
+        freq_counter.update({freq: 1})
+    else:
+        for ind, val in enumerate(frequencies):
+            if frequencies[ind][2] == freq and freq_counter[freq] < max_addition:
+                frequencies[ind][0] += amp
+                frequencies[ind][1] = ((
+                    freq_counter[freq] * frequencies[ind][1]
+                ) + phs) / (freq_counter[freq] + 1)
+                freq_counter[freq] += 1
+
+
+# the first @num_of_bins bins of the DFT of amp * cos(freq * 2pi * xf + phs),
+# where @xf is evenly spaced. Writing the cosine as two complex exponentials,
+# each bin is the sum of two geometric series. The series depend only on
+# @freq and are kept in @cache.
+def _cosine_spectrum(amp, phs, freq, xf, num_of_bins, cache):
+    if freq not in cache:
+        N = len(xf)
+        step = xf[1] - xf[0] if N > 1 else 0.0
+        omega = freq * 2.0 * np.pi * step
+        bins = 2.0 * np.pi * np.arange(num_of_bins) / float(N)
+        cache[freq] = (
+            _geometric_sum(omega - bins, N), _geometric_sum(-omega - bins, N)
+        )
+    positive, negative = cache[freq]
+    return 0.5 * amp * (
+        (np.exp(1j * phs) * positive) + (np.exp(-1j * phs) * negative)
+    )
+
+
+# sum of exp(i * phi * n) for n = 0, ..., N-1 for each angle in @phi
+def _geometric_sum(phi, N):
+    ratio = 1.0 - np.exp(1j * phi)
+    constant = np.abs(ratio) < 1e-12
+    ratio[constant] = 1.0
+    return np.where(constant, N, (1.0 - np.exp(1j * phi * N)) / ratio)
+
+
+# the first N//2 + 1 bins of the DFT of each row of the 2-D array of real
+# @signals (N points each), the other bins are their complex conjugates.
+# Signals whose length is a product of small primes (see next_fast_len) are
+# transformed directly with a real-input FFT. Any other length, e.g. a
+# prime number of increments per cycle, would make the FFT far slower than
+# N log N, so the DFT is computed with Bluestein's algorithm as a
+# convolution of a fast length instead (see _bluestein_plan). Both give the
+# same bins, whatever the length.
+def real_fft(signals):
+    signals = np.array(signals, dtype=float, ndmin=2)
+    N = signals.shape[1]
+    count("fft", len(signals))
+    if N < _min_bluestein_length or next_fast_len(N) == N:
+        return np.fft.rfft(signals, axis=1)
+    M, chirp, kernel = _bluestein_plan(N)
+    bins = N//2 + 1
+    spectrums = np.fft.ifft(
+        np.fft.fft(signals * chirp, M, axis=1) * kernel, axis=1
+    )[:, 0:bins]
+    return spectrums * chirp[0:bins]
+
+
+# Bluestein plan of an @N point DFT. With nk = (n^2 + k^2 - (k-n)^2) / 2,
+# bin k of the DFT is chirp[k] * sum(x[n] * chirp[n] * conj(chirp[k-n])),
+# a convolution which is computed with FFTs of a fast length M >= 2N-1.
+# The plan holds M, the chirp and the FFT of the convolution kernel, and it
+# is reused by all transforms of @N points.
+def _bluestein_plan(N):
+    if N not in _plans:
+        if len(_plans) >= _plans_size:
+            _plans.clear()
+        M = next_fast_len((2 * N) - 1)
+        # n^2 is reduced modulo 2N to keep the angles small
+        n = np.arange(N, dtype=np.int64)
+        chirp = np.exp(-1j * np.pi * ((n * n) % (2 * N)) / float(N))
+        kernel = np.zeros(M, dtype=complex)
+        kernel[0:N] = np.conj(chirp)
+        kernel[M-N+1:] = np.conj(chirp[1:])[::-1]
+        _plans[N] = (M, chirp, np.fft.fft(kernel))
+    return _plans[N]
 
 
 # Best Amplitude Model (l-BAM) technique to get the l highest frequencies.
 def get_highest_n_freq(freqs, n=15):
     N = len(freqs)
-    freqs = freqs[0:N/2]
-    indices = [i for i in range(len(freqs))]
-    angles = np.angle(freqs)
+    return _highest_n_freq_rows(np.asarray(freqs)[None, 0:N//2], N, n)[0]
+
+
+# get_highest_n_freq for each row of the 2-D array @freqs
+def get_highest_n_freq_batch(freqs, n=15):
+    N = freqs.shape[1]
+    return _highest_n_freq_rows(freqs[:, 0:N//2], N, n)
+
+
+# the @n highest (amplitude, phase, frequency) of the bins in each row of
+# @freqs, each row holds bins of an @N point DFT. Bins are sorted from the
+# highest amplitude, then phase and frequency. Candidates are selected with a
+# partial sort, only the bins tied with the n-th highest amplitude are sorted.
+def _highest_n_freq_rows(freqs, N, n):
     amplitudes = np.abs(freqs) / float(N)
-    sorted_result = sorted(zip(amplitudes, angles, indices), reverse=True)
-    n_freqs = sorted_result[:n]
-    return n_freqs
+    if n < amplitudes.shape[1]:
+        highest = np.argpartition(-amplitudes, n - 1, axis=1)[:, :n]
+        thresholds = amplitudes[
+            np.arange(len(amplitudes))[:, None], highest
+        ].min(axis=1)
+    else:
+        thresholds = np.full(len(amplitudes), -np.inf)
+    result = list()
+    for row in range(len(amplitudes)):
+        candidates = np.flatnonzero(amplitudes[row] >= thresholds[row])
+        angles = np.angle(freqs[row, candidates])
+        result.append(sorted(
+            zip(amplitudes[row, candidates], angles, candidates.tolist()),
+            reverse=True
+        )[:n])
+    return result
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.stats import nbinom
+from rate import gamma_variance
+from interval import IntervalTable
+
+
+# Spatial aggregation of the periodic Poisson processes of many regions.
+# Regions are put into named groups (e.g. zones, or the whole floor), and the
+# rates of the members of each group are summed over one cycle, so a group
+# is queried with a single lookup instead of retrieving every region. For
+# each slot of the cycle a group keeps the sum of the means and of the
+# variances of the rates of its members, and the sum of the log
+# probabilities of no event in each member (for "any region" queries).
+# The slots of the groups are the increments of the cycle from
+# @pivot_time (by default the pivot time of the first region with data),
+# the rates of each region are read at the same times through its own
+# pivot time, so regions whose cycles start at different times are aligned.
+# A region whose pivot time is not aligned to the increment has two rates
+# in the slot holding its pivot time (see PeriodicPoissonProcess), the rate
+# from the pivot time on is kept apart and added to the sums where needed.
+# The groups are listeners of the rates of their members (see
+# RateStore.add_listener) and only the slots which changed are summed
+# again after an update. A member whose rates were replaced (e.g. a spectral
+# model refitted, or a process sent back by ParallelEngine) is read again
+# when the groups are queried.
+class RegionGroups(object):
+
+    STATISTICS = ["mean", "variance", "any"]
+
+    # @processes is a dictionary of {region: PeriodicPoissonProcess} sharing
+    # the same increment and periodic cycle, it is read again on every query
+    # so processes can be replaced in it. @groups is a dictionary of
+    # {name: list of regions}.
+    def __init__(self, processes, groups=None, pivot_time=None):
+        self._processes = processes
+        if len(processes) == 0:
+            raise ValueError("There is no process to group")
+        process = processes[sorted(processes.keys())[0]]
+        self.increment = process.increment
+        self.periodic_cycle = process.periodic_cycle
+        self.num_of_slots = -(-self.periodic_cycle // self.increment)
+        if pivot_time is None:
+            pivots = [
+                processes[region]._pivot_time for region in sorted(processes)
+                if processes[region]._pivot_time is not None
+            ]
+            pivot_time = pivots[0] if len(pivots) else 0
+        self.pivot_time = (pivot_time // self.increment) * self.increment
+        self.groups = dict()
+        # rates of each region over the cycle, {region: array of
+        # [statistic, slot]}, and the store and pivot time they were read from
+        self._members = dict()
+        self._stores = dict()
+        self._pivots = dict()
+        # regions whose pivot time is not aligned to the increment, {region:
+        # (slot of the pivot time, share of the slot from the pivot time,
+        # array of [statistic] of the rate from the pivot time)}
+        self._heads = dict()
+        # sums of the rates of the members of each group, {name: array of
+        # [statistic, slot]}, and their interval tables (see expected_counts)
+        self._sums = dict()
+        self._intervals = dict()
+        for name, regions in (groups or dict()).items():
+            self.add_group(name, regions)
+
+    # add (or replace) the group @name of @regions
+    def add_group(self, name, regions):
+        regions = list(regions)
+        for region in regions:
+            if region not in self._members:
+                self._members[region] = np.zeros((3, self.num_of_slots))
+                self._refresh(region)
+        self.groups[name] = regions
+        self._sum(name)
+
+    # start times of the slots of the cycle
+    def start_times(self):
+        return self.pivot_time + (np.arange(self.num_of_slots) * self.increment)
+
+    # slots of the cycle of @timestamps
+    def slots(self, timestamps):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        return ((timestamps - self.pivot_time) % self.periodic_cycle) // self.increment
+
+    # called by the store of a member after the rates at @start_times (None
+    # for all rates) changed, the slots of the cycle reading those rates are
+    # read again and summed again in the groups of the member
+    def rates_changed(self, store, start_times):
+        for region, tracked in self._stores.items():
+            if tracked is not store:
+                continue
+            if start_times is None:
+                self._refresh(region)
+                continue
+            slots = self.slots(start_times)
+            # a member whose pivot time is not aligned with the pivot time of
+            # the groups reads a rate in two consecutive slots
+            slots = np.unique(np.concatenate((
+                slots, (slots + 1) % self.num_of_slots
+            )))
+            self._read(region, slots)
+            for name, regions in self.groups.items():
+                if region in regions:
+                    self._sum(name, slots)
+
+    # sums of the rates of the members of @group at @timestamps, @statistic
+    # is either "mean" (the expected number of events per increment),
+    # "variance" (of the summed rate) or "any" (the probability of at least
+    # one event in any member). A single timestamp gives a single value.
+    def get_rates_at(self, group, timestamps, statistic="mean"):
+        if statistic not in RegionGroups.STATISTICS:
+            raise ValueError("Unknown statistic %s" % statistic)
+        self._sync()
+        row = RegionGroups.STATISTICS.index(statistic)
+        values = self._sums[group][row][self.slots(timestamps)]
+        # timestamps from the unaligned pivot time of a member to the end of
+        # its slot read the rate from the pivot time
+        for region in self.groups[group]:
+            if region not in self._heads:
+                continue
+            slot, share, rates = self._heads[region]
+            after = (
+                (np.asarray(timestamps) - self._pivots[region]) %
+                self.periodic_cycle
+            ) < share * self.increment
+            values = values + np.where(
+                after, rates[row] - self._members[region][row, slot], 0.0
+            )
+        if statistic == "any":
+            return -np.expm1(values)
+        return values
+
+    # sums of the rates of the members of @group from @start_time to
+    # @end_time (see get_rates_at). Returns the start times of the
+    # increments and the sums at those start times.
+    def retrieve(self, group, start_time, end_time, statistic="mean"):
+        start_times = np.arange(
+            (start_time // self.increment) * self.increment,
+            (end_time // self.increment) * self.increment, self.increment
+        )
+        return start_times, self.get_rates_at(group, start_times, statistic)
+
+    # expected number of events in the members of @group from @start_times
+    # to @end_times, answered in constant time (see IntervalTable)
+    def expected_counts(self, group, start_times, end_times):
+        return self._interval_table(group).rate_sums(start_times, end_times)[0]
+
+    # predictive distribution of the number of events in the members of
+    # @group from @start_times to @end_times, as a negative binomial
+    # distribution (see PeriodicPoissonProcess.count_distribution)
+    def count_distribution(self, group, start_times, end_times):
+        n, p = self._interval_table(group).predictive(start_times, end_times)
+        return nbinom(n, p)
+
+    # interval table of the sums of @group, built on first use. The slot
+    # holding the unaligned pivot time of a member takes the share of each
+    # of the two rates of the member in the slot.
+    def _interval_table(self, group):
+        self._sync()
+        if group not in self._intervals:
+            mean = np.append(self._sums[group][0], 0.0)
+            variance = np.append(self._sums[group][1], 0.0)
+            for region in self.groups[group]:
+                if region not in self._heads:
+                    continue
+                slot, share, rates = self._heads[region]
+                before = self._members[region][:, slot]
+                mean[slot] += share * (rates[0] - before[0])
+                variance[slot] += (
+                    (np.square(1.0 - share) - 1.0) * before[1] +
+                    np.square(share) * rates[1]
+                )
+            self._intervals[group] = IntervalTable(
+                mean, variance, self.pivot_time, self.increment,
+                self.periodic_cycle, self.pivot_time
+            )
+        return self._intervals[group]
+
+    # read again the members whose rates were replaced or whose pivot time
+    # changed since they were read
+    def _sync(self):
+        for region in self._members:
+            process = self._processes.get(region)
+            store = process._table_store() if process is not None else None
+            if store is not self._stores.get(region) or (
+                process is not None and
+                process._pivot_time != self._pivots.get(region)
+            ):
+                self._refresh(region)
+
+    # read all the rates of @region again, and follow its store
+    def _refresh(self, region):
+        if self._stores.get(region) is not None:
+            self._stores[region].remove_listener(self)
+        process = self._processes.get(region)
+        if process is None:
+            self._stores[region] = None
+            self._pivots[region] = None
+            self._heads.pop(region, None)
+            self._members[region][:] = 0.0
+        else:
+            if (process.increment, process.periodic_cycle) != (
+                self.increment, self.periodic_cycle
+            ):
+                raise ValueError(
+                    "The process of region %s has %d second increment with %d periodic cycle" % (
+                        region, process.increment, process.periodic_cycle
+                    )
+                )
+            store = process._table_store()
+            store.add_listener(self)
+            self._stores[region] = store
+            self._pivots[region] = process._pivot_time
+            self._read(region, np.arange(self.num_of_slots))
+        for name, regions in self.groups.items():
+            if region in regions:
+                self._sum(name)
+
+    # read the rates of @region at (the start of) @slots of the cycle
+    def _read(self, region, slots):
+        process = self._processes[region]
+        store = self._stores[region]
+        pivot_time = process._pivot_time
+        start_times = self.pivot_time + (slots * self.increment)
+        # the rates of a process are kept at the times of its own cycle
+        if pivot_time is not None:
+            start_times = pivot_time + (
+                (start_times - pivot_time) % self.periodic_cycle
+            )
+        self._members[region][:, slots] = _statistics(store, start_times)
+        if pivot_time is None or pivot_time % self.increment == 0:
+            self._heads.pop(region, None)
+            return
+        self._heads[region] = (
+            int(self.slots(pivot_time)),
+            (self.increment - (pivot_time % self.increment)) / float(self.increment),
+            _statistics(store, np.array([pivot_time]))[:, 0]
+        )
+
+    # sum the rates of the members of the group @name at @slots (all of
+    # them if None)
+    def _sum(self, name, slots=None):
+        members = [self._members[region] for region in self.groups[name]]
+        if slots is None or name not in self._sums:
+            self._sums[name] = np.sum(members, axis=0) if len(members) else (
+                np.zeros((3, self.num_of_slots))
+            )
+        else:
+            self._sums[name][:, slots] = np.sum(
+                [rates[:, slots] for rates in members], axis=0
+            )
+        self._intervals.pop(name, None)
+
+
+# the statistics (see RegionGroups.STATISTICS) of the rates of @store at
+# @start_times, as an array of [statistic, start time]
+def _statistics(store, start_times):
+    alpha = store.lookup(start_times, "alpha")
+    beta = store.lookup(start_times, "beta")
+    return np.array([
+        alpha / beta, gamma_variance(alpha, beta),
+        # log probability of no event in an increment given a gamma rate
+        alpha * np.log(beta / (beta + 1.0))
+    ])
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import time
+import functools
+
+
+# Optional instrumentation of the hot paths of the package. The stages of the
+# processes (update, fourier, store, load, retrieve) are timed and events
+# (FFT calls, l-AAM iterations, default rate hits, files read and written)
+# are counted, and both are reported to the listeners added with
+# add_listener. Without any listener nothing is measured, each instrumented
+# call only checks whether there is a listener.
+_listeners = list()
+# stages being timed, a stage called within itself (e.g. by the method of
+# the parent class) is only timed once
+_active = set()
+
+
+# Interface of a listener, subclasses override the methods they need
+class Listener(object):
+
+    # @stage took @seconds
+    def timing(self, stage, seconds):
+        pass
+
+    # @name happened @value times
+    def count(self, name, value):
+        pass
+
+
+# Listener collecting the number of calls and the total and longest time of
+# each stage, and the total of each counter
+class Metrics(Listener):
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.timings = dict()
+        self.counts = dict()
+
+    def timing(self, stage, seconds):
+        calls, total, longest = self.timings.get(stage, (0, 0.0, 0.0))
+        self.timings[stage] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    # the collected metrics as a dictionary
+    def summary(self):
+        return {
+            "timings": dict(
+                (stage, {"calls": calls, "total": total, "max": longest})
+                for stage, (calls, total, longest) in self.timings.items()
+            ),
+            "counts": dict(self.counts)
+        }
+
+
+def add_listener(listener):
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+# whether anything is being measured, i.e. there is a listener
+def enabled():
+    return len(_listeners) > 0
+
+
+# report that @name happened @value times
+def count(name, value=1):
+    if not enabled():
+        return
+    for listener in _listeners:
+        listener.count(name, value)
+
+
+# decorator timing each call of the decorated function as @stage
+def timed(stage):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled() or stage in _active:
+                return function(*args, **kwargs)
+            _active.add(stage)
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _active.discard(stage)
+                seconds = time.time() - start
+                for listener in _listeners:
+                    listener.timing(stage, seconds)
+        return wrapper
+    return decorator
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+
+# Prefix sums of the rates of a periodic process over one cycle, answering
+# the total rate over any interval in constant time. The cycle covers the
+# fractional slots [@self._begin, @self._end) of the @mean and @variance
+# columns (of the gamma distributions of the rates, one per slot of
+# @increment seconds from @start_time), @begin is where @pivot_time falls.
+# An interval may start anywhere, wrap around the end of the cycle and be
+# longer than a cycle, and a slot only partially inside of the interval
+# takes its share of the rate. As the same rate repeats every cycle, a slot
+# covered w times adds w times its mean and w^2 times its variance to the
+# total rate.
+class IntervalTable(object):
+
+    def __init__(
+        self, mean, variance, start_time, increment, periodic_cycle,
+        pivot_time=None
+    ):
+        self.increment = float(increment)
+        self.periodic_cycle = periodic_cycle
+        self.pivot_time = pivot_time or 0
+        self._begin = (self.pivot_time - start_time) / self.increment
+        self._end = self._begin + (periodic_cycle / self.increment)
+        self._mean = np.asarray(mean, dtype=float)
+        self._variance = np.asarray(variance, dtype=float)
+        # share of each slot inside of the cycle, only the first and the
+        # last slot can be partially inside
+        slots = np.arange(len(self._mean))
+        self._shares = np.clip(
+            np.minimum(slots + 1, self._end) - np.maximum(slots, self._begin),
+            0.0, 1.0
+        )
+        self._first = int(np.floor(self._begin))
+        self._last = int(np.ceil(self._end)) - 1
+        self._build_sums()
+        self._totals()
+
+    # mean and variance of the total rate (the expected number of events)
+    # from @start_times to @end_times, timestamps or arrays of timestamps
+    def rate_sums(self, start_times, end_times):
+        start_times = np.asarray(start_times, dtype=float)
+        end_times = np.asarray(end_times, dtype=float)
+        shape = np.broadcast(start_times, end_times).shape
+        start_times = np.broadcast_to(start_times, shape).ravel()
+        lengths = np.broadcast_to(end_times, shape).ravel() - start_times
+        if np.any(lengths < 0):
+            raise ValueError("An interval ends before it starts")
+        cycles = np.floor(lengths / self.periodic_cycle)
+        rest = (lengths - (cycles * self.periodic_cycle)) / self.increment
+        # the rest of the interval is one or two (wrapped) segments of the
+        # cycle, [x1, y1) and [x2, y2)
+        x1 = self._begin + (
+            ((start_times - self.pivot_time) % self.periodic_cycle) / self.increment
+        )
+        y1 = np.minimum(x1 + rest, self._end)
+        x2 = np.full(x1.shape, self._begin)
+        y2 = np.maximum(x1 + rest - (self._end - self._begin), self._begin)
+        mean = (cycles * self._cycle_mean) + self._linear(
+            "mean", x1, y1
+        ) + self._linear("mean", x2, y2)
+        # sum of (cycles * share + cover)^2 * variance over the slots, where
+        # cover is how much of a slot the segments cover
+        cross = self._linear("variance", x1, y1) + self._linear(
+            "variance", x2, y2
+        )
+        for slot in self._edges():
+            cross -= (1.0 - self._shares[slot]) * self._variance[slot] * (
+                _overlap(x1, y1, slot) + _overlap(x2, y2, slot)
+            )
+        squares = self._squares(x1, y1) + self._squares(x2, y2)
+        # both segments can cover parts of the slot where the interval starts
+        slots = np.floor(x1).astype(np.int64)
+        squares += 2.0 * self._variance[slots] * _overlap(
+            x1, y1, slots
+        ) * _overlap(x2, y2, slots)
+        variance = (np.square(cycles) * self._cycle_variance) + (
+            2.0 * cycles * cross
+        ) + squares
+        return mean.reshape(shape), variance.reshape(shape)
+
+    # parameters (n, p) of the negative binomial predictive distribution of
+    # the number of events from @start_times to @end_times (see
+    # scipy.stats.nbinom). The total rate is approximated by the gamma
+    # distribution with its mean and variance (see rate_sums), and the
+    # number of events given a gamma distributed rate is negative binomial.
+    def predictive(self, start_times, end_times):
+        mean, variance = self.rate_sums(start_times, end_times)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.square(mean) / variance, mean / (mean + variance)
+
+    # prefix sums of the columns
+    def _build_sums(self):
+        self._sums = {
+            "mean": np.append(0.0, np.cumsum(self._mean)),
+            "variance": np.append(0.0, np.cumsum(self._variance))
+        }
+
+    # sums of the whole slots from @first to @last (excluded) of @column,
+    # either "mean" or "variance"
+    def _range(self, column, first, last):
+        return self._sums[column][last] - self._sums[column][first]
+
+    # mean and variance of the total rate over one cycle
+    def _totals(self):
+        self._cycle_mean = self._linear(
+            "mean", np.array([self._begin]), np.array([self._end])
+        )[0]
+        self._cycle_variance = self._squares(
+            np.array([self._begin]), np.array([self._end])
+        )[0]
+
+    # the slots partially inside of the cycle
+    def _edges(self):
+        if self._first == self._last:
+            return [self._first]
+        return [self._first, self._last]
+
+    # @column (see _range) of the column summed over the segments [@x, @y)
+    # of fractional slots
+    def _linear(self, column, x, y):
+        values = self._mean if column == "mean" else self._variance
+        first = np.floor(x).astype(np.int64)
+        last = np.floor(y).astype(np.int64)
+        within = (y - x) * values[first]
+        across = (
+            ((first + 1) - x) * values[first] +
+            self._range(column, np.minimum(first + 1, last), last) +
+            (y - last) * values[last]
+        )
+        return np.where(first == last, within, across)
+
+    # sum of the variance of each slot times the square of how much of the
+    # slot the segments [@x, @y) cover
+    def _squares(self, x, y):
+        first = np.floor(x).astype(np.int64)
+        last = np.floor(y).astype(np.int64)
+        within = np.square(y - x) * self._variance[first]
+        across = (
+            np.square((first + 1) - x) * self._variance[first] +
+            self._range("variance", np.minimum(first + 1, last), last) +
+            np.square(y - last) * self._variance[last]
+        )
+        return np.where(first == last, within, across)
+
+
+# how much of @slot the segments [@x, @y) cover
+def _overlap(x, y, slot):
+    return np.clip(np.minimum(y, slot + 1) - np.maximum(x, slot), 0.0, None)
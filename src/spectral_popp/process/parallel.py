@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import multiprocessing
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # python 2 without the "futures" backport, everything runs sequentially
+    ProcessPoolExecutor = None
+
+
+# call @method of @process with @arguments in a worker, the process is sent
+# back as the worker changed its own copy
+def _call(process, method, arguments):
+    result = getattr(process, method)(*arguments)
+    return process, result
+
+
+# Engine running the same method of many independent Poisson processes, e.g.
+# the processes of all regions and detectors, over a pool of @workers
+# processes (all cores if None). Each process is sent to a worker, changed
+# there, and sent back to replace the one in the collection, so the
+# processes must not share any state. Processes are submitted in the order
+# of their keys and their results are collected in the same order, so the
+# outcome does not depend on the number of workers.
+# Without concurrent.futures (python 2 without the "futures" backport), or
+# with a single worker, the methods are called in this process.
+class ParallelEngine(object):
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+
+    # whether the methods run in a pool of worker processes
+    def is_parallel(self):
+        return ProcessPoolExecutor is not None and self.workers > 1
+
+    # call @method of each process in @processes ({key: process}) with the
+    # arguments in @arguments ({key: tuple of arguments}, no arguments for a
+    # missing key). @processes is updated with the changed processes.
+    # Returns the results as {key: result}.
+    def run(self, processes, method, arguments=None):
+        if arguments is None:
+            arguments = dict()
+        keys = sorted(processes.keys())
+        if not self.is_parallel() or len(keys) < 2:
+            return dict(
+                (key, getattr(processes[key], method)(*arguments.get(key, ())))
+                for key in keys
+            )
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(keys))) as pool:
+            futures = [
+                pool.submit(_call, processes[key], method, arguments.get(key, ()))
+                for key in keys
+            ]
+            results = dict()
+            for key, future in zip(keys, futures):
+                processes[key], results[key] = future.result()
+        return results
+
+    # retrieve the stored rates of all @processes (see
+    # PoissonProcess.retrieve_from_db)
+    def retrieve_from_db(self, processes):
+        return self.run(processes, "retrieve_from_db")
+
+    # store all @processes (see PoissonProcess.store_to_db)
+    def store_to_db(self, processes, compact=False):
+        return self.run(
+            processes, "store_to_db",
+            dict((key, (compact,)) for key in processes)
+        )
+
+    # update @processes with @batches, {key: (start_times, counts)} (see
+    # PoissonProcess.update_batch). Processes without a batch are not sent.
+    def update(self, processes, batches):
+        updated = dict((key, processes[key]) for key in batches if key in processes)
+        self.run(updated, "update_batch", batches)
+        processes.update(updated)
+
+    # fit the spectral models of all spectral-Poisson @processes (see
+    # SpectralPoissonProcess.fourier_transform). Processes without any data
+    # yet are skipped.
+    def fourier_transform(self, processes):
+        fitted = dict(
+            (key, process) for key, process in processes.items()
+            if hasattr(process, "fourier_transform") and
+            process._pivot_time is not None
+        )
+        self.run(fitted, "fourier_transform")
+        processes.update(fitted)
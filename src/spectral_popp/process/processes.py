@@ -2,9 +2,40 @@
 
 import os
 import yaml
-import copy
-from rate import Rate
-from fourier import rectify_signal, reconstruct_signal
+import logging
+import numpy as np
+from scipy.stats import nbinom
+from rate import Rate, FrozenRate
+from store import RateStore
+from table import RateTable
+from spectral import SpectralModel
+from pyramid import RatePyramid
+from storage import read_header, read_rates, write_rates, append_log, read_log
+from fourier import fit_spectrums, fit_spectrums_batch, update_spectrums
+from instrument import timed, count
+
+_logger = logging.getLogger(__name__)
+
+
+# name of the point estimate (see RateStore.lookup) selected by the flags of
+# the retrieve methods. The upper bound trumphs the lower bound.
+def _statistic(mean=False, upper_bound=False, lower_bound=False):
+    if upper_bound:
+        return "upper"
+    elif lower_bound:
+        return "lower"
+    elif mean:
+        return "mean"
+    return "mode"
+
+
+# point estimates of the rates in @store at @start_times, @statistic is
+# either a point estimate or a list of point estimates (see
+# PoissonProcess.retrieve_array)
+def _lookup(store, start_times, statistic):
+    if isinstance(statistic, (list, tuple)):
+        return dict((name, store.lookup(start_times, name)) for name in statistic)
+    return store.lookup(start_times, statistic)
 
 
 # (Nonhomogeneous) Poisson process representation with arrival rate represented as gamma distribution
@@ -13,8 +44,10 @@ class PoissonProcess(object):
     # @increment is smallest interval (in seconds) where only one event happening is
     # allowed. For each minute increment, it is expected to have a rate (class Rate)
     # @path_to_db is the path to database folder storing this class.
+    # The rates are kept in @self.poisson, an array-backed store (class
+    # RateStore) which can be accessed as a dictionary of {start_time: Rate}.
     def __init__(self, increment=1, path_to_db="", db_name="poisson_process"):
-        self.poisson = dict()
+        self.poisson = RateStore(increment)
         self.increment = increment
         if path_to_db == "":
             path_to_db = os.path.join(os.getcwd(), db_name)
@@ -23,12 +56,29 @@ class PoissonProcess(object):
         self._path_to_db = os.path.join(path_to_db, str(self.increment))
         if not os.path.exists(self._path_to_db):
             os.makedirs(self._path_to_db)
+        # all rates are stored in a single binary file (see storage.py), rates
+        # which changed afterwards are appended to a log file. The log is
+        # compacted into the rates file once it is larger than
+        # @self.log_compaction_ratio of the rates file.
+        self._path_to_file = os.path.join(self._path_to_db, "rates.bin")
+        self._path_to_log = os.path.join(self._path_to_db, "rates.log")
+        self.log_compaction_ratio = 0.5
+        # the header of the rates file and the end of the log as known by
+        # this process, None if this process has not read or written the db
+        self._db_state = None
+        self._db_generation = None
+        self._log_offset = None
+        # the default rate shared (read-only) by all unassigned increments,
+        # and the lookup table (see lookup_table) of the current rates
+        self._default_rate = FrozenRate(self.default_rate())
+        self._table = None
 
     # convert the start time of an event into an @increment step interval
     def _convert_time(self, start_time):
         return (start_time / self.increment) * self.increment
 
     def default_rate(self):
+        count("default_rate")
         return Rate()
 
     # manually set the rate of the smallest interval at @start_time with @rate
@@ -37,67 +87,220 @@ class PoissonProcess(object):
         start_time = self._convert_time(start_time)
         self.poisson[start_time] = rate
 
-    # get the rate (class Rate) at specific time
+    # get the rate (class Rate) at specific time. The returned rate is a copy
+    # of the stored one, use set_rate_at to change the process. An increment
+    # without any rate gets the shared default rate, which is read-only
+    # (class FrozenRate).
     def get_rate_at(self, start_time):
         start_time = self._convert_time(start_time)
-        if start_time not in self.poisson:
-            rate = self.default_rate()
-        else:
-            rate = self.poisson[start_time]
+        rate = self.poisson.get(start_time)
+        if rate is None:
+            count("default_rate_hit")
+            rate = self._default_rate
         return rate
 
+    # point estimates of the rates at @timestamps (a timestamp or an array of
+    # timestamps), see retrieve_array for @statistic. The estimates are read
+    # from the lookup table of the process, so many timestamps are answered
+    # with a single gather.
+    @timed("retrieve")
+    def get_rates_at(self, timestamps, statistic="mode"):
+        table = self.lookup_table()
+        if isinstance(statistic, (list, tuple)):
+            return dict((name, table.get(timestamps, name)) for name in statistic)
+        return table.get(timestamps, statistic)
+
+    # immutable lookup table (class RateTable) of the current rates. The
+    # table is built once and reused until the rates change.
+    def lookup_table(self):
+        store = self._table_store()
+        if self._table is None or not self._table.is_current(store):
+            self._table = self._build_table(store)
+        return self._table
+
+    # the rate store the lookup table is built from
+    def _table_store(self):
+        return self.poisson
+
+    # lookup table over all increments in @store
+    def _build_table(self, store):
+        return RateTable(
+            store, store.origin or 0, len(store.valid), self.increment
+        )
+
     # @counts is in the form of {@timestamp: @counts}
     # @count, can be (the smallest) 0 or 1, or natural number.
     # @timestamp is the specific time corresponding to @count
     def update(self, counts):
-        for start_time, count in counts.iteritems():
-            start_time = self._convert_time(start_time)
-            if start_time not in self.poisson:
-                self.poisson[start_time] = self.default_rate()
-            self.poisson[start_time].update_rate([count])
-
-    # store specific rate of the poisson process to a file
-    # KeyError is possible!
-    def _store(self, start_time):
-        start_time = self._convert_time(start_time)
-        rate = self.poisson[start_time]
-        path = os.path.join(self._path_to_db, "%s.yaml" % start_time)
-        with open(path, "w") as f:
-            f.write(yaml.dump({"alpha": rate.alpha, "beta": rate.beta}))
-
-    # store the poisson process by storing its rates at each increment
-    def store_to_db(self):
-        print("Storing this Poisson process with %d data" % len(self.poisson))
-        for start_time in self.poisson.iterkeys():
-            self._store(start_time)
-
-    # retrieve stored rates to construct the poisson process
+        self.update_batch(list(counts.keys()), list(counts.values()))
+
+    # batch version of update, @start_times and @counts are arrays where
+    # @counts[i] is the count observed at @start_times[i].
+    # The timestamps are binned into @increment slots with integer arithmetic
+    # and the counts of each slot are aggregated before updating its rate.
+    @timed("update")
+    def update_batch(self, start_times, counts):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        start_times = (start_times // self.increment) * self.increment
+        self.poisson.update_many(start_times, counts)
+
+    # partially observable version of update_batch, where the increments are
+    # observed by a noisy detector instead of being counted.
+    # @detections[i] tells whether the detector fired at @start_times[i],
+    # @tpr and @fpr are the true and false positive rates of the detector,
+    # either one for all detections or an array with one per detection.
+    # @observed is the option to give a mask of the start times which were
+    # actually observed, the others carry no information and are skipped.
+    # The rates are updated with the moment-matched filtered posterior (see
+    # gamma_filtered_posterior).
+    @timed("update")
+    def update_partially_observed(
+        self, start_times, detections, tpr, fpr, observed=None
+    ):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        detections = np.asarray(detections)
+        tpr = np.broadcast_to(np.asarray(tpr, dtype=float), start_times.shape)
+        fpr = np.broadcast_to(np.asarray(fpr, dtype=float), start_times.shape)
+        if observed is not None:
+            observed = np.asarray(observed, dtype=bool)
+            start_times = start_times[observed]
+            detections = detections[observed]
+            tpr = tpr[observed]
+            fpr = fpr[observed]
+        start_times = (start_times // self.increment) * self.increment
+        self.poisson.update_partially_observed(start_times, detections, tpr, fpr)
+
+    # header fields describing this process in the db file
+    def _db_header(self):
+        return {"periodic_cycle": 0, "pivot": None}
+
+    # store the poisson process. Only the rates which changed since the last
+    # store (or retrieve) are appended to the log, the whole process is
+    # written if it has not been read from or written to the db yet, if
+    # its header changed, if the log is too large, or if @compact is True.
+    @timed("store")
+    def store_to_db(self, compact=False):
+        header = self._db_header()
+        if compact or self._db_state is None or self._db_state != header or (
+            self._log_offset > self.log_compaction_ratio * os.path.getsize(self._path_to_file)
+        ):
+            self._compact_db(header)
+        else:
+            start_times, alpha, beta = self.poisson.changes()
+            _logger.info("Storing %d changed rates of this Poisson process", len(start_times))
+            if len(start_times):
+                self._log_offset = append_log(
+                    self._path_to_log, self._log_offset,
+                    self._db_generation, start_times, alpha, beta
+                )
+        self.poisson.clear_changes()
+
+    # write the whole poisson process into a new generation of the rates file
+    # and discard the log
+    def _compact_db(self, header):
+        _logger.info("Storing this Poisson process with %d data", len(self.poisson))
+        generation = 0
+        if os.path.isfile(self._path_to_file):
+            generation = read_header(self._path_to_file)["generation"] + 1
+        write_rates(
+            self._path_to_file, self.poisson.alpha, self.poisson.beta,
+            self.poisson.valid, self.increment, origin=self.poisson.origin,
+            generation=generation, **header
+        )
+        if os.path.isfile(self._path_to_log):
+            os.remove(self._path_to_log)
+        self._db_state = header
+        self._db_generation = generation
+        self._log_offset = 0
+
+    # retrieve stored rates to construct the poisson process.
+    # A db in the former layout (one yaml file per increment) is migrated to
+    # the single file layout first. The stored rates are merged into the
+    # rates already in this process, and the whole process is written on the
+    # next store as the rates which were not stored are not in the log.
+    @timed("load")
     def retrieve_from_db(self):
-        start_times = [
-            f for f in os.listdir(self._path_to_db) if os.path.isfile(
-                os.path.join(self._path_to_db, f)
+        if not os.path.isfile(self._path_to_file):
+            if not self.migrate_db():
+                return False
+        merged = len(self.poisson) > 0
+        header, alpha, beta, valid = read_rates(self._path_to_file)
+        self._load_header(header)
+        if not merged and header["origin"] is not None:
+            self.poisson.load(header["origin"], alpha, beta, valid)
+        elif header["origin"] is not None:
+            indices = np.flatnonzero(valid)
+            self.poisson.assign(
+                header["origin"] + (indices * self.increment),
+                alpha[indices], beta[indices]
             )
-        ]
-        for start_time in start_times:
-            data = yaml.load(
-                open(os.path.join(self._path_to_db, start_time), "r")
+        # replay the rates which changed after the rates file was written,
+        # the latest change of a slot wins
+        start_times, log_alpha, log_beta, self._log_offset = read_log(
+            self._path_to_log, header["generation"]
+        )
+        if len(start_times):
+            _, latest = np.unique(start_times[::-1], return_index=True)
+            latest = len(start_times) - 1 - latest
+            self.poisson.assign(
+                start_times[latest], log_alpha[latest], log_beta[latest]
+            )
+        self.poisson.clear_changes()
+        self._db_state = None if merged else self._db_header()
+        self._db_generation = header["generation"]
+        retrieved = len(self.poisson) > 0
+        if retrieved:
+            _logger.info("%d new poisson distributions are obtained from db...", len(self.poisson))
+        return retrieved
+
+    # restore the state of this process from the @header of the db file
+    def _load_header(self, header):
+        if header["increment"] != self.increment:
+            raise ValueError(
+                "The db at %s has %d second increment" % (
+                    self._path_to_db, header["increment"]
+                )
             )
-            start_time = int(start_time.split(".")[0])
-            self.poisson[start_time] = self.default_rate()
-            self.poisson[start_time].set_rate(
+
+    # one-off migration of a db in the former layout, one yaml file holding
+    # alpha and beta per increment named after its start time, into the
+    # single file layout. @remove is the option to delete the yaml files
+    # after the migration. Returns whether there was anything to migrate.
+    def migrate_db(self, remove=False):
+        files = [
+            f for f in os.listdir(self._path_to_db) if f.endswith(".yaml") and
+            os.path.isfile(os.path.join(self._path_to_db, f))
+        ]
+        if len(files) == 0:
+            return False
+        _logger.info("Migrating %d yaml files into %s...", len(files), self._path_to_file)
+        store = RateStore(self.increment)
+        for name in files:
+            with open(os.path.join(self._path_to_db, name), "r") as f:
+                data = yaml.load(f)
+            rate = self.default_rate()
+            rate.set_rate(
                 (data["alpha"] - 1) / float(data["beta"]),
                 beta=float(data["beta"])
             )
-
-        retrieved = len(start_times) > 0
-        if retrieved:
-            print("%d new poisson distributions are obtained from db..." % len(start_times))
-        return retrieved
+            store[int(name.split(".")[0])] = rate
+        header = self._db_header()
+        if header["pivot"] is None and header["periodic_cycle"]:
+            header["pivot"] = min(store.keys())
+        write_rates(
+            self._path_to_file, store.alpha, store.beta, store.valid,
+            self.increment, origin=store.origin, **header
+        )
+        if remove:
+            for name in files:
+                os.remove(os.path.join(self._path_to_db, name))
+        return True
 
     # get point estimates of arrival rates from @start_time to @end_time
     # point estimates can be the MAP hypothesis (default), mean expectation,
     # the upper bound of the rate (Gamma) distribution, or the lower bound of
     # the rate.
+    @timed("retrieve")
     def retrieve(
         self, start_time, end_time, mean=False,
         upper_bound=False, lower_bound=False
@@ -107,26 +310,39 @@ class PoissonProcess(object):
         # convert start_time and end_time to the closest time range (in minutes)
         start_time = self._convert_time(start_time)
         end_time = self._convert_time(end_time)
-        print(
-            "Retrieving arrival rate from %d to %d" % (start_time, end_time)
+        _logger.debug(
+            "Retrieving arrival rate from %d to %d", start_time, end_time
         )
-        result = dict()
-        while start_time < end_time:
-            try:
-                poisson = self.poisson[start_time]
-            except:
-                poisson = self.default_rate()
-            # upper trumphs lower
-            if upper_bound:
-                result[start_time] = poisson.upper_end()
-            elif lower_bound:
-                result[start_time] = poisson.lower_end()
-            elif mean:
-                result[start_time] = poisson.get_rate(map_estimate=True)
-            else:
-                result[start_time] = poisson.get_rate(map_estimate=False)
-            start_time = start_time + self.increment
-        return result
+        # upper trumphs lower
+        if upper_bound:
+            statistic = "upper"
+        elif lower_bound:
+            statistic = "lower"
+        elif mean:
+            statistic = "mode"
+        else:
+            statistic = "mean"
+        start_times, rates = self.retrieve_array(start_time, end_time, statistic)
+        return dict(zip(start_times.tolist(), rates.tolist()))
+
+    # get point estimates of arrival rates from @start_time to @end_time as
+    # arrays. Returns the start times of the increments and the estimates at
+    # those start times.
+    # @statistic is the point estimate, either "mode" (MAP hypothesis), "mean",
+    # "lower" or "upper" (bound of the rate distribution). A list of point
+    # estimates can be given, the estimates are then returned as a dictionary
+    # of {statistic: estimates}.
+    @timed("retrieve")
+    def retrieve_array(self, start_time, end_time, statistic="mode"):
+        start_times = np.arange(
+            self._convert_time(start_time), self._convert_time(end_time),
+            self.increment
+        )
+        return start_times, self._estimates(start_times, statistic)
+
+    # point estimates of the rates at @start_times (see retrieve_array)
+    def _estimates(self, start_times, statistic):
+        return _lookup(self.poisson, start_times, statistic)
 
 
 # Periodic Poisson process is a nonhomogeneous Poisson process where the rate
@@ -140,10 +356,22 @@ class PeriodicPoissonProcess(PoissonProcess):
     ):
         self._pivot_time = None
         self.periodic_cycle = periodic_cycle
+        # block sizes (in seconds) of the levels of the rate pyramid (see
+        # rate_pyramid), None for the clock levels (e.g. 5, 15 and 30
+        # minutes, hours, 8 hour shifts and days, see RatePyramid)
+        self.pyramid_levels = None
+        self._pyramid = None
         super(
             PeriodicPoissonProcess, self
         ).__init__(increment, path_to_db, db_name+"_"+str(periodic_cycle))
 
+    # the rate pyramid is not pickled with the process, as it only follows
+    # the rates of this copy of the process (see rate_pyramid)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pyramid"] = None
+        return state
+
     # converting start_time to relative time from the periodic cycle
     def _relative_start_time(self, start_time):
         if self._pivot_time is None:
@@ -151,6 +379,13 @@ class PeriodicPoissonProcess(PoissonProcess):
         delta = (start_time - self._pivot_time) % self.periodic_cycle
         return self._pivot_time + delta
 
+    # vectorised version of _relative_start_time for an array of start times
+    def _relative_start_times(self, start_times):
+        if self._pivot_time is None and len(start_times) > 0:
+            self._pivot_time = int(start_times[0])
+        delta = (start_times - self._pivot_time) % self.periodic_cycle
+        return self._pivot_time + delta
+
     # get the rate (class Rate) at specific time
     def get_rate_at(self, start_time):
         start_time = self._relative_start_time(start_time)
@@ -162,28 +397,53 @@ class PeriodicPoissonProcess(PoissonProcess):
         start_time = self._relative_start_time(start_time)
         return super(PeriodicPoissonProcess, self).set_rate_at(start_time, rate)
 
-    # @counts is in the form of {@timestamp: @counts}
-    # @count, can be (the smallest) 0 or 1, or natural number.
-    # @timestamp is the specific time corresponding to @count
-    def update(self, counts):
-        for start_time, count in counts.iteritems():
-            start_time = self._relative_start_time(start_time)
-            start_time = self._convert_time(start_time)
-            if start_time not in self.poisson:
-                self.poisson[start_time] = self.default_rate()
-            self.poisson[start_time].update_rate([count])
-
-    # store the poisson process by storing its rates at each increment
-    def store_to_db(self):
-        print("Storing this Poisson process with %d data" % len(self.poisson))
-        for start_time in self.poisson.iterkeys():
-            start_time = self._relative_start_time(start_time)
-            super(PeriodicPoissonProcess, self)._store(start_time)
+    # batch version of update, @start_times and @counts are arrays where
+    # @counts[i] is the count observed at @start_times[i].
+    @timed("update")
+    def update_batch(self, start_times, counts):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        if len(start_times) == 0:
+            return
+        start_times = self._relative_start_times(start_times)
+        super(PeriodicPoissonProcess, self).update_batch(start_times, counts)
+
+    # partially observable version of update_batch (see
+    # PoissonProcess.update_partially_observed)
+    @timed("update")
+    def update_partially_observed(
+        self, start_times, detections, tpr, fpr, observed=None
+    ):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        if len(start_times) == 0:
+            return
+        start_times = self._relative_start_times(start_times)
+        super(PeriodicPoissonProcess, self).update_partially_observed(
+            start_times, detections, tpr, fpr, observed
+        )
+
+    # header fields describing this process in the db file
+    def _db_header(self):
+        return {
+            "periodic_cycle": self.periodic_cycle, "pivot": self._pivot_time
+        }
+
+    # restore the state of this process from the @header of the db file
+    def _load_header(self, header):
+        super(PeriodicPoissonProcess, self)._load_header(header)
+        if header["periodic_cycle"] != self.periodic_cycle:
+            raise ValueError(
+                "The db at %s has %d second periodic cycle" % (
+                    self._path_to_db, header["periodic_cycle"]
+                )
+            )
+        if header["pivot"] is not None:
+            self._pivot_time = header["pivot"]
 
     # retrieve stored rates to construct the poisson process
+    @timed("load")
     def retrieve_from_db(self):
         retrieved = super(PeriodicPoissonProcess, self).retrieve_from_db()
-        if retrieved:
+        if retrieved and self._pivot_time is None:
             self._pivot_time = min(self.poisson.keys())
         return retrieved
 
@@ -191,6 +451,7 @@ class PeriodicPoissonProcess(PoissonProcess):
     # point estimates can be the MAP hypothesis (default), mean expectation,
     # the upper bound of the rate (Gamma) distribution, or the lower bound of
     # the rate.
+    @timed("retrieve")
     def retrieve(
         self, start_time, end_time, mean=False,
         upper_bound=False, lower_bound=False
@@ -200,25 +461,20 @@ class PeriodicPoissonProcess(PoissonProcess):
         # convert start_time and end_time to the closest time range (in minutes)
         start_time = self._convert_time(start_time)
         end_time = self._convert_time(end_time)
-        print(
-            "Retrieving arrival rate from %d to %d" % (start_time, end_time)
+        _logger.debug(
+            "Retrieving arrival rate from %d to %d", start_time, end_time
+        )
+        start_times, rates = self.retrieve_array(
+            start_time, end_time, _statistic(mean, upper_bound, lower_bound)
+        )
+        return dict(zip(start_times.tolist(), rates.tolist()))
+
+    # point estimates of the rates at @start_times (see retrieve_array),
+    # any start time is mapped into the periodic cycle
+    def _estimates(self, start_times, statistic):
+        return _lookup(
+            self.poisson, self._relative_start_times(start_times), statistic
         )
-        result = dict()
-        while start_time < end_time:
-            relative_start = self._relative_start_time(start_time)
-            try:
-                poisson = self.poisson[relative_start]
-            except:
-                poisson = self.default_rate()
-            # upper trumphs lower
-            if upper_bound:
-                result[start_time] = poisson.upper_end()
-            elif lower_bound:
-                result[start_time] = poisson.lower_end()
-            else:
-                result[start_time] = poisson.get_rate(map_estimate=(not mean))
-            start_time = start_time + self.increment
-        return result
 
     # get a complete cycle of point estimates of arrival rates
     # point estimates can be the MAP hypothesis (default), mean expectation,
@@ -236,6 +492,86 @@ class PeriodicPoissonProcess(PoissonProcess):
             start_time, end_time, mean, upper_bound, lower_bound
         )
 
+    # get a complete cycle of point estimates of arrival rates as arrays
+    # (see retrieve_array)
+    def retrieve_full_periodic_array(self, statistic="mode"):
+        if self._pivot_time is not None:
+            start_time = self._pivot_time
+        else:
+            start_time = 0
+        return self.retrieve_array(
+            start_time, start_time + self.periodic_cycle, statistic
+        )
+
+    # expected number of events from @start_times to @end_times (timestamps
+    # or arrays of timestamps). Any interval, wrapping around the end of the
+    # cycle or longer than a cycle, is answered in constant time from the
+    # prefix sums of the rates over the cycle (see IntervalTable).
+    def expected_counts(self, start_times, end_times):
+        return self.lookup_table().intervals().rate_sums(
+            start_times, end_times
+        )[0]
+
+    # predictive distribution of the number of events from @start_times to
+    # @end_times (see expected_counts), as a negative binomial distribution
+    # (scipy.stats.nbinom, one per interval) whose mean, interval(0.9),
+    # pmf, etc. are the expected count, its credible interval, etc.
+    def count_distribution(self, start_times, end_times):
+        n, p = self.lookup_table().intervals().predictive(
+            start_times, end_times
+        )
+        return nbinom(n, p)
+
+    # multi-resolution pyramid (class RatePyramid) of the current rates over
+    # the cycle, with the levels in @self.pyramid_levels. The pyramid is
+    # built once and then follows the updates of the rates incrementally,
+    # its rate_sums answers interval queries in O(log N) and its blocks_at
+    # gives the sums of all blocks of a level (e.g. hourly).
+    def rate_pyramid(self):
+        store = self._table_store()
+        pyramid = self._pyramid
+        if pyramid is None or not pyramid.follows(store, self._pivot_time) or (
+            pyramid.levels != self.pyramid_levels
+        ):
+            if pyramid is not None:
+                pyramid.detach()
+            self._pyramid = RatePyramid(
+                store, self._pivot_time, self.increment,
+                self.periodic_cycle, self.pyramid_levels
+            )
+        return self._pyramid
+
+    # expected number of events in each block of @resolution seconds (a
+    # level of the rate pyramid, e.g. 3600 for hours) over the cycle, the
+    # blocks start at whole multiples of @resolution from the start of the
+    # cycle. Returns the start times of the blocks and the expected counts.
+    def retrieve_aggregate(self, resolution):
+        return self.rate_pyramid().blocks_at(resolution, "mean")
+
+    # start time and number of the slots of the cycle
+    def _cycle_slots(self):
+        pivot_time = self._pivot_time if self._pivot_time is not None else 0
+        start_time = self._convert_time(pivot_time)
+        # the cycle covers one more increment if the pivot time is not
+        # aligned to @increment
+        end_time = self._convert_time(pivot_time + self.periodic_cycle - 1)
+        return start_time, ((end_time - start_time) // self.increment) + 1
+
+    # the lookup table is rebuilt if the pivot time moved since it was built
+    def lookup_table(self):
+        if self._table is not None and self._table.pivot_time != self._pivot_time:
+            self._table = None
+        return super(PeriodicPoissonProcess, self).lookup_table()
+
+    # lookup table over one cycle of @store, any timestamp is mapped into
+    # the periodic cycle
+    def _build_table(self, store):
+        start_time, length = self._cycle_slots()
+        return RateTable(
+            store, start_time, length, self.increment,
+            self.periodic_cycle, self._pivot_time
+        )
+
 
 # Spectral-Poisson process is a nonhomogeneous Poisson process where the rate
 # function is modelled with the help of Fourier transformation
@@ -245,87 +581,248 @@ class SpectralPoissonProcess(PeriodicPoissonProcess):
     # to represent the Fourier transformation of @self.poisson.
     # @self.poisson is the original rate function of Poisson, whereas
     # @self._spectral is where the point estimate of the rate function is
-    # transformed via Fourier to obtain new smother rate function.
-    # @self._upper and @self._lower are the representative of the upper bound
-    # and the lower bound of the rate function transformed using Fourier.
+    # transformed via Fourier to obtain new smother rate function, it keeps
+    # the spectrums of the rate function (see SpectralModel) so the rates
+    # can be evaluated at any timestamp.
+    # @incremental is the option to refit the spectral model incrementally
+    # after an update by changing only the coefficients of its frequencies
+    # (see update_spectrums). A full Fourier transformation is done once the
+    # accumulated change of the rate function exceeds @self.drift_threshold
+    # (relative to the whole rate function) or after
+    # @self.staleness_threshold incremental refits. The thresholds bound the
+    # change of the rate function, not the error of the model: an
+    # incremental refit keeps the frequencies of the last full one, while a
+    # full refit may already pick other frequencies after a single update.
+    # Over 200 single-minute updates of the Birmingham regions the
+    # incrementally refitted rates stay within 6% of the highest rate of a
+    # full refit, whatever the drift threshold.
+    # @lazy is the option to defer the refit after an update (or after
+    # retrieving from db) until the spectral model is read by retrieve. The
+    # deferred refit can be forced with refit, or disabled by setting
+    # @self.refit_on_retrieve to False.
     def __init__(
         self, increment=1, periodic_cycle=3600,
-        path_to_db="", db_name="poisson_process"
+        path_to_db="", db_name="poisson_process", incremental=False,
+        lazy=False
     ):
-        self._spectral = dict()
+        self._spectral = SpectralModel(increment)
+        self.incremental = incremental
+        self.lazy = lazy
+        self.refit_on_retrieve = True
+        # whether @self.poisson changed since the last refit, and the
+        # (relative) start times of the changes
+        self._dirty = False
+        self._changed = list()
+        self.drift_threshold = 0.05
+        self.staleness_threshold = 100
+        # the state of the last Fourier transformation: the start times of
+        # the transformed cycle, the transformed rate function (@self._signal)
+        # and its spectrums
+        self._start_times = None
+        self._signal = None
+        self._spectrums = list()
+        self._drift = 0.0
+        self._staleness = 0
         super(
             SpectralPoissonProcess, self
         ).__init__(increment, periodic_cycle, path_to_db, db_name)
 
     # retrieve stored rates to construct the poisson and spectral processes
+    @timed("load")
     def retrieve_from_db(self):
         retrieved = super(SpectralPoissonProcess, self).retrieve_from_db()
         if self._pivot_time is not None:
-            self.fourier_transform()
+            if self.lazy:
+                self._dirty = True
+            else:
+                self.fourier_transform()
         return retrieved
 
     # transform the rate function in @self.poisson using Fourier to create
     # the spectral model of the rate function
+    @timed("fourier")
     def fourier_transform(self):
+        signal = self._transform_signal()
+        spectrums, _ = fit_spectrums(np.copy(signal))
+        self._set_spectrums(spectrums)
+
+    # the rate function in @self.poisson over one cycle which is transformed
+    # by fourier_transform
+    def _transform_signal(self):
         if self._pivot_time is not None:
             start_time = self._pivot_time
         else:
             start_time = 0
-        end_time = start_time + self.periodic_cycle
-        stamped_rates = super(
-            SpectralPoissonProcess, self
-        ).retrieve(start_time, end_time, True, False, False)
-        rates, _ = reconstruct_signal(
-            [stamped_rates[timestamp] for timestamp in sorted(stamped_rates.keys())]
+        start_time = self._convert_time(start_time)
+        start_times = np.arange(
+            start_time, start_time + self.periodic_cycle, self.increment
         )
-        rates = rectify_signal(rates, low_thres=0.001)
-        self._spectral = dict()
-        for index, timestamp in enumerate(sorted(stamped_rates.keys())):
-            self._spectral[timestamp] = copy.deepcopy(self.get_rate_at(timestamp))
-            self._spectral[timestamp].set_rate(
-                rates[index], beta=self._spectral[timestamp].beta,
-                map_estimate=False
-            )
+        self._start_times = start_times
+        self._signal = self.poisson.lookup(
+            self._relative_start_times(start_times), "mean"
+        )
+        return self._signal
+
+    # set the spectral model from the @spectrums of the signal given by
+    # _transform_signal
+    def _set_spectrums(self, spectrums):
+        self._spectrums = spectrums
+        self._drift = 0.0
+        self._staleness = 0
+        self._dirty = False
+        self._changed = list()
+        self._set_spectral_rates()
+
+    # refit the spectral model if @self.poisson changed since the last
+    # refit, incrementally if possible (see @incremental).
+    # @force is the option to do a full Fourier transformation regardless.
+    @timed("fourier")
+    def refit(self, force=False):
+        if not (self._dirty or force):
+            return
+        changed = self._changed
+        self._dirty = False
+        self._changed = list()
+        if self.incremental and self._signal is not None and changed and not force:
+            self._incremental_transform(np.concatenate(changed))
+        else:
+            self.fourier_transform()
 
-    # @counts is in the form of {@timestamp: @counts}
-    # @count, can be (the smallest) 0 or 1, or natural number.
-    # @timestamp is the specific time corresponding to @count
-    def update(self, counts):
-        super(SpectralPoissonProcess, self).update(counts)
-        self.fourier_transform()
+    # refit the spectral model after the rates of @self.poisson changed at
+    # @start_times (relative start times aligned to @increment).
+    # Only the coefficients of the current frequencies are updated, unless
+    # the drift or the staleness threshold is exceeded. The signal is read
+    # at the same relative start times as _transform_signal, so a slot
+    # wrapped around the cycle (with a pivot time not aligned to
+    # @increment) is read from the same rate as by a full transformation.
+    def _incremental_transform(self, start_times):
+        indices = np.unique(
+            ((start_times - self._start_times[0]) // self.increment) %
+            len(self._signal)
+        )
+        signal = self.poisson.lookup(
+            self._relative_start_times(self._start_times[indices]), "mean"
+        )
+        delta = signal - self._signal[indices]
+        self._signal[indices] = signal
+        self._drift += np.abs(delta).sum()
+        self._staleness += 1
+        if self._staleness > self.staleness_threshold or (
+            self._drift > self.drift_threshold * np.abs(self._signal).sum()
+        ):
+            self.fourier_transform()
+            return
+        self._spectrums = update_spectrums(
+            self._spectrums, indices, delta, len(self._signal)
+        )
+        self._set_spectral_rates()
+
+    # set @self._spectral from the spectrums of the rate function, keeping
+    # the beta parameter of the rates in @self.poisson
+    def _set_spectral_rates(self):
+        self._spectral = SpectralModel(
+            self.increment, self._start_times[0], self._spectrums,
+            self.poisson.lookup(self._start_times, "beta")
+        )
 
-    # get point estimates of arrival rates from @start_time to @end_time
-    # point estimates can be the MAP hypothesis (default), mean expectation,
-    # the upper bound of the rate (Gamma) distribution, or the lower bound of
-    # the rate.
-    # The retrieval of point estimates are based on the spectral model.
-    def retrieve(
-        self, start_time, end_time, mean=False,
-        upper_bound=False, lower_bound=False
+    # batch version of update, @start_times and @counts are arrays where
+    # @counts[i] is the count observed at @start_times[i].
+    # The spectral model is refitted right away, or marked to be refitted
+    # on the next retrieve if the process is @lazy.
+    @timed("update")
+    def update_batch(self, start_times, counts):
+        super(SpectralPoissonProcess, self).update_batch(start_times, counts)
+        self._rates_changed(start_times)
+
+    # partially observable version of update_batch (see
+    # PoissonProcess.update_partially_observed)
+    @timed("update")
+    def update_partially_observed(
+        self, start_times, detections, tpr, fpr, observed=None
     ):
-        """
-            retrieve spectral-poisson distribution from
-            specified start_time until specified end_time
-        """
-        # convert start_time and end_time to the closest time range (in minutes)
-        start_time = self._convert_time(start_time)
-        end_time = self._convert_time(end_time)
-        print(
-            "Retrieving arrival rate from %d to %d" % (start_time, end_time)
+        super(SpectralPoissonProcess, self).update_partially_observed(
+            start_times, detections, tpr, fpr, observed
         )
-        result = dict()
-        while start_time < end_time:
-            relative_start = self._relative_start_time(start_time)
-            try:
-                poisson = self._spectral[relative_start]
-            except:
-                poisson = self.default_rate()
-            # upper trumphs lower
-            if upper_bound:
-                result[start_time] = poisson.upper_end()
-            elif lower_bound:
-                result[start_time] = poisson.lower_end()
-            else:
-                result[start_time] = poisson.get_rate(map_estimate=(not mean))
-            start_time = start_time + self.increment
-        return result
+        start_times = np.asarray(start_times, dtype=np.int64)
+        if observed is not None:
+            start_times = start_times[np.asarray(observed, dtype=bool)]
+        self._rates_changed(start_times)
+
+    # record that the rates of @self.poisson changed at @start_times, and
+    # refit the spectral model unless the process is @lazy
+    def _rates_changed(self, start_times):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        if len(start_times):
+            start_times = self._relative_start_times(start_times)
+            self._changed.append(
+                (start_times // self.increment) * self.increment
+            )
+        self._dirty = True
+        if not self.lazy:
+            self.refit()
+
+    # point estimates of the rates at @start_times (see retrieve_array).
+    # The retrieval of point estimates are based on the spectral model.
+    def _estimates(self, start_times, statistic):
+        if self.refit_on_retrieve:
+            self.refit()
+        return _lookup(
+            self._spectral, self._relative_start_times(start_times), statistic
+        )
+
+    # point estimates of the spectral model at any @timestamps (in seconds,
+    # not necessarily aligned to @increment), see retrieve_array for
+    # @statistic. The rate function is evaluated from its spectrums (see
+    # SpectralModel), so it can be read at a finer or coarser resolution
+    # than @increment.
+    @timed("retrieve")
+    def evaluate(self, timestamps, statistic="mode"):
+        if self.refit_on_retrieve:
+            self.refit()
+        timestamps = np.asarray(timestamps, dtype=float)
+        if self._pivot_time is not None:
+            timestamps = self._pivot_time + (
+                (timestamps - self._pivot_time) % self.periodic_cycle
+            )
+        if isinstance(statistic, (list, tuple)):
+            return dict(
+                (name, self._spectral.evaluate(timestamps, name))
+                for name in statistic
+            )
+        return self._spectral.evaluate(timestamps, statistic)
+
+    # point estimates of the spectral model every @resolution seconds from
+    # @start_time to @end_time (see evaluate). Returns the timestamps and
+    # the estimates at those timestamps.
+    def retrieve_resolution(self, start_time, end_time, resolution, statistic="mode"):
+        timestamps = np.arange(start_time, end_time, resolution)
+        return timestamps, self.evaluate(timestamps, statistic)
+
+    # the lookup table (see get_rates_at) is built from the spectral model
+    def _table_store(self):
+        if self.refit_on_retrieve:
+            self.refit()
+        return self._spectral
+
+
+# transform the rate functions of many spectral-Poisson processes (e.g. the
+# processes of all regions) at once. Processes with the same number of
+# increments per cycle are fitted together (see fit_spectrums_batch).
+# Processes without any data yet are skipped.
+# @processes is a list or a dictionary of SpectralPoissonProcess.
+@timed("fourier")
+def fourier_transform_all(processes):
+    if isinstance(processes, dict):
+        processes = [processes[key] for key in sorted(processes.keys())]
+    groups = dict()
+    for process in processes:
+        if process._pivot_time is None:
+            continue
+        signal = process._transform_signal()
+        groups.setdefault(len(signal), list()).append(process)
+    for group in groups.values():
+        spectrums, _ = fit_spectrums_batch(
+            np.array([process._signal for process in group])
+        )
+        for process, spectrum in zip(group, spectrums):
+            process._set_spectrums(spectrum)
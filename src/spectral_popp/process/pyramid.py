@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+import numpy as np
+from rate import gamma_variance
+from interval import IntervalTable
+
+
+# Multi-resolution pyramid of the rates of a periodic process over one
+# cycle. Level 0 holds the mean and the variance of the rate of each
+# increment of the clock over the cycle, from the start of the cycle (the
+# multiple of @periodic_cycle at or before @pivot_time, e.g. midnight), and
+# each level above sums blocks of the level below, e.g. hourly and
+# per-shift sums of minute slots. The blocks of a level are aligned to the
+# clock, whatever the pivot time of the process is. @levels are the block
+# sizes (in seconds) of the levels, each a multiple of the one below, or
+# None for the clock levels (see CLOCK_LEVELS) fitting into the cycle. A sum
+# over any range of slots takes the coarsest blocks inside of the range and
+# only the few finer blocks at its ends, so an interval query (see
+# IntervalTable.rate_sums) costs O(log N) instead of walking N slots.
+# The pyramid follows the rates of @store (a RateStore or a SpectralModel)
+# kept from @pivot_time (see PeriodicPoissonProcess), it is a listener of
+# the store and only the blocks above the slots which changed are summed
+# again after an update.
+class RatePyramid(IntervalTable):
+
+    # block sizes (in seconds) of the levels used when no levels are given,
+    # the ones which are multiples of the increment and of each other and
+    # divide the periodic cycle are taken
+    CLOCK_LEVELS = [
+        5, 15, 30, 60, 300, 900, 1800, 3600, 8 * 3600, 86400, 7 * 86400
+    ]
+
+    def __init__(
+        self, store, pivot_time, increment, periodic_cycle, levels=None
+    ):
+        if periodic_cycle % increment:
+            raise ValueError(
+                "The periodic cycle must be a multiple of the increment"
+            )
+        self._store = store
+        self.periodic_cycle = periodic_cycle
+        self._pivot_time = pivot_time or 0
+        self._length = periodic_cycle // increment
+        self._start_time = (self._pivot_time // periodic_cycle) * periodic_cycle
+        self.levels = levels
+        if levels is None:
+            blocks = _clock_blocks(increment, periodic_cycle)
+            if len(blocks) == 0:
+                blocks = [
+                    2**level for level in
+                    range(1, int(np.ceil(np.log2(max(self._length, 2)))) + 1)
+                ]
+        else:
+            blocks = [int(level // increment) for level in levels]
+        self.blocks = [1]
+        for block in blocks:
+            if block <= self.blocks[-1] or block % self.blocks[-1]:
+                raise ValueError(
+                    "Each level must be a multiple of the level below"
+                )
+            self.blocks.append(block)
+        mean, variance = self._leaves(np.arange(self._length))
+        # the empty slot after the cycle keeps the slots of the cycle inside
+        # of the columns (see IntervalTable)
+        super(RatePyramid, self).__init__(
+            np.append(mean, 0.0), np.append(variance, 0.0), self._start_time,
+            increment, periodic_cycle, self._start_time
+        )
+        store.add_listener(self)
+
+    # whether the pyramid follows the rates of @store kept from @pivot_time
+    def follows(self, store, pivot_time):
+        return store is self._store and (pivot_time or 0) == self._pivot_time
+
+    # stop following the store
+    def detach(self):
+        self._store.remove_listener(self)
+
+    # called by the store after the rates at @start_times (None for all
+    # rates) changed. The slots of the cycle at @start_times are read again
+    # and the blocks above them are summed again.
+    def rates_changed(self, store, start_times):
+        if start_times is None:
+            slots = np.arange(self._length)
+        else:
+            slots = np.unique((
+                (np.atleast_1d(start_times) - self._start_time) %
+                self.periodic_cycle
+            ) // self._store.increment)
+        if len(slots) == 0:
+            return
+        self._mean[slots], self._variance[slots] = self._leaves(slots)
+        for level in range(1, len(self.blocks)):
+            factor = self.blocks[level] // self.blocks[level - 1]
+            slots = np.unique(slots // factor)
+            for column in ["mean", "variance"]:
+                below = self._sums[column][level - 1]
+                self._sums[column][level][slots] = below.reshape(
+                    (-1, factor)
+                )[slots].sum(axis=1)
+        self._totals()
+
+    # start times and sums of @column ("mean" or "variance") of the blocks
+    # of the level whose blocks are @resolution seconds long, e.g. the
+    # expected number of events per hour over the cycle
+    def blocks_at(self, resolution, column="mean"):
+        block = int(resolution // self.increment)
+        if block not in self.blocks:
+            raise ValueError("No level of %d seconds" % resolution)
+        level = self.blocks.index(block)
+        sums = self._sums[column][level][0:-(-(self._length) // block)]
+        start_times = self._start_time + (
+            np.arange(len(sums)) * block * self._store.increment
+        )
+        return start_times, np.copy(sums)
+
+    # mean and variance of the rates of @slots. The rates are kept from the
+    # pivot time, so a slot is read at the same time of the cycle from the
+    # pivot time. If the pivot time is not aligned to the increment, the
+    # slot holding it takes its share of the first and the last slot kept,
+    # and an interval ending inside of that slot gets the share of its
+    # average rate (see IntervalTable).
+    def _leaves(self, slots):
+        increment = self._store.increment
+        start_times = self._pivot_time + ((
+            self._start_time + (slots * increment) - self._pivot_time
+        ) % self.periodic_cycle)
+        shares = np.minimum(
+            increment, self._pivot_time + self.periodic_cycle - start_times
+        ) / float(increment)
+        first = np.array([self._pivot_time])
+        mean, variance = _moments(self._store, start_times)
+        first_mean, first_variance = _moments(self._store, first)
+        return (
+            (shares * mean) + ((1.0 - shares) * first_mean),
+            (np.square(shares) * variance) +
+            (np.square(1.0 - shares) * first_variance)
+        )
+
+    # the levels of the pyramid, each level is padded with zeros to whole
+    # blocks of the level above
+    def _build_sums(self):
+        self._sums = dict()
+        for column, values in [("mean", self._mean), ("variance", self._variance)]:
+            levels = list()
+            for level in range(len(self.blocks)):
+                if level + 1 < len(self.blocks):
+                    factor = self.blocks[level + 1] // self.blocks[level]
+                else:
+                    factor = 1
+                size = -(-len(values) // factor) * factor
+                padded = np.zeros(size)
+                padded[0:len(values)] = values
+                levels.append(padded)
+                if factor > 1:
+                    values = padded.reshape((-1, factor)).sum(axis=1)
+            self._sums[column] = levels
+        # the leaves are level 0, so changing a leaf changes the pyramid
+        self._mean = self._sums["mean"][0]
+        self._variance = self._sums["variance"][0]
+
+    # sums of the whole slots from @first to @last (excluded) of @column,
+    # using the coarsest blocks inside of each range
+    def _range(self, column, first, last):
+        levels = self._sums[column]
+        total = np.zeros(np.shape(first))
+        first = np.array(first, dtype=np.int64)
+        last = np.array(last, dtype=np.int64)
+        for level in range(len(self.blocks) - 1):
+            factor = self.blocks[level + 1] // self.blocks[level]
+            values = levels[level]
+            # the blocks before the first and after the last whole block of
+            # the level above
+            up = np.minimum(-(-first // factor) * factor, last)
+            down = np.maximum((last // factor) * factor, up)
+            for offset in range(factor - 1):
+                for start, end in [(first, up), (down, last)]:
+                    blocks = start + offset
+                    inside = blocks < end
+                    total[inside] += values[blocks[inside]]
+            first, last = up // factor, down // factor
+        values = levels[-1]
+        for offset in range(int(np.max(last - first, initial=0))):
+            blocks = first + offset
+            inside = blocks < last
+            total[inside] += values[blocks[inside]]
+        return total
+
+
+# mean and variance of the rates of @store at @start_times
+def _moments(store, start_times):
+    return store.lookup(start_times, "mean"), gamma_variance(
+        store.lookup(start_times, "alpha"), store.lookup(start_times, "beta")
+    )
+
+
+# block sizes (in increments) of the clock levels (see
+# RatePyramid.CLOCK_LEVELS) of a cycle of @periodic_cycle seconds
+def _clock_blocks(increment, periodic_cycle):
+    blocks = list()
+    size = increment
+    for level in RatePyramid.CLOCK_LEVELS:
+        if level > size and level % size == 0 and periodic_cycle % level == 0:
+            blocks.append(level // increment)
+            size = level
+    return blocks
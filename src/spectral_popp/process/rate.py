@@ -1,6 +1,81 @@
 #!/usr/bin/env python
 
-from scipy.stats import gamma
+import numpy as np
+from scipy.special import gammaincinv
+
+
+# memoised percentiles of gamma distributions, {(percentile, alpha, beta): value}
+_percentile_cache = dict()
+_percentile_cache_size = 4096
+
+
+# closed-form mean of gamma distribution(s) with shape @alpha and rate @beta
+def gamma_mean(alpha, beta):
+    return alpha / np.asarray(beta, dtype=float)
+
+
+# closed-form mode of gamma distribution(s) with shape @alpha and rate @beta.
+# The mode is -1 when @alpha < 1 (see Rate._mode)
+def gamma_mode(alpha, beta):
+    alpha = np.asarray(alpha, dtype=float)
+    return np.where(alpha >= 1, (alpha - 1) / beta, -1.0)
+
+
+# closed-form variance of gamma distribution(s) with shape @alpha and rate @beta
+def gamma_variance(alpha, beta):
+    return alpha / np.square(np.asarray(beta, dtype=float))
+
+
+# the specified @percentile of gamma distribution(s) with shape @alpha and
+# rate @beta. @alpha and @beta can be arrays, in which case all percentiles
+# are computed with a single call of the inverse regularised gamma function.
+def gamma_percentile(percentile, alpha, beta):
+    return gammaincinv(alpha, percentile) / np.asarray(beta, dtype=float)
+
+
+# point estimates of gamma distribution(s) with shape @alpha and rate @beta,
+# @statistic is either "mode" (or "map"), "mean", "upper" (95th percentile),
+# "lower" (5th percentile), "alpha" or "beta" (see RateStore.lookup)
+def gamma_estimate(alpha, beta, statistic):
+    if statistic in ("mode", "map"):
+        return gamma_mode(alpha, beta)
+    elif statistic == "mean":
+        return gamma_mean(alpha, beta)
+    elif statistic in ("upper", "lower"):
+        return gamma_percentile(
+            0.95 if statistic == "upper" else 0.05, alpha, beta
+        )
+    elif statistic == "alpha":
+        return np.array(alpha, dtype=float)
+    elif statistic == "beta":
+        return np.array(beta, dtype=float)
+    raise ValueError("Unknown statistic %s" % statistic)
+
+
+# gamma posterior(s) of rate(s) with gamma prior(s) of shape @alpha and rate
+# @beta after an increment was observed by a noisy detector, where
+# @detection tells whether the detector fired, @tpr is its true positive rate
+# and @fpr its false positive rate. As at most one event happens in an
+# increment, the exact (filtered) posterior is a mixture of
+# Gamma(alpha, beta+1), no event, and Gamma(alpha+1, beta+1), one event,
+# weighted by their posterior probabilities. The mixture is approximated by
+# the gamma distribution of the same mean and variance (moment matching), see
+# "Efficient Bayesian methods for counting processes in partially observable
+# environments". A perfect detector gives the fully observed posterior.
+# Returns the alpha and beta of the posterior(s).
+def gamma_filtered_posterior(alpha, beta, detection, tpr, fpr):
+    alpha = np.asarray(alpha, dtype=float)
+    beta = np.asarray(beta, dtype=float) + 1.0
+    detection = np.asarray(detection) > 0
+    # likelihood of the detection given one event and given no event, the
+    # prior odds of one event against no event are alpha / (beta + 1)
+    event = np.where(detection, tpr, 1.0 - tpr) * alpha / beta
+    event = event / (event + np.where(detection, fpr, 1.0 - fpr))
+    mean = (alpha + event) / beta
+    variance = (
+        (alpha * (alpha + 1.0)) + (2.0 * event * (alpha + 1.0))
+    ) / np.square(beta) - np.square(mean)
+    return np.square(mean) / variance, mean / variance
 
 
 # The parameter of Poisson distribution represented as a gamma distribution.
@@ -16,7 +91,7 @@ class Rate(object):
         self.beta = 1.1
         self.alpha = 1.1
         self.mode = self._mode(self.alpha, self.beta)
-        self.mean = gamma.mean(self.alpha, scale=1/float(self.beta))
+        self.mean = self.alpha / float(self.beta)
 
     # set the rate (gamma) distribution using point estimate rate and beta parameter
     # should not be used excessively
@@ -28,7 +103,7 @@ class Rate(object):
         if map_estimate:
             self.mode = rate
             self.alpha = (rate * self.beta) + 1
-            self.mean = gamma.mean(self.alpha, scale=1/float(self.beta))
+            self.mean = self.alpha / float(self.beta)
         else:
             self.mean = rate
             self.alpha = rate * self.beta
@@ -49,8 +124,16 @@ class Rate(object):
             return -1.0
 
     # get the specified percentile of the rate
+    # the result is memoised for the (alpha, beta) pair
     def get_rate_percentile(self, percentile):
-        return gamma.ppf(percentile, self.alpha, scale=1/float(self.beta))
+        key = (percentile, self.alpha, self.beta)
+        if key not in _percentile_cache:
+            if len(_percentile_cache) >= _percentile_cache_size:
+                _percentile_cache.clear()
+            _percentile_cache[key] = float(
+                gamma_percentile(percentile, self.alpha, self.beta)
+            )
+        return _percentile_cache[key]
 
     # get the upper bound of the percentile of the rate (default = 0.95)
     def upper_end(self, percentile=0.95):
@@ -65,4 +148,26 @@ class Rate(object):
         self.alpha += sum(data)
         self.beta += len(data) * self.interval
         self.mode = self._mode(self.alpha, self.beta)
-        self.mean = gamma.mean(self.alpha, scale=1/float(self.beta))
+        self.mean = self.alpha / float(self.beta)
+
+
+# Read-only rate (class Rate), e.g. the default rate shared by all the slots
+# of a process which have not been assigned. Any change raises AttributeError,
+# copy it into a Rate to change it.
+class FrozenRate(Rate):
+
+    # @rate is the rate (class Rate) to copy, the default rate if None
+    def __init__(self, rate=None, interval=1):
+        super(FrozenRate, self).__init__(interval)
+        if rate is not None:
+            self.alpha = rate.alpha
+            self.beta = rate.beta
+            self.mode = rate.mode
+            self.mean = rate.mean
+            self.interval = rate.interval
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError("FrozenRate is read-only")
+        super(FrozenRate, self).__setattr__(name, value)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+import os
+import numpy as np
+from scipy.special import betaincinv
+
+
+# Reliability of a detector, the sensitivity (true positive rate) and the
+# specificity (1 - false positive rate), per region and per bin of the
+# periodic cycle. Both are Beta distributed with prior Beta(@alpha, @beta),
+# their posteriors are given by the confusion matrix (counts of ground truth
+# label against detection) of each region and bin, so new labelled data only
+# adds to the counts. The point estimates of all regions and bins are
+# computed at once and cached until the next update.
+class DetectorReliability(object):
+
+    # @periodic_cycle is the cycle (in seconds) starting at @pivot_time,
+    # split into bins of @bin_size seconds
+    def __init__(
+        self, periodic_cycle=86400, bin_size=3600, pivot_time=0,
+        alpha=1.0, beta=1.0
+    ):
+        self.periodic_cycle = periodic_cycle
+        self.bin_size = bin_size
+        self.pivot_time = pivot_time
+        self.num_of_bins = int(np.ceil(periodic_cycle / float(bin_size)))
+        self.alpha = alpha
+        self.beta = beta
+        self.regions = list()
+        # confusion matrices, @self.counts[region, bin, label, detection]
+        self.counts = np.zeros((0, self.num_of_bins, 2, 2))
+        # cached point estimates, {(name, statistic): array[region, bin]}
+        self._estimates = dict()
+
+    # bin of the cycle of each of @timestamps
+    def bins(self, timestamps):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        return (
+            (timestamps - self.pivot_time) % self.periodic_cycle
+        ) // self.bin_size
+
+    # add labelled detections to the confusion matrices. @labels[i] tells
+    # whether there was activity at @timestamps[i] (ground truth) and
+    # @detections[i] whether the detector fired. @regions is the region of
+    # all the detections, or an array with the region of each detection.
+    def update(self, regions, timestamps, labels, detections):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(timestamps) == 0:
+            return
+        if isinstance(regions, (list, tuple, np.ndarray)):
+            regions, inverse = np.unique(regions, return_inverse=True)
+            rows = np.array([
+                self._row(region) for region in regions.tolist()
+            ], dtype=np.int64)[inverse]
+        else:
+            rows = np.full(len(timestamps), self._row(regions), dtype=np.int64)
+        cells = (
+            ((rows * self.num_of_bins) + self.bins(timestamps)) * 4 +
+            (np.asarray(labels) > 0) * 2 + (np.asarray(detections) > 0)
+        )
+        self.counts += np.bincount(
+            cells, minlength=self.counts.size
+        ).reshape(self.counts.shape)
+        self._estimates = dict()
+
+    # Beta posterior (alpha, beta) of the sensitivity of all regions and bins
+    def sensitivity_posterior(self):
+        return (
+            self.alpha + self.counts[:, :, 1, 1],
+            self.beta + self.counts[:, :, 1, 0]
+        )
+
+    # Beta posterior (alpha, beta) of the specificity of all regions and bins
+    def specificity_posterior(self):
+        return (
+            self.alpha + self.counts[:, :, 0, 0],
+            self.beta + self.counts[:, :, 0, 1]
+        )
+
+    # point estimate of the sensitivity of all regions and bins, as an array
+    # of [region, bin]. @statistic is either "mean", "mode", "lower" (5th
+    # percentile) or "upper" (95th percentile).
+    def sensitivity(self, statistic="mean"):
+        return self._estimate("sensitivity", statistic)
+
+    # point estimate of the specificity of all regions and bins (see
+    # sensitivity)
+    def specificity(self, statistic="mean"):
+        return self._estimate("specificity", statistic)
+
+    # true positive rates and false positive rates of the detector at
+    # @timestamps in @region (posterior means), e.g. for
+    # PoissonProcess.update_partially_observed. A region without any
+    # labelled data gets the prior means.
+    def rates(self, region, timestamps):
+        bins = self.bins(timestamps)
+        if region not in self.regions:
+            mean = self.alpha / float(self.alpha + self.beta)
+            return np.full(len(bins), mean), np.full(len(bins), 1.0 - mean)
+        row = self.regions.index(region)
+        return (
+            self.sensitivity()[row, bins], 1.0 - self.specificity()[row, bins]
+        )
+
+    # store the confusion matrices to @path (a .npz file)
+    def save(self, path):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f, regions=np.array(self.regions, dtype=np.unicode_),
+                counts=self.counts,
+                config=np.array([
+                    self.periodic_cycle, self.bin_size, self.pivot_time
+                ], dtype=np.int64),
+                prior=np.array([self.alpha, self.beta])
+            )
+        os.rename(temp_path, path)
+
+    # restore the confusion matrices from @path (see save). Returns whether
+    # there was anything to restore.
+    def load(self, path):
+        if not os.path.isfile(path):
+            return False
+        with np.load(path) as data:
+            periodic_cycle, bin_size, pivot_time = data["config"].tolist()
+            if (periodic_cycle, bin_size) != (self.periodic_cycle, self.bin_size):
+                raise ValueError(
+                    "%s has %d second bins of a %d second cycle" % (
+                        path, bin_size, periodic_cycle
+                    )
+                )
+            self.pivot_time = pivot_time
+            self.alpha, self.beta = data["prior"].tolist()
+            self.regions = [str(region) for region in data["regions"]]
+            self.counts = data["counts"]
+        self._estimates = dict()
+        return True
+
+    # row of @region in the confusion matrices, a new row is added for a
+    # new region
+    def _row(self, region):
+        if region not in self.regions:
+            self.regions.append(region)
+            self.counts = np.concatenate(
+                (self.counts, np.zeros((1,) + self.counts.shape[1:]))
+            )
+        return self.regions.index(region)
+
+    # cached point estimate (see sensitivity) of the Beta posteriors @name
+    def _estimate(self, name, statistic):
+        key = (name, statistic)
+        if key not in self._estimates:
+            if name == "sensitivity":
+                alpha, beta = self.sensitivity_posterior()
+            else:
+                alpha, beta = self.specificity_posterior()
+            if statistic == "mean":
+                estimate = alpha / (alpha + beta)
+            elif statistic == "mode":
+                # the mode is at a bound if either parameter is at most 1
+                estimate = np.select(
+                    [(alpha > 1) & (beta > 1), alpha > 1, beta > 1],
+                    [
+                        (alpha - 1) / np.maximum(alpha + beta - 2, 1e-12),
+                        np.ones(alpha.shape), np.zeros(alpha.shape)
+                    ], alpha / (alpha + beta)
+                )
+            elif statistic in ("upper", "lower"):
+                estimate = betaincinv(
+                    alpha, beta, 0.95 if statistic == "upper" else 0.05
+                )
+            else:
+                raise ValueError("Unknown statistic %s" % statistic)
+            estimate.flags.writeable = False
+            self._estimates[key] = estimate
+        return self._estimates[key]
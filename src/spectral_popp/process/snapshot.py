@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import os
+import struct
+import numpy as np
+from rate import Rate
+from processes import PeriodicPoissonProcess, SpectralPoissonProcess, _statistic
+
+
+# Compiled, read-only snapshot of a (periodic or spectral) Poisson process.
+# The file holds a header (little-endian: magic string, version, increment,
+# periodic cycle, pivot time, start time of the first slot, number of slots
+# and number of columns) followed by columns of point estimates over the
+# slots of one cycle (one more slot if the pivot time is not aligned to the
+# increment, see PeriodicPoissonProcess._cycle_slots): mode, mean, lower and upper bound of the rates of the Poisson
+# process, and the same four columns of the spectral model for a
+# spectral-Poisson process. The columns are mapped in memory read-only, so
+# many worker processes share the same pages and answer queries without
+# loading anything.
+MAGIC = b"PSNP"
+VERSION = 2
+STATISTICS = ["mode", "mean", "lower", "upper"]
+_HEADER = struct.Struct("<4sIqqqqqI4x")
+
+
+# compile the current rates of @process over one cycle into the snapshot
+# file at @path. A lazy spectral-Poisson process is refitted first.
+def compile_snapshot(process, path):
+    if not isinstance(process, PeriodicPoissonProcess):
+        raise ValueError(
+            "Only periodic Poisson processes can be compiled into a snapshot"
+        )
+    stores = [process.poisson]
+    if isinstance(process, SpectralPoissonProcess):
+        if process.refit_on_retrieve:
+            process.refit()
+        stores.append(process._spectral)
+    # the slots of the cycle as kept by the process, the same slots as in
+    # its lookup table (see PeriodicPoissonProcess._cycle_slots)
+    start_time, length = process._cycle_slots()
+    start_times = start_time + (np.arange(length) * process.increment)
+    columns = [
+        store.lookup(start_times, statistic) for store in stores
+        for statistic in STATISTICS
+    ]
+    header = _HEADER.pack(
+        MAGIC, VERSION, process.increment, process.periodic_cycle,
+        process._pivot_time or 0, start_time, length, len(columns)
+    )
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        for column in columns:
+            f.write(np.asarray(column, dtype="<f8").tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(temp_path, path)
+
+
+# Read-only query interface over a snapshot file (see compile_snapshot),
+# answering the same queries as the retrieve methods of the compiled process.
+class PoissonSnapshot(object):
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read(_HEADER.size)
+        if len(data) < _HEADER.size:
+            raise ValueError("%s is not a snapshot file" % path)
+        magic, version, increment, periodic_cycle, pivot, start_time, length, num_of_columns = _HEADER.unpack(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d snapshot file" % (path, VERSION))
+        self.increment = increment
+        self.periodic_cycle = periodic_cycle
+        self._pivot_time = pivot
+        self._start_time = start_time
+        self.spectral = num_of_columns > len(STATISTICS)
+        self._columns = np.memmap(
+            path, dtype="<f8", mode="r", offset=_HEADER.size,
+            shape=(num_of_columns, length)
+        )
+        default = Rate()
+        self._defaults = {
+            "mode": default.mode, "mean": default.mean,
+            "lower": default.lower_end(), "upper": default.upper_end()
+        }
+
+    # point estimates at @start_times (a timestamp or an array of
+    # timestamps, a single timestamp gives a single value), mapped to the
+    # slots as RateTable.indices does. @statistic is
+    # either "mode" (or "map"), "mean", "lower" or "upper". @spectral selects
+    # the rates of the spectral model (default when the snapshot has one) or
+    # of the Poisson process.
+    def get_rates_at(self, start_times, statistic="mode", spectral=None):
+        if spectral is None:
+            spectral = self.spectral
+        elif spectral and not self.spectral:
+            raise ValueError("The snapshot has no spectral model")
+        if statistic == "map":
+            statistic = "mode"
+        row = STATISTICS.index(statistic)
+        if spectral:
+            row += len(STATISTICS)
+        start_times = np.asarray(start_times, dtype=np.int64)
+        relative = self._pivot_time + (
+            (start_times - self._pivot_time) % self.periodic_cycle
+        )
+        indices = (relative - self._start_time) // self.increment
+        values = np.full(start_times.shape, self._defaults[statistic])
+        inside = (indices >= 0) & (indices < self._columns.shape[1])
+        values[inside] = self._columns[row][indices[inside]]
+        if values.ndim == 0:
+            return values[()]
+        return values
+
+    # get point estimates of arrival rates from @start_time to @end_time,
+    # in the same form as PeriodicPoissonProcess.retrieve
+    def retrieve(
+        self, start_time, end_time, mean=False,
+        upper_bound=False, lower_bound=False, spectral=None
+    ):
+        start_times, rates = self.retrieve_array(
+            start_time, end_time, _statistic(mean, upper_bound, lower_bound),
+            spectral
+        )
+        return dict(zip(start_times.tolist(), rates.tolist()))
+
+    # get point estimates of arrival rates from @start_time to @end_time as
+    # arrays, in the same form as PeriodicPoissonProcess.retrieve_array
+    def retrieve_array(self, start_time, end_time, statistic="mode", spectral=None):
+        start_time = (start_time // self.increment) * self.increment
+        end_time = (end_time // self.increment) * self.increment
+        start_times = np.arange(start_time, end_time, self.increment)
+        if isinstance(statistic, (list, tuple)):
+            return start_times, dict(
+                (name, self.get_rates_at(start_times, name, spectral))
+                for name in statistic
+            )
+        return start_times, self.get_rates_at(start_times, statistic, spectral)
+
+    # get a complete cycle of point estimates of arrival rates
+    def retrieve_full_periodic(
+        self, mean=False, upper_bound=False, lower_bound=False, spectral=None
+    ):
+        return self.retrieve(
+            self._pivot_time, self._pivot_time + self.periodic_cycle,
+            mean, upper_bound, lower_bound, spectral
+        )
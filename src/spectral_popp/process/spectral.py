@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import numpy as np
+from rate import Rate, gamma_estimate
+from fourier import evaluate_spectrums, rectify_signal
+
+
+# Spectral model of the rate function of a spectral-Poisson process over one
+# cycle. The model keeps the l [amplitude, phase, frequency] @spectrums of
+# the rate function (see fit_spectrums) and the beta parameter of the rates
+# of the @length slots of the cycle from @start_time, instead of a rate per
+# slot. The rate at any timestamp, including timestamps between the start
+# times of two slots (see evaluate), is computed from the spectrums in closed
+# form and takes the beta of its slot, so its alpha is rate * beta.
+# Timestamps outside of the cycle get the default rate (class Rate).
+# The model is read-only, a refit creates a new one. It answers the same
+# lookups as RateStore, so it can be read through a RateTable.
+class SpectralModel(object):
+
+    # @increment is the interval (in seconds) between two consecutive slots,
+    # @beta is an array with the beta parameter of each slot
+    def __init__(self, increment=1, start_time=0, spectrums=None, beta=None):
+        self.increment = increment
+        self.start_time = start_time
+        self.spectrums = [list(spectrum) for spectrum in (spectrums or list())]
+        self.beta = np.array(beta if beta is not None else list(), dtype=float)
+        self.beta.flags.writeable = False
+        self.length = len(self.beta)
+        default = Rate()
+        self._default = (default.alpha, default.beta)
+        # the model never changes (see RateStore.version)
+        self.version = 0
+
+    # number of slots of the cycle
+    def __len__(self):
+        return self.length
+
+    # point estimates of the rates of the slots of @start_times, like
+    # RateStore.lookup the rate of a slot is the rate at its start time
+    def lookup(self, start_times, statistic="mode"):
+        positions = np.floor(self._positions(start_times))
+        return self._estimate(positions, statistic)
+
+    # point estimates of the rates at @timestamps (any timestamps in
+    # seconds), evaluated at the timestamps themselves instead of at the
+    # start times of their slots (see lookup for @statistic)
+    def evaluate(self, timestamps, statistic="mode"):
+        return self._estimate(self._positions(timestamps), statistic)
+
+    # rates (the rectified rate function) at @positions in the cycle
+    # (fractional slot indices)
+    def rates(self, positions):
+        return rectify_signal(
+            evaluate_spectrums(self.spectrums, positions, self.length),
+            low_thres=0.001
+        )
+
+    # the model never changes, so listeners (see RateStore.add_listener)
+    # are never called
+    def add_listener(self, listener):
+        pass
+
+    def remove_listener(self, listener):
+        pass
+
+    # point estimate (see lookup) of the default rate
+    def default(self, statistic="mode"):
+        return float(gamma_estimate(
+            self._default[0], self._default[1], statistic
+        ))
+
+    # fractional slot indices of @timestamps
+    def _positions(self, timestamps):
+        return (
+            np.asarray(timestamps, dtype=float) - self.start_time
+        ) / float(self.increment)
+
+    # point estimates at @positions (see _positions)
+    def _estimate(self, positions, statistic):
+        indices = np.floor(positions).astype(np.int64)
+        inside = (indices >= 0) & (indices < self.length)
+        alpha = np.full(positions.shape, self._default[0])
+        beta = np.full(positions.shape, self._default[1])
+        beta[inside] = self.beta[indices[inside]]
+        alpha[inside] = self.rates(positions[inside]) * beta[inside]
+        return gamma_estimate(alpha, beta, statistic)
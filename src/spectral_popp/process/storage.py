@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+import os
+import json
+import zlib
+import struct
+import numpy as np
+from instrument import count
+
+
+# Single-file binary format of the rates of a Poisson process.
+# The file starts with a fixed size header (little-endian) holding the magic
+# string, the format version, the increment, the periodic cycle (0 if the
+# process is not periodic), the pivot time, the start time of the first slot
+# (origin), the number of slots and flags telling whether the pivot and the
+# origin are set, and the generation of the file (see below). The header is
+# followed by three columns of @length slots: alpha (float64), beta (float64)
+# and valid (uint8), all little-endian, so the columns can be mapped in memory
+# without any parsing.
+# Changes made after the file was written can be appended to a log file (see
+# append_log). Each batch of the log carries the generation of the rates file
+# it applies to, so batches written before the rates file was rewritten
+# (compacted) are ignored.
+MAGIC = b"POPP"
+VERSION = 1
+_HEADER = struct.Struct("<4sIqqqqqIQ4x")
+HEADER_SIZE = _HEADER.size
+_HAS_PIVOT = 1
+_HAS_ORIGIN = 2
+
+
+# write the rates in @alpha, @beta and @valid to @path. The file is written
+# to a temporary file first and then renamed, so @path is either the old or
+# the new file even if writing is interrupted.
+def write_rates(
+    path, alpha, beta, valid, increment, periodic_cycle=0, pivot=None,
+    origin=None, generation=0
+):
+    flags = 0
+    if pivot is not None:
+        flags |= _HAS_PIVOT
+    if origin is not None:
+        flags |= _HAS_ORIGIN
+    header = _HEADER.pack(
+        MAGIC, VERSION, int(increment), int(periodic_cycle),
+        int(pivot or 0), int(origin or 0), len(alpha), flags, generation
+    )
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(np.asarray(alpha, dtype="<f8").tobytes())
+        f.write(np.asarray(beta, dtype="<f8").tobytes())
+        f.write(np.asarray(valid, dtype="u1").tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(temp_path, path)
+    count("file_written")
+
+
+# read the header of the rates file at @path as a dictionary
+def read_header(path):
+    with open(path, "rb") as f:
+        data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("%s is not a rates file" % path)
+    magic, version, increment, periodic_cycle, pivot, origin, length, flags, generation = _HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("%s is not a rates file" % path)
+    if version != VERSION:
+        raise ValueError(
+            "%s has version %d, only version %d is supported" % (path, version, VERSION)
+        )
+    return {
+        "version": version, "increment": increment,
+        "periodic_cycle": periodic_cycle,
+        "pivot": pivot if flags & _HAS_PIVOT else None,
+        "origin": origin if flags & _HAS_ORIGIN else None,
+        "length": length, "generation": generation
+    }
+
+
+# read the rates file at @path. Returns the header (see read_header) and the
+# alpha, beta and valid columns. With @mmap the columns are mapped in memory
+# (copy-on-write) instead of being read.
+def read_rates(path, mmap=True):
+    count("file_read")
+    header = read_header(path)
+    length = header["length"]
+    offsets = [HEADER_SIZE, HEADER_SIZE + 8*length, HEADER_SIZE + 16*length]
+    columns = list()
+    for offset, dtype in zip(offsets, ["<f8", "<f8", "u1"]):
+        if length == 0:
+            columns.append(np.zeros(0, dtype=dtype))
+        elif mmap:
+            columns.append(np.memmap(
+                path, dtype=dtype, mode="c", offset=offset, shape=(length,)
+            ))
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                columns.append(np.fromfile(f, dtype=dtype, count=length))
+    alpha, beta, valid = columns
+    return header, alpha, beta, valid.view(bool)
+
+
+# Log of changed rates. Each batch starts with a header holding the magic
+# string, the number of rates in the batch, the generation of the rates file
+# it applies to and the CRC32 of its payload. The payload is the columns of
+# start time (int64), alpha (float64) and beta (float64).
+LOG_MAGIC = b"PLOG"
+_LOG_HEADER = struct.Struct("<4sIQI")
+
+
+# append a batch of rates (@start_times, @alpha, @beta) for the rates file
+# of @generation to the log at @path. The batch is written at @offset, the
+# end of the valid part of the log, dropping anything after it (e.g. a batch
+# that was only partially written). Returns the new end of the log.
+def append_log(path, offset, generation, start_times, alpha, beta):
+    payload = b"".join([
+        np.asarray(start_times, dtype="<i8").tobytes(),
+        np.asarray(alpha, dtype="<f8").tobytes(),
+        np.asarray(beta, dtype="<f8").tobytes()
+    ])
+    header = _LOG_HEADER.pack(
+        LOG_MAGIC, len(start_times), generation,
+        zlib.crc32(payload) & 0xffffffff
+    )
+    with open(path, "r+b" if os.path.isfile(path) else "wb") as f:
+        f.seek(offset)
+        f.truncate()
+        f.write(header + payload)
+        count("file_written")
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+# read the batches of the log at @path which apply to the rates file of
+# @generation. Reading stops at the first incomplete or corrupted batch.
+# Returns the start times, alpha and beta of the batches (in the order they
+# were appended) and the end of the valid part of the log.
+def read_log(path, generation):
+    start_times, alpha, beta = list(), list(), list()
+    offset = 0
+    if not os.path.isfile(path):
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), offset
+    with open(path, "rb") as f:
+        data = f.read()
+    count("file_read")
+    while offset + _LOG_HEADER.size <= len(data):
+        magic, length, batch_generation, crc = _LOG_HEADER.unpack_from(data, offset)
+        start = offset + _LOG_HEADER.size
+        payload = data[start:start + 24*length]
+        if magic != LOG_MAGIC or len(payload) < 24*length or (
+            zlib.crc32(payload) & 0xffffffff
+        ) != crc:
+            break
+        offset = start + 24*length
+        if batch_generation != generation:
+            continue
+        start_times.append(np.frombuffer(payload, dtype="<i8", count=length))
+        alpha.append(np.frombuffer(payload, dtype="<f8", count=length, offset=8*length))
+        beta.append(np.frombuffer(payload, dtype="<f8", count=length, offset=16*length))
+    if len(start_times) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), offset
+    return (
+        np.concatenate(start_times), np.concatenate(alpha),
+        np.concatenate(beta), offset
+    )
+
+
+# Single-file binary format of a collection of periodic Poisson processes
+# (see ProcessCollection). The header (little-endian) holds the magic string,
+# the format version, the increment, the periodic cycle, the pivot time, the
+# number of processes, the number of slots per cycle, flags telling whether
+# the pivot is set and the size of the key table. The header is followed by
+# the keys of the processes as a JSON list (padded to 8 bytes) and by the
+# rates as an array of [process, slot, (alpha, beta)] (float64).
+COLLECTION_MAGIC = b"PCOL"
+_COLLECTION_HEADER = struct.Struct("<4sIqqqqqII")
+
+
+# write the @rates ([process, slot, (alpha, beta)]) of the processes with
+# @keys to @path, atomically (see write_rates)
+def write_collection(path, keys, rates, increment, periodic_cycle, pivot=None):
+    table = json.dumps([list(key) if isinstance(key, tuple) else key for key in keys])
+    table = table.encode("utf-8")
+    table += b" " * (-len(table) % 8)
+    header = _COLLECTION_HEADER.pack(
+        COLLECTION_MAGIC, VERSION, int(increment), int(periodic_cycle),
+        int(pivot or 0), len(keys), rates.shape[1],
+        _HAS_PIVOT if pivot is not None else 0, len(table)
+    )
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(table)
+        f.write(np.asarray(rates, dtype="<f8").tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(temp_path, path)
+    count("file_written")
+
+
+# read the collection file at @path. Returns the header as a dictionary, the
+# keys (lists are turned back into tuples) and the rates, mapped in memory
+# (copy-on-write) with @mmap.
+def read_collection(path, mmap=True):
+    count("file_read")
+    with open(path, "rb") as f:
+        data = f.read(_COLLECTION_HEADER.size)
+        if len(data) < _COLLECTION_HEADER.size:
+            raise ValueError("%s is not a collection file" % path)
+        magic, version, increment, periodic_cycle, pivot, num_of_keys, num_of_slots, flags, size = _COLLECTION_HEADER.unpack(data)
+        if magic != COLLECTION_MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d collection file" % (path, VERSION))
+        keys = [
+            tuple(key) if isinstance(key, list) else key
+            for key in json.loads(f.read(size).decode("utf-8"))
+        ]
+    header = {
+        "increment": increment, "periodic_cycle": periodic_cycle,
+        "pivot": pivot if flags & _HAS_PIVOT else None
+    }
+    shape = (num_of_keys, num_of_slots, 2)
+    offset = _COLLECTION_HEADER.size + size
+    if num_of_keys == 0:
+        rates = np.zeros(shape)
+    elif mmap:
+        rates = np.memmap(path, dtype="<f8", mode="c", offset=offset, shape=shape)
+    else:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            rates = np.fromfile(f, dtype="<f8", count=np.prod(shape)).reshape(shape)
+    return header, keys, rates
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+import numpy as np
+from rate import Rate, gamma_mode, gamma_mean, gamma_percentile, gamma_filtered_posterior
+
+
+# Array-backed storage of the rates (class Rate) of a Poisson process.
+# The gamma parameters (alpha, beta) and their derived mode and mean are kept
+# in contiguous arrays indexed by the slot offset (in @increment) from
+# @self.origin, the earliest start time the store covers. Slots which have not
+# been assigned hold the parameters of the default rate, @self.valid marks the
+# ones that have been assigned. The store grows on both ends as new start
+# times arrive, and it can be used as a dictionary of {start_time: Rate}.
+class RateStore(object):
+
+    # @increment is the interval (in seconds) between two consecutive slots.
+    def __init__(self, increment=1):
+        self.increment = increment
+        self.origin = None
+        default = Rate()
+        self._default = (default.alpha, default.beta, default.mode, default.mean)
+        self.alpha = np.zeros(0)
+        self.beta = np.zeros(0)
+        self.mode = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.valid = np.zeros(0, dtype=bool)
+        # slots which changed since the last call of clear_changes
+        self.changed = np.zeros(0, dtype=bool)
+        # memoised percentiles of all slots, {percentile: array}, and the
+        # slots whose percentile has to be recomputed, {percentile: array}
+        self._percentiles = dict()
+        self._stale = dict()
+        # incremented whenever any slot changes, so anything derived from the
+        # store (e.g. a RateTable) can tell whether it is out of date
+        self.version = 0
+        # objects told about every change (see add_listener)
+        self._listeners = list()
+
+    # number of slots which have been assigned
+    def __len__(self):
+        return int(np.count_nonzero(self.valid))
+
+    def __contains__(self, start_time):
+        index = self._index(start_time)
+        return index is not None and bool(self.valid[index])
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    # start times of all assigned slots (in ascending order)
+    def keys(self):
+        if self.origin is None:
+            return list()
+        return [
+            self.origin + int(index) * self.increment
+            for index in np.flatnonzero(self.valid)
+        ]
+
+    # get the rate (class Rate) at @start_time. The returned rate is a copy,
+    # changing it does not change the store.
+    # KeyError is raised if the slot has not been assigned.
+    def __getitem__(self, start_time):
+        index = self._index(start_time)
+        if index is None or not self.valid[index]:
+            raise KeyError(start_time)
+        rate = Rate()
+        rate.alpha = float(self.alpha[index])
+        rate.beta = float(self.beta[index])
+        rate.mode = float(self.mode[index])
+        rate.mean = float(self.mean[index])
+        return rate
+
+    # assign the rate (class Rate) at @start_time
+    def __setitem__(self, start_time, rate):
+        index = self._reserve(start_time)
+        self.alpha[index] = rate.alpha
+        self.beta[index] = rate.beta
+        self.mode[index] = rate.mode
+        self.mean[index] = rate.mean
+        self.valid[index] = True
+        self._invalidate(index)
+
+    # get the rate at @start_time, or @default if the slot has not been
+    # assigned
+    def get(self, start_time, default=None):
+        try:
+            return self[start_time]
+        except KeyError:
+            return default
+
+    # posterior distribution of the rate at @start_time given @data, using
+    # conjugacy between Poisson-Gamma (see Rate.update_rate)
+    def update(self, start_time, data):
+        index = self._reserve(start_time)
+        self.alpha[index] += sum(data)
+        self.beta[index] += len(data)
+        self.mode[index] = self._mode(self.alpha[index], self.beta[index])
+        self.mean[index] = self.alpha[index] / self.beta[index]
+        self.valid[index] = True
+        self._invalidate(index)
+
+    # posterior distributions of the rates given a batch of observations,
+    # @start_times[i] is the start time of the slot where @counts[i] was
+    # observed. Observations are aggregated per slot before the rates of the
+    # touched slots are updated, so a batch gives the same rates as updating
+    # the observations one by one.
+    def update_many(self, start_times, counts):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        counts = np.asarray(counts, dtype=float)
+        if len(start_times) == 0:
+            return
+        self._reserve(int(start_times.min()))
+        self._reserve(int(start_times.max()))
+        indices = (start_times - self.origin) // self.increment
+        touched, inverse = np.unique(indices, return_inverse=True)
+        self.alpha[touched] += np.bincount(inverse, weights=counts)
+        self.beta[touched] += np.bincount(inverse)
+        alpha = self.alpha[touched]
+        beta = self.beta[touched]
+        self.mode[touched] = gamma_mode(alpha, beta)
+        self.mean[touched] = gamma_mean(alpha, beta)
+        self.valid[touched] = True
+        self._invalidate(touched)
+
+    # posterior distributions of the rates given a batch of noisy detections
+    # (see gamma_filtered_posterior), @detections[i] tells whether the
+    # detector fired at the slot starting at @start_times[i], @tpr and @fpr
+    # are the true and false positive rates of the detector, either one for
+    # all detections or one per detection. The detections of a slot are
+    # applied one after another in the order they are given, the k-th
+    # detections of all slots are applied at once.
+    def update_partially_observed(self, start_times, detections, tpr, fpr):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        if len(start_times) == 0:
+            return
+        detections = np.asarray(detections)
+        tpr = np.broadcast_to(np.asarray(tpr, dtype=float), start_times.shape)
+        fpr = np.broadcast_to(np.asarray(fpr, dtype=float), start_times.shape)
+        self._reserve(int(start_times.min()))
+        self._reserve(int(start_times.max()))
+        indices = (start_times - self.origin) // self.increment
+        # rank of each detection among the detections of its slot
+        order = np.argsort(indices, kind="mergesort")
+        ranks = np.arange(len(order)) - np.searchsorted(
+            indices[order], indices[order], side="left"
+        )
+        by_rank = order[np.argsort(ranks, kind="mergesort")]
+        bounds = np.cumsum(np.bincount(ranks))
+        for start, end in zip(np.concatenate(([0], bounds[:-1])), bounds):
+            rank = by_rank[start:end]
+            index = indices[rank]
+            self.alpha[index], self.beta[index] = gamma_filtered_posterior(
+                self.alpha[index], self.beta[index], detections[rank],
+                tpr[rank], fpr[rank]
+            )
+        touched = np.unique(indices)
+        self.mode[touched] = gamma_mode(self.alpha[touched], self.beta[touched])
+        self.mean[touched] = gamma_mean(self.alpha[touched], self.beta[touched])
+        self.valid[touched] = True
+        self._invalidate(touched)
+
+    # assign the rates at @start_times (an array of start times aligned to
+    # @increment) with gamma distributions of shape @alpha and rate @beta
+    def assign(self, start_times, alpha, beta):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        if len(start_times) == 0:
+            return
+        self._reserve(int(start_times.min()))
+        self._reserve(int(start_times.max()))
+        indices = (start_times - self.origin) // self.increment
+        self.alpha[indices] = alpha
+        self.beta[indices] = beta
+        self.mode[indices] = gamma_mode(self.alpha[indices], self.beta[indices])
+        self.mean[indices] = gamma_mean(self.alpha[indices], self.beta[indices])
+        self.valid[indices] = True
+        self._invalidate(indices)
+
+    # replace the content of the store with the columns @alpha, @beta and
+    # @valid whose first slot starts at @origin. The mode and the mean are
+    # derived from @alpha and @beta.
+    def load(self, origin, alpha, beta, valid):
+        self.origin = origin
+        self.alpha = alpha
+        self.beta = beta
+        self.mode = gamma_mode(alpha, beta)
+        self.mean = gamma_mean(alpha, beta)
+        self.valid = valid
+        self.changed = np.zeros(len(valid), dtype=bool)
+        self.version += 1
+        self._percentiles = dict()
+        self._stale = dict()
+        for listener in self._listeners:
+            listener.rates_changed(self, None)
+
+    # start times, alpha and beta of the slots which changed since the last
+    # call of clear_changes
+    def changes(self):
+        indices = np.flatnonzero(self.changed)
+        if self.origin is None:
+            return indices, np.zeros(0), np.zeros(0)
+        return (
+            self.origin + (indices * self.increment),
+            self.alpha[indices], self.beta[indices]
+        )
+
+    def clear_changes(self):
+        self.changed[:] = False
+
+    # the specified @percentile of the rates of all slots. Percentiles are
+    # memoised and only the slots which changed since the last call are
+    # recomputed.
+    def percentile(self, percentile):
+        if percentile not in self._percentiles:
+            self._percentiles[percentile] = np.zeros(len(self.valid))
+            self._stale[percentile] = np.ones(len(self.valid), dtype=bool)
+        values = self._percentiles[percentile]
+        stale = self._stale[percentile]
+        if stale.any():
+            values[stale] = gamma_percentile(
+                percentile, self.alpha[stale], self.beta[stale]
+            )
+            stale[:] = False
+        return values
+
+    # point estimates of the rates at @start_times (an array of start times
+    # aligned to @increment). @statistic is either "mode" (or "map"), "mean",
+    # "upper" (95th percentile) or "lower" (5th percentile), or one of the gamma
+    # parameters "alpha" and "beta". Start times outside of the store get the
+    # value of the default rate.
+    def lookup(self, start_times, statistic="mode"):
+        start_times = np.asarray(start_times, dtype=np.int64)
+        values = self.values(statistic)
+        result = np.full(len(start_times), self.default(statistic), dtype=float)
+        if self.origin is None:
+            return result
+        indices = (start_times - self.origin) // self.increment
+        inside = (indices >= 0) & (indices < len(values))
+        result[inside] = values[indices[inside]]
+        return result
+
+    # point estimates (see lookup) of all slots, from @self.origin
+    def values(self, statistic="mode"):
+        if statistic == "alpha":
+            return self.alpha
+        elif statistic == "beta":
+            return self.beta
+        elif statistic in ("mode", "map"):
+            return self.mode
+        elif statistic == "mean":
+            return self.mean
+        elif statistic in ("upper", "lower"):
+            return self.percentile(0.95 if statistic == "upper" else 0.05)
+        raise ValueError("Unknown statistic %s" % statistic)
+
+    # point estimate (see lookup) of the default rate
+    def default(self, statistic="mode"):
+        if statistic == "alpha":
+            return self._default[0]
+        elif statistic == "beta":
+            return self._default[1]
+        elif statistic in ("mode", "map"):
+            return self._default[2]
+        elif statistic == "mean":
+            return self._default[3]
+        elif statistic in ("upper", "lower"):
+            return Rate().get_rate_percentile(
+                0.95 if statistic == "upper" else 0.05
+            )
+        raise ValueError("Unknown statistic %s" % statistic)
+
+    # add @listener, an object whose rates_changed(store, start_times) is
+    # called after the rates at @start_times changed (None if all of them
+    # may have changed), e.g. to keep something derived from the store up
+    # to date incrementally (see RatePyramid)
+    def add_listener(self, listener):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    # the listeners are not pickled with the store (e.g. when its process
+    # is sent to a worker), they only follow this copy of the store
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_listeners"] = list()
+        return state
+
+    # mark the slots at @index as changed and their percentiles as stale
+    def _invalidate(self, index):
+        self.version += 1
+        self.changed[index] = True
+        for stale in self._stale.values():
+            stale[index] = True
+        if self._listeners:
+            start_times = self.origin + (np.asarray(index) * self.increment)
+            for listener in self._listeners:
+                listener.rates_changed(self, start_times)
+
+    # get the mode of gamma distribution (see Rate._mode)
+    def _mode(self, alpha, beta):
+        if alpha >= 1:
+            return (alpha - 1) / float(beta)
+        else:
+            return -1.0
+
+    # slot index of @start_time, None if it is outside of the store
+    def _index(self, start_time):
+        if self.origin is None:
+            return None
+        index = (start_time - self.origin) // self.increment
+        if index < 0 or index >= len(self.valid):
+            return None
+        return int(index)
+
+    # slot index of @start_time, the store is grown to cover @start_time
+    # if necessary
+    def _reserve(self, start_time):
+        if self.origin is None:
+            self.origin = start_time
+        index = (start_time - self.origin) // self.increment
+        if index < 0:
+            extra = max(-index, len(self.valid))
+            self._grow(extra, front=True)
+            index += extra
+        elif index >= len(self.valid):
+            extra = max(index + 1 - len(self.valid), len(self.valid))
+            self._grow(extra, front=False)
+        return int(index)
+
+    # add @extra default slots at the front or the back of the store
+    def _grow(self, extra, front=False):
+        extra = int(extra)
+        arrays = list()
+        for array, value in zip(
+            [self.alpha, self.beta, self.mode, self.mean], self._default
+        ):
+            padding = np.full(extra, value)
+            if front:
+                arrays.append(np.concatenate((padding, array)))
+            else:
+                arrays.append(np.concatenate((array, padding)))
+        self.alpha, self.beta, self.mode, self.mean = arrays
+        padding = np.zeros(extra, dtype=bool)
+        if front:
+            self.valid = np.concatenate((padding, self.valid))
+            self.changed = np.concatenate((padding, self.changed))
+            self.origin -= extra * self.increment
+        else:
+            self.valid = np.concatenate((self.valid, padding))
+            self.changed = np.concatenate((self.changed, padding))
+        self._percentiles = dict()
+        self._stale = dict()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import numpy as np
+from rate import gamma_variance
+from interval import IntervalTable
+
+
+# Immutable lookup table of the point estimates of the rates of a process.
+# Each point estimate (see RateStore.lookup) is a read-only array over the
+# @length slots from @start_time, with one extra slot at the end holding the
+# value of the default rate. A timestamp is mapped to its slot with integer
+# arithmetic (into the cycle first if the table is periodic), and timestamps
+# outside of the table are mapped to the default slot, so a query of any
+# number of timestamps is a single gather.
+# The table is a snapshot of @store, it does not change when the store does
+# (see is_current).
+class RateTable(object):
+
+    STATISTICS = ["mode", "mean", "lower", "upper", "alpha", "beta"]
+
+    # @store is the RateStore to take the rates from, @periodic_cycle is the
+    # cycle (in seconds) of a periodic process whose cycle starts at
+    # @pivot_time, None if the process is not periodic
+    def __init__(
+        self, store, start_time, length, increment,
+        periodic_cycle=None, pivot_time=None
+    ):
+        self.start_time = start_time
+        self.length = length
+        self.increment = increment
+        self.periodic_cycle = periodic_cycle
+        self.pivot_time = pivot_time
+        self._store = store
+        self._version = store.version
+        start_times = start_time + (np.arange(length) * increment)
+        self._columns = dict()
+        for statistic in RateTable.STATISTICS:
+            column = np.append(
+                store.lookup(start_times, statistic), store.default(statistic)
+            )
+            column.flags.writeable = False
+            self._columns[statistic] = column
+        self._columns["map"] = self._columns["mode"]
+        self._intervals = None
+
+    # whether the table still holds the rates of @store
+    def is_current(self, store):
+        return store is self._store and store.version == self._version
+
+    # slot indices of @timestamps (a timestamp or an array of timestamps)
+    def indices(self, timestamps):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if self.periodic_cycle:
+            pivot_time = self.pivot_time or 0
+            timestamps = pivot_time + (
+                (timestamps - pivot_time) % self.periodic_cycle
+            )
+        indices = (timestamps - self.start_time) // self.increment
+        return np.where(
+            (indices >= 0) & (indices < self.length), indices, self.length
+        )
+
+    # point estimates at @timestamps, @statistic is one of STATISTICS (or
+    # "map"). A single timestamp gives a single estimate.
+    def get(self, timestamps, statistic="mode"):
+        if statistic not in self._columns:
+            raise ValueError("Unknown statistic %s" % statistic)
+        return self._columns[statistic][self.indices(timestamps)]
+
+    # prefix sums of the rates over the cycle (class IntervalTable),
+    # built on first use. Only a periodic table has them.
+    def intervals(self):
+        if not self.periodic_cycle:
+            raise ValueError("Only a periodic table answers interval queries")
+        if self._intervals is None:
+            self._intervals = IntervalTable(
+                self._columns["mean"], gamma_variance(
+                    self._columns["alpha"], self._columns["beta"]
+                ), self.start_time, self.increment, self.periodic_cycle,
+                self.pivot_time
+            )
+        return self._intervals
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PeriodicPoissonProcess, SpectralPoissonProcess
+from spectral_popp.process.collection import ProcessCollection
+
+
+# A collection of processes has the rates of the same processes updated one
+# by one as PeriodicPoissonProcess
+class ProcessCollectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        np.random.seed(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    # observations of @num_of_keys processes, the first observation of each
+    # process is at @pivot_time
+    def _observations(self, pivot_time, num_of_keys=3, size=2000):
+        keys = np.random.randint(0, num_of_keys, size)
+        keys[0:num_of_keys] = np.arange(num_of_keys)
+        timestamps = pivot_time + np.random.randint(0, 3 * 86400, size)
+        timestamps[0:num_of_keys] = pivot_time
+        counts = np.random.poisson(2, size)
+        return [(key, "leg") for key in keys.tolist()], timestamps, counts
+
+    def _processes(self, process_class, keys, timestamps, counts):
+        processes = dict()
+        for key in sorted(set(keys)):
+            process = process_class(
+                60, 86400, path_to_db=os.path.join(self.path, "%d" % key[0])
+            )
+            indices = np.array([ind for ind, other in enumerate(keys) if other == key])
+            process.update_batch(timestamps[indices], counts[indices])
+            processes[key] = process
+        return processes
+
+    def test_update_batch(self):
+        keys, timestamps, counts = self._observations(1000020)
+        collection = ProcessCollection(60, 86400, path_to_db=self.path)
+        collection.update_batch(keys[0:1000], timestamps[0:1000], counts[0:1000])
+        collection.update_batch(keys[1000:], timestamps[1000:], counts[1000:])
+        processes = self._processes(PeriodicPoissonProcess, keys, timestamps, counts)
+        start_times = np.random.randint(900000, 1300000, 1000)
+        for statistic in ["mode", "mean", "upper", "lower", "alpha", "beta"]:
+            rates = collection.get_rates_at(
+                start_times, statistic, keys=sorted(processes)
+            )
+            for row, key in enumerate(sorted(processes)):
+                np.testing.assert_allclose(
+                    rates[row], processes[key].get_rates_at(start_times, statistic)
+                )
+
+    def test_add_process(self):
+        # the pivot time of the processes is not aligned to the increment,
+        # the collection reads the rate of each slot at its start
+        keys, timestamps, counts = self._observations(1000037)
+        processes = self._processes(PeriodicPoissonProcess, keys, timestamps, counts)
+        collection = ProcessCollection(60, 86400, path_to_db=self.path)
+        for key in sorted(processes):
+            collection.add_process(key, processes[key])
+        start_times, rates = collection.retrieve(1000000, 1000000 + 86400, "mean")
+        for key, row in zip(collection.keys, rates):
+            np.testing.assert_allclose(
+                row, processes[key].get_rates_at(start_times, "mean")
+            )
+
+    def test_fourier_transform(self):
+        keys, timestamps, counts = self._observations(1000020)
+        collection = ProcessCollection(60, 86400, path_to_db=self.path)
+        collection.update_batch(keys, timestamps, counts)
+        processes = self._processes(SpectralPoissonProcess, keys, timestamps, counts)
+        start_times = 1000020 + np.arange(0, 86400, 60)
+        rates = collection.get_rates_at(
+            start_times, "mean", keys=sorted(processes), spectral=True
+        )
+        # the batch l-AAM (see fit_spectrums_batch) differs from the l-AAM
+        # of a single signal by rounding only
+        for row, key in enumerate(sorted(processes)):
+            np.testing.assert_allclose(
+                rates[row], processes[key].get_rates_at(start_times, "mean"),
+                atol=1e-6
+            )
+
+    def test_store(self):
+        keys, timestamps, counts = self._observations(1000020)
+        collection = ProcessCollection(60, 86400, path_to_db=self.path)
+        collection.update_batch(keys, timestamps, counts)
+        collection.store_to_db()
+        restored = ProcessCollection(60, 86400, path_to_db=self.path)
+        self.assertTrue(restored.retrieve_from_db())
+        self.assertEqual(restored.keys, collection.keys)
+        np.testing.assert_array_equal(restored.rates, collection.rates)
+        start_times = np.random.randint(900000, 1300000, 100)
+        np.testing.assert_array_equal(
+            restored.get_rates_at(start_times), collection.get_rates_at(start_times)
+        )
+        other = ProcessCollection(300, 86400, path_to_db=self.path)
+        self.assertFalse(other.retrieve_from_db())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import yaml
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp.dataset import loader
+from spectral_popp.dataset.loader import Dataset
+from spectral_popp.dataset.stream import collect_batches
+
+
+# The dataset reads its yaml files through the cache while they do not
+# change, and streams the observations of each region in batches
+class DatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self._write("present_activity", {"1": [180, 60, 120], "2": [60, 240]})
+        self._write("absent_activity", {"1": [0, 120, 300], "3": [60]})
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write(self, name, regions, mtime=None):
+        path = os.path.join(self.path, name + ".yaml")
+        with open(path, "w") as f:
+            yaml.dump(regions, f)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_timestamps(self):
+        dataset = Dataset(self.path)
+        self.assertEqual(dataset.regions("present_activity"), ["1", "2"])
+        self.assertEqual(
+            dataset.timestamps("present_activity", "1").tolist(), [60, 120, 180]
+        )
+        self.assertEqual(
+            dataset.timestamps("present_activity", "1", 61, 180).tolist(), [120]
+        )
+        self.assertEqual(dataset.timestamps("present_activity", "3").tolist(), [])
+
+    def test_cache(self):
+        Dataset(self.path).regions("present_activity")
+        # the content changed along with the modification time and the size
+        self._write("present_activity", {"1": [60], "4": [600, 660]}, 1000)
+        dataset = Dataset(self.path)
+        self.assertEqual(dataset.regions("present_activity"), ["1", "4"])
+        self.assertEqual(
+            dataset.timestamps("present_activity", "4").tolist(), [600, 660]
+        )
+        # the same content with another modification time is not parsed again
+        self._write("present_activity", {"1": [60], "4": [600, 660]}, 2000)
+        parse = loader._parse_regions
+        loader._parse_regions = None
+        try:
+            dataset = Dataset(self.path)
+            self.assertEqual(dataset.regions("present_activity"), ["1", "4"])
+        finally:
+            loader._parse_regions = parse
+        # the content changed with the same size and another modification time
+        self._write("present_activity", {"1": [70], "4": [600, 660]}, 3000)
+        dataset = Dataset(self.path)
+        self.assertEqual(dataset.timestamps("present_activity", "1").tolist(), [70])
+
+    def test_stream_counts(self):
+        dataset = Dataset(self.path)
+        sources = [("present_activity", 1), ("absent_activity", 0)]
+        batches = list(dataset.stream_counts(sources, 60, 300, chunk_size=2))
+        self.assertTrue(all(len(batch[1]) <= 2 for batch in batches))
+        self.assertEqual([batch[0] for batch in batches], ["1", "1", "2", "3"])
+        data = collect_batches(batches)
+        # a timestamp in both files is observed with the count of the last
+        self.assertEqual(data["1"][0].tolist(), [60, 120, 180])
+        self.assertEqual(data["1"][1].tolist(), [1, 0, 1])
+        self.assertEqual(data["2"][0].tolist(), [60, 240])
+        self.assertEqual(data["3"][1].tolist(), [0])
+        detections = {"1": np.array([120]), "3": np.array([60])}
+        data = collect_batches(dataset.stream_counts(sources, 0, 300, detections))
+        self.assertEqual(data["1"][1].tolist(), [0, 0, 1, 0])
+        self.assertEqual(data["2"][1].tolist(), [0, 0])
+        self.assertEqual(data["3"][1].tolist(), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PeriodicPoissonProcess
+from spectral_popp.dataset.loader import get_dataset
+from spectral_popp.process.fourier import get_accumulated_highest_n_freq
+from spectral_popp.process.fourier import get_accumulated_highest_n_freq_batch
+
+
+# l-AAM as it was first written, with an FFT of the remaining signal and a
+# full sort of its bins at every iteration
+def reference_accumulated_highest_n_freq(
+    signal, num_of_freqs=15, max_addition=10, max_iteration=1000
+):
+    xf = np.linspace(0.0, len(signal), len(signal))
+    [amp, phs, freq] = reference_highest_n_freq(np.fft.fft(signal), 1)[0]
+    frequencies = [[amp, phs, freq]]
+    freq_counter = {freq: 1}
+    exit_counter = 0
+    while len(frequencies) < num_of_freqs:
+        freqs = reference_highest_n_freq(np.fft.fft(signal), 2)
+        [amp, phs, freq] = freqs[1]
+        if freq == 0:
+            [amp, phs, freq] = freqs[0]
+        signal -= amp * np.cos((freq * 2.0 * np.pi * xf) + phs)
+        if freq not in [frequency[2] for frequency in frequencies]:
+            frequencies.append([amp, phs, freq])
+            freq_counter[freq] = 1
+        else:
+            for frequency in frequencies:
+                if frequency[2] == freq and freq_counter[freq] < max_addition:
+                    frequency[0] += amp
+                    frequency[1] = (
+                        (freq_counter[freq] * frequency[1]) + phs
+                    ) / (freq_counter[freq] + 1)
+                    freq_counter[freq] += 1
+        exit_counter += 1
+        if exit_counter >= max_iteration:
+            break
+    return frequencies, signal
+
+
+def reference_highest_n_freq(freqs, n=15):
+    N = len(freqs)
+    freqs = freqs[0:N//2]
+    return sorted(
+        zip(np.abs(freqs) / float(N), np.angle(freqs), range(len(freqs))),
+        reverse=True
+    )[:n]
+
+
+# the mean rates over a day of the ground truth activity of each region of
+# the University of Birmingham dataset, with @increment second slots
+def birmingham_signals(increment):
+    path = os.path.join("/".join(source_path.split("/")[:-1]), "data")
+    dataset = get_dataset(path)
+    db = tempfile.mkdtemp()
+    signals = list()
+    try:
+        processes = dict()
+        for region, timestamps, counts in dataset.stream_counts(
+            [("present_activity", 1), ("absent_activity", 0)], None, None
+        ):
+            if region not in processes:
+                processes[region] = PeriodicPoissonProcess(
+                    increment, 86400, path_to_db=db
+                )
+            processes[region].update_batch(timestamps, counts)
+        for region in sorted(processes):
+            _, rates = processes[region].retrieve_full_periodic_array("mean")
+            signals.append(rates)
+    finally:
+        shutil.rmtree(db)
+    return signals
+
+
+# The l-AAM engine updating the spectrum analytically gives the frequencies,
+# amplitudes, phases and residues of the l-AAM with an FFT per iteration
+class AccumulatedFrequencyTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.signals = birmingham_signals(60) + birmingham_signals(300)
+
+    # the residues are only compared if the reference found all
+    # @num_of_freqs frequencies. Otherwise it ran for max_iteration
+    # iterations, in which the residue grows without bounds (to ~1e8 for a
+    # region with 300 second slots) and any rounding difference, even
+    # between two FFT implementations, is amplified.
+    def _assert_same(
+        self, frequencies, residue, expected, expected_residue, num_of_freqs
+    ):
+        self.assertEqual(
+            [frequency[2] for frequency in frequencies],
+            [frequency[2] for frequency in expected]
+        )
+        np.testing.assert_allclose(
+            np.array(frequencies, dtype=float),
+            np.array(expected, dtype=float), rtol=1e-7, atol=1e-9
+        )
+        if len(expected) == num_of_freqs:
+            np.testing.assert_allclose(
+                residue, expected_residue, rtol=1e-7, atol=1e-9
+            )
+
+    def test_birmingham_regions(self):
+        for signal in self.signals:
+            for num_of_freqs in [15, 30]:
+                expected, expected_residue = reference_accumulated_highest_n_freq(
+                    signal.copy(), num_of_freqs
+                )
+                frequencies, residue = get_accumulated_highest_n_freq(
+                    signal.copy(), num_of_freqs
+                )
+                self._assert_same(
+                    frequencies, residue, expected, expected_residue,
+                    num_of_freqs
+                )
+
+    def test_batch(self):
+        signals = np.array([
+            signal for signal in self.signals if len(signal) == 1440
+        ])
+        frequencies, residues = get_accumulated_highest_n_freq_batch(
+            signals.copy(), 30
+        )
+        for signal, row, residue in zip(signals, frequencies, residues):
+            expected, expected_residue = reference_accumulated_highest_n_freq(
+                signal.copy(), 30
+            )
+            self._assert_same(row, residue, expected, expected_residue, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
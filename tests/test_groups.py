@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PeriodicPoissonProcess, RegionGroups
+
+
+# The sums of a group are the sums of the rates of its members, whose pivot
+# times are not aligned with the increment nor with each other
+class RegionGroupsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        np.random.seed(0)
+        self.processes = dict()
+        for ind in range(4):
+            process = PeriodicPoissonProcess(
+                60, 3600, path_to_db=os.path.join(self.path, str(ind))
+            )
+            timestamps = 1000000 + (17 * ind) + np.random.randint(0, 20000, 2000)
+            # the pivot time of the process is its first timestamp
+            timestamps[0] = 1000000 + (17 * ind)
+            process.update_batch(timestamps, np.random.poisson(1, 2000))
+            self.processes[str(ind)] = process
+        self.groups = RegionGroups(
+            self.processes, {"floor": ["0", "1", "2", "3"], "zone": ["1", "3"]}
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _assert_sums(self, group):
+        members = [self.processes[region] for region in self.groups.groups[group]]
+        timestamps = np.random.randint(990000, 1010000, 5000)
+        # every second around the pivot times of the members
+        timestamps[0:240] = 1000000 - 60 + np.arange(240)
+        alpha = [process.get_rates_at(timestamps, "alpha") for process in members]
+        beta = [process.get_rates_at(timestamps, "beta") for process in members]
+        np.testing.assert_allclose(
+            self.groups.get_rates_at(group, timestamps, "mean"),
+            np.sum(np.divide(alpha, beta), axis=0)
+        )
+        np.testing.assert_allclose(
+            self.groups.get_rates_at(group, timestamps, "variance"),
+            np.sum(np.divide(alpha, np.square(beta)), axis=0)
+        )
+        np.testing.assert_allclose(
+            self.groups.get_rates_at(group, timestamps, "any"),
+            1.0 - np.prod(np.power(np.divide(beta, np.add(beta, 1.0)), alpha), axis=0)
+        )
+        # intervals of whole increments, from a part of a cycle to many cycles
+        start_times = 60 * np.random.randint(990000 // 60, 1010000 // 60, 500)
+        end_times = start_times + 60 * np.random.randint(0, 300, 500)
+        expected = np.sum([
+            process.lookup_table().intervals().rate_sums(start_times, end_times)
+            for process in members
+        ], axis=0)
+        np.testing.assert_allclose(
+            self.groups._interval_table(group).rate_sums(start_times, end_times),
+            expected
+        )
+        np.testing.assert_allclose(
+            self.groups.expected_counts(group, start_times, end_times),
+            expected[0]
+        )
+
+    def test_sums(self):
+        for group in ["floor", "zone"]:
+            self._assert_sums(group)
+
+    def test_updates(self):
+        self._assert_sums("zone")
+        # an update of the slot holding the pivot time, before and after it
+        self.processes["1"].update_batch([1000010, 1000030, 1003650], [5, 7, 2])
+        self.processes["3"].update_batch(
+            1000000 + np.random.randint(0, 3600, 100), np.random.poisson(4, 100)
+        )
+        self._assert_sums("zone")
+        self._assert_sums("floor")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PeriodicPoissonProcess
+
+
+# The expected counts of a process over any interval are the rates of the
+# seconds of the interval summed one by one
+class IntervalTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    # mean and variance of the total rate from @start_time to @end_time,
+    # summing the share (1 / increment) of the rate of each second
+    def _brute_force(self, table, start_time, end_time):
+        seconds = np.arange(start_time, end_time)
+        if len(seconds) == 0:
+            return 0.0, 0.0
+        alpha = table.get(seconds, "alpha")
+        beta = table.get(seconds, "beta")
+        # the seconds of a slot, over all cycles, share the same rate
+        _, first, covers = np.unique(
+            table.indices(seconds), return_index=True, return_counts=True
+        )
+        covers = covers / float(table.increment)
+        return (
+            np.sum(alpha / beta) / float(table.increment),
+            np.sum(np.square(covers) * alpha[first] / np.square(beta[first]))
+        )
+
+    def _assert_intervals(self, pivot_time):
+        np.random.seed(0)
+        process = PeriodicPoissonProcess(60, 3600, path_to_db=self.path)
+        timestamps = pivot_time + np.random.randint(0, 20000, 1000)
+        timestamps[0] = pivot_time
+        process.update_batch(timestamps, np.random.poisson(2, 1000))
+        table = process.lookup_table()
+        start_times = pivot_time + np.random.randint(-5000, 5000, 200)
+        # within a slot, across the pivot time, and over many cycles
+        lengths = np.concatenate((
+            np.random.randint(0, 60, 50), np.random.randint(0, 3600, 100),
+            np.random.randint(3600, 4 * 3600, 50)
+        ))
+        end_times = start_times + lengths
+        start_times[0:3] = [pivot_time - 5, pivot_time - 30, pivot_time + 3590]
+        end_times[0:3] = [pivot_time + 5, pivot_time + 3600, pivot_time + 3620]
+        expected = np.array([
+            self._brute_force(table, start_time, end_time)
+            for start_time, end_time in zip(start_times, end_times)
+        ])
+        mean, variance = table.intervals().rate_sums(start_times, end_times)
+        np.testing.assert_allclose(mean, expected[:, 0])
+        np.testing.assert_allclose(variance, expected[:, 1])
+        np.testing.assert_allclose(
+            process.expected_counts(start_times, end_times), expected[:, 0]
+        )
+        np.testing.assert_allclose(
+            process.count_distribution(start_times, end_times).mean(),
+            expected[:, 0]
+        )
+
+    def test_aligned_pivot(self):
+        self._assert_intervals(1000020)
+
+    def test_unaligned_pivot(self):
+        self._assert_intervals(1000017)
+
+    def test_negative_interval(self):
+        process = PeriodicPoissonProcess(60, 3600, path_to_db=self.path)
+        process.update_batch([1000020], [1])
+        self.assertRaises(ValueError, process.expected_counts, 1000, 900)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PeriodicPoissonProcess
+from spectral_popp.process.rate import gamma_filtered_posterior
+
+
+# the filtered posterior of a single increment, moment matching the mixture
+# of no event and one event (see gamma_filtered_posterior) term by term
+def reference_filtered_posterior(alpha, beta, detection, tpr, fpr):
+    beta = beta + 1.0
+    one = (tpr if detection else 1.0 - tpr) * alpha / beta
+    none = fpr if detection else 1.0 - fpr
+    one, none = one / (one + none), none / (one + none)
+    mean = (none * alpha / beta) + (one * (alpha + 1.0) / beta)
+    square = (
+        (none * alpha * (alpha + 1.0)) + (one * (alpha + 1.0) * (alpha + 2.0))
+    ) / (beta * beta)
+    variance = square - (mean * mean)
+    return mean * mean / variance, mean / variance
+
+
+# Noisy detections update the rates of a process with the filtered
+# posterior of each increment, one detection after another
+class PartiallyObservedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        np.random.seed(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_filtered_posterior(self):
+        alpha = np.random.uniform(0.5, 20.0, 200)
+        beta = np.random.uniform(0.5, 20.0, 200)
+        detections = np.random.randint(0, 2, 200)
+        tpr = np.random.uniform(0.5, 1.0, 200)
+        fpr = np.random.uniform(0.0, 0.5, 200)
+        expected = np.array([
+            reference_filtered_posterior(*values)
+            for values in zip(alpha, beta, detections, tpr, fpr)
+        ])
+        posterior = gamma_filtered_posterior(alpha, beta, detections, tpr, fpr)
+        np.testing.assert_allclose(posterior[0], expected[:, 0])
+        np.testing.assert_allclose(posterior[1], expected[:, 1])
+
+    def test_perfect_detector(self):
+        timestamps = 1000000 + np.random.randint(0, 3 * 3600, 1000)
+        detections = np.random.randint(0, 2, 1000)
+        observed = PeriodicPoissonProcess(
+            60, 3600, path_to_db=os.path.join(self.path, "observed")
+        )
+        observed.update_batch(timestamps, detections)
+        detected = PeriodicPoissonProcess(
+            60, 3600, path_to_db=os.path.join(self.path, "detected")
+        )
+        detected.update_batch(timestamps[0:1], detections[0:1])
+        detected.update_partially_observed(timestamps[1:], detections[1:], 1.0, 0.0)
+        start_times = 1000000 + np.arange(0, 3600, 60)
+        for statistic in ["alpha", "beta"]:
+            np.testing.assert_allclose(
+                detected.get_rates_at(start_times, statistic),
+                observed.get_rates_at(start_times, statistic)
+            )
+
+    def test_sequential(self):
+        # many detections per increment, with an unaligned pivot time
+        timestamps = 1000017 + np.random.randint(0, 3 * 3600, 2000)
+        detections = np.random.randint(0, 2, 2000)
+        tpr = np.random.uniform(0.6, 0.9, 2000)
+        fpr = np.random.uniform(0.05, 0.3, 2000)
+        observed = np.random.rand(2000) < 0.7
+        process = PeriodicPoissonProcess(60, 3600, path_to_db=self.path)
+        process.update_batch([1000017], [0])
+        table = process.lookup_table()
+        # a second of each slot of the cycle, the slot holding an unaligned
+        # pivot time has two rates
+        seconds = 1000017 + np.arange(3600)
+        slots, first = np.unique(table.indices(seconds), return_index=True)
+        seconds = seconds[first]
+        rates = dict(zip(slots.tolist(), zip(
+            table.get(seconds, "alpha").tolist(), table.get(seconds, "beta").tolist()
+        )))
+        for ind in np.where(observed)[0]:
+            slot = int(table.indices(timestamps[ind]))
+            rates[slot] = reference_filtered_posterior(
+                rates[slot][0], rates[slot][1], detections[ind], tpr[ind], fpr[ind]
+            )
+        process.update_partially_observed(
+            timestamps, detections, tpr, fpr, observed
+        )
+        table = process.lookup_table()
+        np.testing.assert_allclose(
+            table.get(seconds, "alpha"), [rates[slot][0] for slot in slots]
+        )
+        np.testing.assert_allclose(
+            table.get(seconds, "beta"), [rates[slot][1] for slot in slots]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
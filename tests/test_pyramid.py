@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PeriodicPoissonProcess
+from spectral_popp.process.pyramid import RatePyramid
+
+
+# The pyramid of the rates of a process answers interval queries as the
+# interval table of the process does, and follows the updates of the
+# process as a pyramid built from scratch would
+class RatePyramidTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        np.random.seed(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _process(self, pivot_time, periodic_cycle, levels=None):
+        process = PeriodicPoissonProcess(60, periodic_cycle, path_to_db=self.path)
+        process.pyramid_levels = levels
+        timestamps = 1000000 + np.random.randint(0, 200000, 3000)
+        timestamps[0] = pivot_time
+        process.update_batch(timestamps, np.random.poisson(3, 3000))
+        return process
+
+    # @aligned is whether the intervals start and end at the start of an
+    # increment. An interval ending inside of the slot holding an unaligned
+    # pivot time gets the share of the average rate of the slot in the
+    # pyramid, and of either rate of the slot in the interval table.
+    def _assert_intervals(self, process, aligned=False):
+        start_times = 1000000 + np.random.randint(-10**5, 10**5, 1000)
+        end_times = start_times + np.random.randint(
+            0, 3 * process.periodic_cycle, 1000
+        )
+        if aligned:
+            start_times = (start_times // 60) * 60
+            end_times = (end_times // 60) * 60
+        expected = process.lookup_table().intervals().rate_sums(
+            start_times, end_times
+        )
+        sums = process.rate_pyramid().rate_sums(start_times, end_times)
+        np.testing.assert_allclose(sums[0], expected[0])
+        np.testing.assert_allclose(sums[1], expected[1])
+
+    def test_aligned_pivot(self):
+        for periodic_cycle, levels in [
+            (3600, None), (86400, None), (86400, [3600, 8 * 3600])
+        ]:
+            self._assert_intervals(
+                self._process(1000020, periodic_cycle, levels)
+            )
+
+    def test_unaligned_pivot(self):
+        for periodic_cycle in [7200, 86400]:
+            self._assert_intervals(
+                self._process(1000037, periodic_cycle), aligned=True
+            )
+
+    def test_clock_blocks(self):
+        process = self._process(1000037, 86400)
+        pyramid = process.rate_pyramid()
+        for resolution in [3600, 8 * 3600]:
+            start_times, sums = pyramid.blocks_at(resolution)
+            # the blocks start at midnight, whatever the pivot time is
+            self.assertTrue(np.all(start_times % resolution == 0))
+            np.testing.assert_allclose(
+                sums, process.expected_counts(start_times, start_times + resolution)
+            )
+        self.assertRaises(ValueError, pyramid.blocks_at, 120)
+
+    def test_updates(self):
+        for pivot_time in [1000020, 1000037]:
+            process = self._process(pivot_time, 86400)
+            pyramid = process.rate_pyramid()
+            for _ in range(3):
+                timestamps = 1000000 + np.random.randint(0, 200000, 50)
+                # including the slot holding the pivot time
+                timestamps[0] = pivot_time + 86400 - 10
+                process.update_batch(timestamps, np.random.poisson(3, 50))
+            self.assertTrue(process.rate_pyramid() is pyramid)
+            fresh = RatePyramid(
+                process._table_store(), process._pivot_time, 60, 86400
+            )
+            for level in range(len(fresh.blocks)):
+                for column in ["mean", "variance"]:
+                    np.testing.assert_allclose(
+                        pyramid._sums[column][level], fresh._sums[column][level]
+                    )
+            fresh.detach()
+            self._assert_intervals(process, aligned=True)
+
+    def test_levels(self):
+        process = self._process(1000020, 3600, [120, 300])
+        self.assertRaises(ValueError, process.rate_pyramid)
+        process = PeriodicPoissonProcess(60, 3630, path_to_db=self.path)
+        self.assertRaises(ValueError, process.rate_pyramid)
+
+
+if __name__ == "__main__":
+    unittest.main()
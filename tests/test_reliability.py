@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from scipy.stats import beta as beta_distribution
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp.process.reliability import DetectorReliability
+
+
+# The sensitivity and the specificity of a detector are the Beta posteriors
+# given the labelled detections of each region and bin counted one by one
+class DetectorReliabilityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        np.random.seed(0)
+        self.regions = np.random.choice(["1", "2", "3"], 3000)
+        self.timestamps = 1000000 + np.random.randint(0, 5 * 86400, 3000)
+        self.labels = np.random.randint(0, 2, 3000)
+        self.detections = np.where(
+            self.labels > 0, np.random.rand(3000) < 0.8,
+            np.random.rand(3000) < 0.1
+        ).astype(int)
+        self.reliability = DetectorReliability(
+            86400, 3600, pivot_time=1000000, alpha=2.0, beta=3.0
+        )
+        self.reliability.update(
+            self.regions[0:1000], self.timestamps[0:1000],
+            self.labels[0:1000], self.detections[0:1000]
+        )
+        # the detections of a single region
+        for region in ["1", "2", "3"]:
+            indices = np.where(self.regions[1000:] == region)[0] + 1000
+            self.reliability.update(
+                region, self.timestamps[indices], self.labels[indices],
+                self.detections[indices]
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    # the confusion matrix of @region at @timestamp counted one by one
+    def _counts(self, region, timestamp):
+        counts = np.zeros((2, 2))
+        bins = ((self.timestamps - 1000000) % 86400) // 3600
+        for ind in range(len(self.timestamps)):
+            if self.regions[ind] == region and bins[ind] == ((timestamp - 1000000) % 86400) // 3600:
+                counts[self.labels[ind], self.detections[ind]] += 1
+        return counts
+
+    def test_estimates(self):
+        timestamps = 1000000 + np.random.randint(0, 86400, 20)
+        for region in ["1", "3"]:
+            row = self.reliability.regions.index(region)
+            tpr, fpr = self.reliability.rates(region, timestamps)
+            for ind, timestamp in enumerate(timestamps):
+                counts = self._counts(region, timestamp)
+                sensitivity = beta_distribution(2.0 + counts[1, 1], 3.0 + counts[1, 0])
+                specificity = beta_distribution(2.0 + counts[0, 0], 3.0 + counts[0, 1])
+                slot = self.reliability.bins(timestamp)
+                self.assertAlmostEqual(tpr[ind], sensitivity.mean())
+                self.assertAlmostEqual(fpr[ind], 1.0 - specificity.mean())
+                self.assertAlmostEqual(
+                    self.reliability.sensitivity("upper")[row, slot],
+                    sensitivity.ppf(0.95)
+                )
+                self.assertAlmostEqual(
+                    self.reliability.specificity("lower")[row, slot],
+                    specificity.ppf(0.05)
+                )
+                a, b = sensitivity.args
+                self.assertAlmostEqual(
+                    self.reliability.sensitivity("mode")[row, slot],
+                    (a - 1.0) / (a + b - 2.0)
+                )
+        # a region without labelled data gets the prior means
+        tpr, fpr = self.reliability.rates("4", timestamps)
+        np.testing.assert_allclose(tpr, 0.4)
+        np.testing.assert_allclose(fpr, 0.6)
+        self.assertRaises(ValueError, self.reliability.sensitivity, "median")
+
+    def test_save(self):
+        path = os.path.join(self.path, "reliability.npz")
+        self.reliability.save(path)
+        restored = DetectorReliability(86400, 3600)
+        self.assertTrue(restored.load(path))
+        self.assertEqual(restored.regions, self.reliability.regions)
+        self.assertEqual(restored.pivot_time, 1000000)
+        np.testing.assert_array_equal(
+            restored.sensitivity(), self.reliability.sensitivity()
+        )
+        np.testing.assert_array_equal(
+            restored.specificity("upper"), self.reliability.specificity("upper")
+        )
+        self.assertFalse(restored.load(os.path.join(self.path, "other.npz")))
+        self.assertRaises(ValueError, DetectorReliability(86400, 1800).load, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
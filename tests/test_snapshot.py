@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PeriodicPoissonProcess, SpectralPoissonProcess
+from spectral_popp import PoissonSnapshot, compile_snapshot
+
+
+# A snapshot answers the queries of the process it was compiled from
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _assert_same(self, cls, pivot_time):
+        np.random.seed(1)
+        process = cls(60, 3600, path_to_db=self.path)
+        timestamps = pivot_time + np.random.randint(-3600, 5 * 3600, 2000)
+        timestamps[0] = pivot_time
+        process.update_batch(timestamps, np.random.poisson(2, len(timestamps)))
+        path = os.path.join(self.path, "snapshot.bin")
+        compile_snapshot(process, path)
+        snapshot = PoissonSnapshot(path)
+        start_time = pivot_time - 7200
+        for statistic in ["mode", "mean", "lower", "upper"]:
+            start_times, expected = process.retrieve_array(
+                start_time, start_time + 3 * 3600, statistic
+            )
+            _, rates = snapshot.retrieve_array(
+                start_time, start_time + 3 * 3600, statistic
+            )
+            np.testing.assert_allclose(rates, expected)
+            np.testing.assert_allclose(
+                snapshot.get_rates_at(start_times, statistic), expected
+            )
+            for timestamp in [pivot_time, pivot_time - 1, pivot_time + 3599]:
+                self.assertAlmostEqual(
+                    snapshot.get_rates_at(timestamp, statistic),
+                    process.get_rates_at(timestamp, statistic)
+                )
+
+    def test_aligned_pivot(self):
+        for cls in [PeriodicPoissonProcess, SpectralPoissonProcess]:
+            self._assert_same(cls, 1020)
+
+    def test_unaligned_pivot(self):
+        for cls in [PeriodicPoissonProcess, SpectralPoissonProcess]:
+            self._assert_same(cls, 1017)
+
+    # compiling a snapshot of an empty process does not set its pivot time
+    def test_empty_process(self):
+        process = PeriodicPoissonProcess(60, 3600, path_to_db=self.path)
+        path = os.path.join(self.path, "snapshot.bin")
+        compile_snapshot(process, path)
+        self.assertIsNone(process._pivot_time)
+        self.assertAlmostEqual(
+            PoissonSnapshot(path).get_rates_at(100, "mean"),
+            process.get_rates_at(100, "mean")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import SpectralPoissonProcess
+
+
+# Incremental refits of the spectral model read the same rate function as
+# a full Fourier transformation
+class IncrementalRefitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _assert_signal(self, pivot_time):
+        np.random.seed(0)
+        process = SpectralPoissonProcess(
+            60, 86400, path_to_db=self.path, incremental=True
+        )
+        process.staleness_threshold = 1000
+        process.drift_threshold = float("inf")
+        process.update_batch([pivot_time], [1])
+        timestamps = pivot_time + np.random.randint(-120, 3 * 86400, 300)
+        # updates in the minute of the pivot time, before and after it
+        timestamps[0:4] = [
+            pivot_time, pivot_time - 10, pivot_time + 30,
+            pivot_time + 86400 - 5
+        ]
+        for timestamp in timestamps:
+            process.update_batch([timestamp], [np.random.poisson(1)])
+        signal = np.copy(process._signal)
+        np.testing.assert_allclose(signal, process._transform_signal())
+
+    def test_aligned_pivot(self):
+        self._assert_signal(1502668800)
+
+    def test_unaligned_pivot(self):
+        self._assert_signal(1502668817)
+
+
+if __name__ == "__main__":
+    unittest.main()
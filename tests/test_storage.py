@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+source_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(
+    "/".join(source_path.split("/")[:-1]), "src"
+))
+
+from spectral_popp import PoissonProcess, PeriodicPoissonProcess
+
+
+# Round trips of the processes through the db (rates file and change log)
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _process(self, cls=PoissonProcess):
+        if cls is PoissonProcess:
+            return cls(60, path_to_db=self.path)
+        return cls(60, 3600, path_to_db=self.path)
+
+    def _assert_same(self, process, other, start_times):
+        for statistic in ["alpha", "beta"]:
+            np.testing.assert_allclose(
+                process.get_rates_at(start_times, statistic),
+                other.get_rates_at(start_times, statistic)
+            )
+
+    # the changes appended to the log are read back
+    def test_store_changes(self):
+        process = self._process()
+        process.update_batch(np.arange(0, 3600, 60), np.arange(60) % 3)
+        process.store_to_db()
+        process.update_batch([120, 600, 3600], [4, 1, 2])
+        process.store_to_db()
+        loaded = self._process()
+        self.assertTrue(loaded.retrieve_from_db())
+        self._assert_same(process, loaded, np.arange(0, 3660, 60))
+
+    # rates updated before retrieving the db are stored with the stored ones
+    def test_update_retrieve_store(self):
+        for cls in [PoissonProcess, PeriodicPoissonProcess]:
+            stored = self._process(cls)
+            stored.update_batch(np.arange(0, 1800, 60), np.ones(30))
+            stored.store_to_db()
+            process = self._process(cls)
+            process.update_batch([1800, 2400], [5, 3])
+            self.assertTrue(process.retrieve_from_db())
+            process.update_batch([60], [2])
+            process.store_to_db()
+            loaded = self._process(cls)
+            self.assertTrue(loaded.retrieve_from_db())
+            self._assert_same(process, loaded, np.arange(0, 3600, 60))
+            self.assertTrue(loaded.get_rate_at(1800).alpha > 5)
+            shutil.rmtree(self.path)
+            os.makedirs(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()